@@ -0,0 +1,103 @@
+"""Run the whole benchmark suite and print (or save) the results as JSON.
+
+    python -m benchmarks                        # everything, to stdout
+    python -m benchmarks -o results.json        # save for later
+    python -m benchmarks --compare base.json    # and flag anything that got slower than base.json
+
+Every result has a stable `name`, a `value`, its `unit`, and whether higher is better, so two
+runs (say, on two commits) can be lined up by name. With `--compare`, the exit status is 1 if
+anything regressed by more than `--threshold`.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks import assembler, interpreter, startup, tracing, views
+
+SUITES = {
+    "interpreter": interpreter.run,
+    "assembler": assembler.run,
+    "views": views.run,
+    "startup": startup.run,
+    "tracing": tracing.run,
+}
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True, check = True,
+                             cwd = Path(__file__).parent)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def run(suites: list[str]) -> dict:
+    results = []
+    for name in suites:
+        print(f"Running {name}...", file = sys.stderr)
+        results.extend(SUITES[name]())
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+
+
+def compare(base: dict, new: dict, threshold: float) -> tuple[str, bool]:
+    """A table of every result in both runs, and whether any got worse by more than `threshold`."""
+    old = {r["name"]: r for r in base["results"]}
+    lines = [f"{'NAME':<36}  {'BASE':>14}  {'NEW':>14}  CHANGE"]
+    regressed = False
+    for r in new["results"]:
+        if r["name"] not in old:
+            continue
+        before, after = old[r["name"]]["value"], r["value"]
+        if not before or not after:
+            continue
+        # Positive is better, either way round.
+        change = after / before - 1 if r["higher_is_better"] else before / after - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        lines.append(f"{r['name']:<36}  {before:>14.6g}  {after:>14.6g}  {change:+7.1%}{flag}")
+    return "\n".join(lines), regressed
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog = "python -m benchmarks", description = "Run the DigiCPU benchmarks.")
+    parser.add_argument("suites", nargs = "*", metavar = "SUITE",
+                        help = f"which suites to run: {', '.join(SUITES)} (default: all of them)")
+    parser.add_argument("-o", "--output", help = "write the results to this file instead of stdout")
+    parser.add_argument("--compare", metavar = "BASE", help = "compare against results saved from another run")
+    parser.add_argument("--threshold", type = float, default = 0.1, help = "how much worse counts as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+    for suite in args.suites:
+        if suite not in SUITES:
+            parser.error(f"unknown suite {suite!r} (choose from {', '.join(SUITES)})")
+
+    results = run(args.suites or list(SUITES))
+    text = json.dumps(results, indent = 2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        table, regressed = compare(json.loads(Path(args.compare).read_text()), results, args.threshold)
+        print(table, file = sys.stderr)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
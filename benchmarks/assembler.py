@@ -0,0 +1,101 @@
+"""Assembler throughput, in source lines per second, on a large generated corpus.
+
+A single program can only be 256 bytes, so "large" means a lot of programs: each one is a mix of
+instructions, labels (forward and backward), constants, comments and blank lines, sized to just
+fit in ROM. Both a cold assemble and a hit in the on-disk assembly cache are measured.
+
+    python -m benchmarks.assembler
+"""
+
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from digicpu.core.assembler import assemble_program
+from digicpu.core.cache import assemble_cached
+from digicpu.core.opcode import OPCODES
+from digicpu.lib.types import ROM_SIZE
+
+PROGRAMS = 200
+REPEAT = 3
+
+REGISTERS = ["GP0", "GP1", "GP2", "GP3", "GP4", "GP5", "GP6", "GP7", "0", "1", "2", "3"]
+THREE_OPERAND = ["ADD", "SUB", "MUL", "AND", "OR", "XOR", "MIN", "MAX"]
+CONDITIONALS = ["EQ", "NEQ", "LT", "GT", "LTE", "GTE"]
+
+
+def generate(seed: int) -> str:
+    """A random program that assembles to just under a full ROM."""
+    rng = random.Random(seed)
+    lines = ["# Generated benchmark program", "CONST LIMIT 0x10", "CONST TARGET GP7", ""]
+    size = 0
+    label = 0
+    while size < ROM_SIZE - 8:
+        r = rng.random()
+        if r < 0.1:
+            lines.append(f"LABEL L{label}:")
+            label += 1
+        elif r < 0.15:
+            lines.append(f"# comment {rng.randrange(1000)}")
+        elif r < 0.2:
+            lines.append("")
+        elif r < 0.45:
+            lines.append(f"IMM {rng.choice(['LIMIT', '0b1010', '0x3F', str(rng.randrange(256))])} {rng.choice(REGISTERS)}")
+            size += 3
+        elif r < 0.7:
+            a, b, c = (rng.choice(REGISTERS) for _ in range(3))
+            lines.append(f"{rng.choice(THREE_OPERAND)} {a} {b} {c}    # {a} op {b}")
+            size += 4
+        elif r < 0.8:
+            lines.append(f"INC {rng.choice(REGISTERS)}; DEC {rng.choice(REGISTERS)}")
+            size += 4
+        else:
+            # Jump somewhere, possibly to a label that isn't defined yet.
+            target = f"L{rng.randrange(label + 2)}"
+            lines.append(f"{rng.choice(CONDITIONALS)} {rng.choice(REGISTERS)} TARGET {target}")
+            size += 4
+    # Make sure every forward reference resolves.
+    for n in range(label, label + 2):
+        lines.append(f"LABEL L{n}")
+    lines.append("HLT")
+    return "\n".join(lines) + "\n"
+
+
+def _best(f, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(programs: int = PROGRAMS, repeat: int = REPEAT) -> list[dict]:
+    opcodes = OPCODES
+    corpus = [generate(n) for n in range(programs)]
+    lines = sum(s.count("\n") for s in corpus)
+
+    cold = _best(lambda: [assemble_program(source, opcodes) for source in corpus], repeat)
+    with tempfile.TemporaryDirectory() as d:
+        for source in corpus:
+            assemble_cached(source, opcodes, Path(d))
+        cached = _best(lambda: [assemble_cached(source, opcodes, Path(d)) for source in corpus], repeat)
+
+    return [{
+        "name": f"assembler/generated/{mode}",
+        "value": lines / seconds,
+        "unit": "lines/s",
+        "higher_is_better": True,
+        "programs": programs,
+        "lines": lines,
+    } for mode, seconds in (("cold", cold), ("cached", cached))]
+
+
+def main():
+    print(json.dumps({"benchmark": "assembler", "results": run()}, indent = 2))
+
+
+if __name__ == "__main__":
+    main()
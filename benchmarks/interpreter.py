@@ -0,0 +1,111 @@
+"""Instructions per second of `CPU.step` (and of the block translator) on the bundled programs and
+a few synthetic ones that lean on one part of the machine each.
+
+    python -m benchmarks.interpreter
+"""
+
+import json
+import time
+from importlib import resources
+
+import digicpu.data.programs
+from digicpu.core import translator
+from digicpu.core.cpu import CPU
+
+STEPS = 100_000
+REPEAT = 3
+
+ALU_HEAVY = """
+IMM 3 GP1
+IMM 5 GP3
+LABEL LOOP
+ADD GP0 GP1 GP2
+MUL GP2 GP3 GP4
+XOR GP4 GP0 GP5
+SHL GP5 GP1 GP6
+SUB GP6 GP3 GP7
+AND GP7 GP5 GP2
+MAX GP2 GP4 GP4
+INC GP0
+JMP LOOP
+"""
+
+BRANCH_HEAVY = """
+IMM 3 GP1
+LABEL LOOP
+INC GP0
+LT GP0 GP1 SKIP
+IMM 0 GP0
+LABEL SKIP
+EQ GP0 GP2 LOOP
+GTE GP0 GP1 LOOP
+CLF
+JNZ LOOP
+JMP LOOP
+"""
+
+RAM_HEAVY = """
+LABEL LOOP
+INC GP0
+CPY GP0 RAMA
+CPY GP1 RAMD
+INC GP1
+CPY GP1 RAMA
+CPY RAMD GP2
+CPY GP0 STAK
+CPY RAMD GP3
+JMP LOOP
+"""
+
+
+def programs() -> dict[str, str]:
+    bundled = resources.files(digicpu.data.programs)
+    return {
+        "circle": bundled.joinpath("circle.asm").read_text(),
+        "ramdom": bundled.joinpath("ramdom.asm").read_text(),
+        "alu": ALU_HEAVY,
+        "branch": BRANCH_HEAVY,
+        "ram": RAM_HEAVY,
+    }
+
+
+def measure(source: str, translate: bool = False, steps: int = STEPS, repeat: int = REPEAT) -> float:
+    """Best-of-`repeat` instructions per second over `steps` instructions."""
+    best = float("inf")
+    for _ in range(repeat):
+        cpu = CPU()
+        cpu.load_string(source, cache = False)
+        if translate:
+            start = time.perf_counter()
+            ran = translator.run(cpu, steps)
+            elapsed = time.perf_counter() - start
+        else:
+            step = cpu.step
+            start = time.perf_counter()
+            for _ in range(steps):
+                step()
+            elapsed = time.perf_counter() - start
+            ran = steps
+        best = min(best, elapsed / ran)
+    return 1 / best
+
+
+def run(steps: int = STEPS, repeat: int = REPEAT) -> list[dict]:
+    results = []
+    for name, source in programs().items():
+        for mode, translate in (("step", False), ("translated", True)):
+            results.append({
+                "name": f"interpreter/{name}/{mode}",
+                "value": measure(source, translate, steps, repeat),
+                "unit": "instructions/s",
+                "higher_is_better": True,
+            })
+    return results
+
+
+def main():
+    print(json.dumps({"benchmark": "interpreter", "results": run()}, indent = 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""How long `import digicpu` and friends take in a fresh interpreter, over and above Python's own
+startup.
+
+    python -m benchmarks.startup
+"""
+
+import json
+import subprocess
+import sys
+import time
+
+REPEAT = 5
+
+MODULES = {
+    "digicpu": "import digicpu",
+    "cpu": "import digicpu.core.cpu",
+    # What `digicpu run` needs, which shouldn't drag in arcade.
+    "headless": "import digicpu.cli, digicpu.headless",
+}
+
+
+def _best(code: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check = True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(repeat: int = REPEAT) -> list[dict]:
+    baseline = _best("pass", repeat)
+    results = []
+    for name, code in MODULES.items():
+        results.append({
+            "name": f"startup/{name}",
+            "value": max(_best(code, repeat) - baseline, 0.0),
+            "unit": "s",
+            "higher_is_better": False,
+        })
+    return results
+
+
+def main():
+    print(json.dumps({"benchmark": "startup", "results": run()}, indent = 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Shows that instruction tracing costs nothing unless it's turned on.
+
+With the "digicpu" logger at DEBUG (the worst case for the old always-log handlers), an
+untraced CPU must emit zero log records and run its handlers unwrapped, while a traced CPU
+emits one record per instruction.
+
+    python -m benchmarks.tracing
+"""
+
+import json
+import logging
+import time
+from importlib import resources
+
+import digicpu.data.programs
+from digicpu.core.cpu import CPU
+from digicpu.lib.log import logger
+
+STEPS = 100_000
+
+
+class CountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        # Force the message to be formatted, like a real handler would.
+        record.getMessage()
+        self.count += 1
+
+
+def measure(trace: bool, steps: int = STEPS) -> dict:
+    cpu = CPU(trace)
+    cpu.load_string(resources.files(digicpu.data.programs).joinpath("ramdom.asm").read_text())
+    handler = CountingHandler()
+    logger.addHandler(handler)
+    try:
+        start = time.perf_counter()
+        for _ in range(steps):
+            cpu.step()
+        elapsed = time.perf_counter() - start
+    finally:
+        logger.removeHandler(handler)
+    unwrapped = all(o.function is None or getattr(o.function, "__self__", None) is cpu for o in cpu.opcodes)
+    return {
+        "trace": trace,
+        "steps": steps,
+        "seconds": elapsed,
+        "steps_per_second": steps / elapsed,
+        "log_records": handler.count,
+        "handlers_unwrapped": unwrapped,
+    }
+
+
+def measure_both(steps: int = STEPS) -> tuple[dict, dict]:
+    old_level, old_propagate = logger.level, logger.propagate
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        untraced = measure(False, steps)
+        traced = measure(True, steps)
+    finally:
+        logger.setLevel(old_level)
+        logger.propagate = old_propagate
+
+    assert untraced["log_records"] == 0, "untraced CPU logged instructions"
+    assert untraced["handlers_unwrapped"], "untraced CPU has wrapped handlers"
+    assert traced["log_records"] == traced["steps"], "traced CPU didn't log every instruction"
+    return untraced, traced
+
+
+def run(steps: int = STEPS) -> list[dict]:
+    """The same measurements, as rows for the benchmark suite."""
+    return [{
+        "name": f"tracing/{'traced' if r['trace'] else 'untraced'}",
+        "value": r["steps_per_second"],
+        "unit": "instructions/s",
+        "higher_is_better": True,
+    } for r in measure_both(steps)]
+
+
+def main():
+    untraced, traced = measure_both()
+    print(json.dumps({"benchmark": "tracing", "results": [untraced, traced]}, indent = 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""The per-frame cost of getting the machine state ready to draw, without a window.
+
+This is the work behind `DigiCPUWindow.update_rom_text` and friends: capturing a `Frame` and
+formatting the registers and the RAM bytes that changed. For comparison, it also times
+rebuilding the whole RAM hex dump, which is what the window used to do every frame.
+
+    python -m benchmarks.views
+"""
+
+import json
+import time
+from importlib import resources
+
+import digicpu.data.programs
+from digicpu import headless
+from digicpu.core.cpu import CPU
+from digicpu.emulator import Emulator
+
+FRAMES = 2_000
+STEPS_PER_FRAME = (1, 100)
+
+
+def _cpu() -> CPU:
+    cpu = CPU()
+    cpu.load_string(resources.files(digicpu.data.programs).joinpath("ramdom.asm").read_text(), cache = False)
+    return cpu
+
+
+def incremental(steps_per_frame: int, frames: int = FRAMES) -> float:
+    """Seconds per frame to capture and format what changed."""
+    cpu = _cpu()
+    emulator = Emulator(cpu)
+    elapsed = 0.0
+    for _ in range(frames):
+        headless.run(cpu, steps_per_frame)
+        start = time.perf_counter()
+        frame = emulator.poll(0)
+        [f"{frame.ram[b]:02X}" for b in frame.dirty]
+        " ".join(f"{r:02X}" for r in frame.registers)
+        elapsed += time.perf_counter() - start
+    return elapsed / frames
+
+
+def full_dump(frames: int = FRAMES) -> float:
+    """Seconds per frame to rebuild the whole RAM dump, the way the window used to."""
+    cpu = _cpu()
+    elapsed = 0.0
+    for _ in range(frames):
+        headless.run(cpu, 1)
+        start = time.perf_counter()
+        ram = ""
+        for i, b in enumerate(cpu.ram.state):
+            ram += f"{b:02X}"
+            if i % 16 == 15:
+                ram += "\n"
+        ram.rstrip("\n")
+        " ".join(f"{r:02X}" for r in cpu.registers)
+        elapsed += time.perf_counter() - start
+    return elapsed / frames
+
+
+def run(frames: int = FRAMES) -> list[dict]:
+    results = [{
+        "name": f"views/incremental/{n}",
+        "value": incremental(n, frames),
+        "unit": "s/frame",
+        "higher_is_better": False,
+        "steps_per_frame": n,
+    } for n in STEPS_PER_FRAME]
+    results.append({
+        "name": "views/full_dump",
+        "value": full_dump(frames),
+        "unit": "s/frame",
+        "higher_is_better": False,
+    })
+    return results
+
+
+def main():
+    print(json.dumps({"benchmark": "views", "results": run()}, indent = 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
-from digicpu import window
+from digicpu import cli
 from digicpu.lib.log import setup
 
 setup()
 
 if __name__ == "__main__":
-    window.main()
+    cli.main()
@@ -0,0 +1,245 @@
+"""Static analysis of an assembled ROM, without running it.
+
+`analyze` finds the code that can run, following every jump and fall-through from address 0 (like
+`digicpu.core.disassembler.recursive_descent`, but into the middle of other instructions too), splits
+it into basic blocks and links them into a control-flow graph, then reports:
+- unreachable code: bytes that aren't zero and that no path from address 0 ever runs;
+- loops with no way out: blocks the program can get into but never leave by halting or running
+  off the end of ROM (a spin like `JMP LOOP`, or a loop whose only exits jump back into it);
+- faults: instructions that raise as soon as they run, whatever the state, because an operand is
+  a register that doesn't exist or an address outside ROM (or because the opcode doesn't exist).
+
+`JMR` jumps to an address in a register, which can't be known here. Its block counts as a way
+out, so a loop through one is never reported, but anything only reached through one is reported
+as unreachable; `Analysis.indirect` lists them so you can tell.
+"""
+
+from typing import NamedTuple
+
+from digicpu.core.disassembler import Line, decode
+from digicpu.core.opcode import BY_VALUE, Operand
+from digicpu.lib.errors import (RegisterOverflowError, ROMOutOfBoundsError,
+                                UnknownOpcodeError)
+from digicpu.lib.types import MAX_INSTRUCTION_WIDTH, MAX_REG, ROM_SIZE
+
+
+class Fault(NamedTuple):
+    address: int
+    error: type[ValueError]
+    # The operand (or opcode) that causes it.
+    value: int
+
+    def __str__(self) -> str:
+        error = UnknownOpcodeError(self.value, self.address) if self.error is UnknownOpcodeError else self.error(self.value)
+        return f"{self.address:02X}: {error}"
+
+
+class Block:
+    """A run of instructions that's always run from the first to the last."""
+    __slots__ = ("start", "lines", "successors", "exits")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.lines: list[Line] = []
+        # The starts of the blocks that can run next.
+        self.successors: list[int] = []
+        # Whether the program can stop (or go somewhere unknown) at the end of this block.
+        self.exits = False
+
+    @property
+    def end(self) -> int:
+        last = self.lines[-1]
+        return last.address + last.size
+
+
+class Analysis(NamedTuple):
+    # Block start -> block, for every block that can run.
+    blocks: dict[int, Block]
+    # (start, end) spans of unreachable code.
+    unreachable: list[tuple[int, int]]
+    # The blocks of each loop with no way out, by their starts.
+    loops: list[tuple[int, ...]]
+    faults: list[Fault]
+    # Addresses of `JMR`s that can run.
+    indirect: list[int]
+
+
+def _fault(line: Line) -> Fault | None:
+    """The error `line` raises when it runs, if it always does."""
+    opcode = line.opcode
+    assert opcode is not None
+    for kind, value in zip(opcode.operands, line.operands):
+        if kind in (Operand.REGISTER, Operand.DESTINATION):
+            # (The logic opcodes don't check their destination, so those raise IndexError instead, but they still fault.)
+            # JMR can't jump to the address in the input register (see `CPU.jump_register`).
+            if value > MAX_REG or (opcode.assembly == "JMR" and value == MAX_REG):
+                return Fault(line.address, RegisterOverflowError, value)
+        elif kind is Operand.JUMP and value >= ROM_SIZE:
+            return Fault(line.address, ROMOutOfBoundsError, value)
+    return None
+
+
+def _reachable(rom: bytes, faults: dict[int, Fault]) -> dict[int, Line]:
+    """Every instruction that can run, by address. Unlike the disassembler, this follows jumps into
+    the middle of other instructions, since the CPU will happily run those too."""
+    code: dict[int, Line] = {}
+    pending = [0]
+    while pending:
+        address = pending.pop()
+        while address < ROM_SIZE and address not in code:
+            line = decode(rom, address, BY_VALUE)
+            if line is None:
+                faults[address] = Fault(address, UnknownOpcodeError, rom[address])
+                break
+            code[address] = line
+            fault = _fault(line)
+            if fault is not None:
+                faults[address] = fault
+                break
+            pending.extend(line.targets)
+            if not line.falls_through:
+                break
+            address += line.size
+    return code
+
+
+def _blocks(code: dict[int, Line], faults: dict[int, Fault]) -> dict[int, Block]:
+    leaders = {0} | {t for line in code.values() for t in line.targets}
+    leaders |= {line.address + line.size for line in code.values() if line.targets or not line.falls_through}
+
+    blocks: dict[int, Block] = {}
+    for address in sorted(leaders & code.keys()):
+        block = blocks[address] = Block(address)
+        while True:
+            line = code[address]
+            block.lines.append(line)
+            if address in faults:
+                block.exits = True
+                break
+            for target in line.targets:
+                if target in code:
+                    block.successors.append(target)
+                else:
+                    # An unknown opcode.
+                    block.exits = True
+            if line.opcode.assembly in ("HLT", "JMR"):  # type: ignore[union-attr]
+                block.exits = True
+            if not line.falls_through:
+                break
+            address += line.size
+            if address not in code:
+                # Off the end of ROM, or an unknown opcode.
+                block.exits = True
+                break
+            if address in leaders:
+                block.successors.append(address)
+                break
+    return blocks
+
+
+def _trapped(blocks: dict[int, Block]) -> set[int]:
+    """Blocks that can't get to any way out."""
+    predecessors: dict[int, list[int]] = {start: [] for start in blocks}
+    for block in blocks.values():
+        for successor in block.successors:
+            predecessors[successor].append(block.start)
+    free = {start for start, block in blocks.items() if block.exits}
+    pending = list(free)
+    while pending:
+        for predecessor in predecessors[pending.pop()]:
+            if predecessor not in free:
+                free.add(predecessor)
+                pending.append(predecessor)
+    return blocks.keys() - free
+
+
+def _loops(blocks: dict[int, Block], trapped: set[int]) -> list[tuple[int, ...]]:
+    """The strongly connected parts of `trapped` that nothing leads out of: where the program ends up going round."""
+    # Tarjan's algorithm, without recursion.
+    index: dict[int, int] = {}
+    low: dict[int, int] = {}
+    stack: list[int] = []
+    on_stack: set[int] = set()
+    components: list[list[int]] = []
+    for root in sorted(trapped):
+        if root in index:
+            continue
+        work = [(root, iter(blocks[root].successors))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(blocks[successor].successors)))
+                    break
+                if successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    loops = []
+    for component in components:
+        members = set(component)
+        if all(s in members for start in component for s in blocks[start].successors):
+            loops.append(tuple(sorted(component)))
+    return sorted(loops)
+
+
+def _unreachable(rom: bytes, code: dict[int, Line], faults: dict[int, Fault]) -> list[tuple[int, int]]:
+    """Spans of non-zero bytes that never run, joined up across any zeros between them."""
+    ran = bytearray(ROM_SIZE)
+    for line in code.values():
+        ran[line.address:line.address + line.size] = b"\x01" * line.size
+    for address in faults:
+        ran[address] = 1
+    spans: list[tuple[int, int]] = []
+    start: int | None = None
+    for address in range(ROM_SIZE + 1):
+        if address == ROM_SIZE or ran[address]:
+            if start is not None:
+                spans.append((start, len(rom[start:address].rstrip(b"\x00")) + start))
+                start = None
+        elif start is None and rom[address]:
+            start = address
+    return spans
+
+
+def analyze(rom: bytes | bytearray | list[int]) -> Analysis:
+    """Build the control-flow graph of `rom` (running from address 0) and look for problems in it."""
+    # Whatever isn't given is zeros, as it is once it's loaded into a CPU, and an instruction cut
+    # off by the end of ROM reads zeros for its missing operands.
+    rom = bytes(rom).ljust(ROM_SIZE, b"\x00") + bytes(MAX_INSTRUCTION_WIDTH)
+    faults: dict[int, Fault] = {}
+    code = _reachable(rom, faults)
+    blocks = _blocks(code, faults)
+    loops = _loops(blocks, _trapped(blocks))
+    indirect = sorted(address for address, line in code.items() if line.opcode.assembly == "JMR")  # type: ignore[union-attr]
+    return Analysis(blocks, _unreachable(rom, code, faults), loops, [faults[a] for a in sorted(faults)], indirect)
+
+
+def report(analysis: Analysis) -> str:
+    """What `analyze` found, one problem per line."""
+    out = [f"{len(analysis.blocks)} blocks, {sum(len(b.successors) for b in analysis.blocks.values())} edges"]
+    out += [(f"{start:02X}" if end - start == 1 else f"{start:02X}-{end - 1:02X}") + ": unreachable" for start, end in analysis.unreachable]
+    out += [f"{loop[0]:02X}: loop with no way out (blocks {' '.join(f'{s:02X}' for s in loop)})" for loop in analysis.loops]
+    out += [str(fault) for fault in analysis.faults]
+    if analysis.indirect and analysis.unreachable:
+        out.append(f"(JMR at {' '.join(f'{a:02X}' for a in analysis.indirect)} may reach code reported as unreachable)")
+    return "\n".join(out)
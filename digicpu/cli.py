@@ -0,0 +1,76 @@
+import argparse
+import logging
+
+from digicpu.lib.log import logger
+from digicpu.lib.types import ROM_SIZE
+
+
+def _size(s: str) -> tuple[int, int]:
+    width, _, height = s.lower().partition("x")
+    return int(width), int(height)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog = "digicpu", description = "A software-based very basic 8-bit CPU.")
+    parser.add_argument("--threaded", action = "store_true", help = "run the CPU on its own thread, apart from the window")
+    parser.add_argument("--screen", metavar = "WxH", type = _size, help = "connect a WxH bitmap screen, plotted through GP5/GP6/GP7 (needs NumPy)")
+    subparsers = parser.add_subparsers(dest = "command")
+
+    run_parser = subparsers.add_parser("run", help = "assemble and run a program headlessly, then dump the machine state")
+    run_parser.add_argument("program", help = "path to a .asm file, or a .bin ROM image")
+    run_parser.add_argument("-c", "--cycles", type = int, default = 1_000_000, help = "maximum number of cycles to run (default: %(default)s)")
+    run_parser.add_argument("-i", "--input", type = int, default = 0, help = "value of the input register (default: %(default)s)")
+    run_parser.add_argument("--no-ram", action = "store_true", help = "don't dump RAM")
+    run_parser.add_argument("-t", "--translate", action = "store_true", help = "run hot code as translated Python blocks")
+    run_parser.add_argument("--trace", action = "store_true", help = "log every instruction the interpreter runs")
+    run_parser.add_argument("-p", "--profile", action = "store_true", help = "print where the cycles went")
+    run_parser.add_argument("--collapsed", metavar = "FILE", help = "write the profile to FILE in collapsed-stack format, for flamegraphs")
+    run_parser.add_argument("-r", "--record", metavar = "FILE", help = "write every instruction run to FILE as a binary trace")
+
+    trace_parser = subparsers.add_parser("trace", help = "print a trace recorded with `run --record` as disassembly")
+    trace_parser.add_argument("file", help = "path to a trace file")
+    trace_parser.add_argument("--start", type = lambda s: int(s, 0), default = 0, help = "only show instructions at this address or above (default: %(default)s)")
+    trace_parser.add_argument("--end", type = lambda s: int(s, 0), default = ROM_SIZE, help = "only show instructions below this address (default: %(default)s)")
+    trace_parser.add_argument("-n", "--last", type = int, help = "only show the last N matching instructions")
+
+    disassemble_parser = subparsers.add_parser("disassemble", help = "print a program as assembly, with labels at jump targets")
+    disassemble_parser.add_argument("program", help = "path to a .bin ROM image, or a .asm file")
+    disassemble_parser.add_argument("--linear", action = "store_true", help = "decode every byte in order, instead of following where execution can go")
+
+    analyze_parser = subparsers.add_parser("analyze", help = "look for unreachable code, loops with no way out, and instructions that always fault")
+    analyze_parser.add_argument("program", help = "path to a .asm file, or a .bin ROM image")
+
+    args = parser.parse_args(argv)
+
+    logger.setLevel(logging.DEBUG if getattr(args, "trace", False) else logging.INFO)
+
+    if args.command == "run":
+        # Imported here so we never pay for arcade when there's no window.
+        from digicpu.headless import run_file
+        print(run_file(args.program, args.cycles, args.input, not args.no_ram, args.translate, args.trace, args.profile, args.collapsed,
+                       args.record))
+    elif args.command == "trace":
+        from collections import deque
+
+        from digicpu.core.opcode import BY_VALUE
+        from digicpu.core.trace import between, format_record, read
+        records = between(read(args.file), args.start, args.end)
+        if args.last is not None:
+            records = deque(records, maxlen = args.last)
+        for record in records:
+            print(format_record(record, BY_VALUE))
+    elif args.command == "disassemble":
+        from digicpu.core.cpu import CPU
+        from digicpu.core.disassembler import disassemble
+        cpu = CPU()
+        cpu.load_file(args.program)
+        print(disassemble(cpu.rom, not args.linear))
+    elif args.command == "analyze":
+        from digicpu.analysis import analyze, report
+        from digicpu.core.cpu import CPU
+        cpu = CPU()
+        cpu.load_file(args.program)
+        print(report(analyze(cpu.rom)))
+    else:
+        from digicpu import window
+        window.main(args.threaded, args.screen)
@@ -0,0 +1,113 @@
+"""Run a CPU at a steady instruction rate, independent of how often the caller gets control."""
+
+import time
+
+from digicpu import headless
+from digicpu.core.cpu import CPU
+from digicpu.core.idle import LoopDetector
+from digicpu.lib.types import ROM_SIZE
+
+DEFAULT_RATE = 1_000
+MIN_RATE = 1
+MAX_RATE = 16_000_000
+# How many instructions to run between checks of the time budget.
+BATCH_SIZE = 64
+
+
+def faster(rate: float | None) -> float | None:
+    """Double `rate`. Past `MAX_RATE`, the clock is unthrottled (None)."""
+    return None if rate is None or rate >= MAX_RATE else rate * 2
+
+
+def slower(rate: float | None) -> float | None:
+    """Halve `rate`, or drop from unthrottled to `MAX_RATE`."""
+    return MAX_RATE if rate is None else rate / 2
+
+
+class Clock:
+    """Steps a CPU at `rate` instructions per second, or as fast as it can if `rate` is None.
+
+    Call `advance` with the time that passed (once a frame, say) and it runs however many
+    instructions are owed, in batches, stopping early if it runs out of `budget` seconds. If the
+    host can't keep up, the debt is dropped rather than carried forever, so the emulator slows down
+    instead of spiralling.
+
+    Once the program is stuck in a loop, waiting for input say, the clock stops running it and
+    just skips ahead (see `digicpu.core.idle`) until the input changes. Unthrottled, there's no
+    rate to skip ahead at, so it just stops running it."""
+    def __init__(self, cpu: CPU, rate: float | None = DEFAULT_RATE):
+        self.cpu = cpu
+        self._rate = None if rate is None else float(rate)
+        self._owed: float = 0.0
+        self.cycles: int = 0
+        self.idle = LoopDetector()
+
+    @property
+    def rate(self) -> float | None:
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float | None):
+        self._rate = None if value is None else float(min(max(value, MIN_RATE), MAX_RATE))
+        self._owed = 0.0
+
+    @property
+    def running(self) -> bool:
+        return not self.cpu._halt_flag and self.cpu.program_counter < ROM_SIZE
+
+    def reset(self):
+        self._owed = 0.0
+        self.cycles = 0
+        self.idle.reset()
+
+    def wake(self):
+        """Stop assuming the CPU is stuck, after its state was changed from outside."""
+        self.idle.reset()
+
+    def step(self) -> int:
+        """Run a single instruction, regardless of rate."""
+        ran = headless.run(self.cpu, 1, detector = self.idle)
+        self.cycles += ran
+        return ran
+
+    def advance(self, dt: float, budget: float | None = None) -> int:
+        """Run the instructions owed for `dt` seconds, spending at most `budget` seconds of wall time
+        doing it (default: `dt`). Unthrottled, it runs for the whole budget. Returns the number of
+        instructions run."""
+        if not self.running:
+            self._owed = 0.0
+            return 0
+
+        budget = dt if budget is None else budget
+        if self._rate is None:
+            return self._flat_out(budget)
+        self._owed += dt * self._rate
+        owed = int(self._owed)
+        deadline = time.perf_counter() + budget
+
+        ran = 0
+        while ran < owed:
+            # Once it's stuck in a loop, the rest can be skipped in one go.
+            batch = owed - ran if self.idle.still_looping(self.cpu) else min(BATCH_SIZE, owed - ran)
+            n = headless.run(self.cpu, batch, detector = self.idle)
+            ran += n
+            if not self.running or time.perf_counter() >= deadline:
+                break
+
+        self.cycles += ran
+        if ran < owed:
+            # Halted or out of time: whatever's left is dropped, not owed next time.
+            self._owed = 0.0
+        else:
+            self._owed -= ran
+        return ran
+
+    def _flat_out(self, budget: float) -> int:
+        deadline = time.perf_counter() + budget
+        ran = 0
+        while self.running and not self.idle.still_looping(self.cpu):
+            ran += headless.run(self.cpu, BATCH_SIZE, detector = self.idle)
+            if time.perf_counter() >= deadline:
+                break
+        self.cycles += ran
+        return ran
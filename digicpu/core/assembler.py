@@ -1,5 +1,5 @@
 import re
-from typing import cast
+from typing import NamedTuple
 
 from digicpu.core.opcode import Opcode
 from digicpu.lib.errors import (InvalidAssemblyError, ROMTooLargeError,
@@ -7,109 +7,140 @@ from digicpu.lib.errors import (InvalidAssemblyError, ROMTooLargeError,
 from digicpu.lib.types import ROM_SIZE, Registers
 from digicpu.lib.utils import make_int
 
+REGISTER_ALIASES = {r.name: r.value for r in Registers}
 
-def assemble(s: str, opcodes: list[Opcode]) -> list[int]:
-    valid_opcodes = [o.assembly for o in opcodes]
-    
-    s = re.sub(r"#(.*)\n", "\n", s)  # comments
-    s = s.replace("...", "NOP") # ... is a macro for NOP
-
-    # Deal with constants. It's not really an opcode, so it's not coded like one.
-    replacements = {}
-    constants: list[str] = re.findall(r"CONST (.+ .+)\n", s)
-    for constant in constants:
-        split = constant.split(maxsplit = 1)
-        replacements[split[0]] = split[1]
-
-    # Replace everything we determined needs to be, e.g.: constants.
-    for key, value in replacements.items():
-        s = s.replace(key, value)
-
-    # Make sure everything's uppercase, since we assume that a lot.
-    s = s.upper()
-
-    # Replace semis with newlines for one-liners
-    s = s.replace(";", "\n")
-
-    # Fix legacy IMM
-    s = re.sub(r"IMM ([^\s]+)\n", "IMM \\1 0\n", s)
-
-    # Store labels for later.
-    labels = {}
-    lines = s.split("\n")
-    n = 0
-    for line in lines:
-        line = line.strip()
-
-        # If we find a label definition, save it.
-        if m := re.match(r"LABEL ([^:]+):?", line):
-            labels[m.group(1)] = n
-        else:
-            # Step over opcodes, since we know how wide they are.
-            for o in opcodes:
-                if line.startswith(o.assembly):
-                    n += o.width
-                    break
-
-    # Replace all labels with nothing, since we dealt with them.
-    s = re.sub(r"LABEL (.*)\n", "", s)
-    # Constants, too.
-    s = re.sub(r"CONST (.*)\n", "", s)
-
-    # PSH and POP macros
-    
-
-    # No newlines.
-    s = s.replace("\n", " ")
-
-    # Split the instructions by spaces and clean then up.
-    instructions = s.split()
-    instructions = [i.strip().upper() for i in instructions]
-    instructions = cast(list[str | int], instructions)
-
-    idx_to_pop = []
-    for n, i in enumerate(instructions):
-        if isinstance(i, str) and (i.startswith("+") or i.startswith("-")):
-            number = make_int(i[1:])
-            if i.startswith("-"):
-                number = -number
-            if isinstance(instructions[n - 1], int):
-                instructions[n - 1] += number  # type:ignore
-            else:
-                raise InvalidAssemblyError(f"Dangling address modifier \"{i}\"!")
-            idx_to_pop.append(n)
-    for idx in idx_to_pop:
-        instructions.pop(idx)
-
-    # Step through these instructions.
-    for n, i in enumerate(instructions):
-        match i:
-            # Is a valid Opcode.
-            case x if x in valid_opcodes:
-                opcode = next(o for o in opcodes if o.assembly == x)
-                instructions[n] = opcode.value
+# A token, or a statement separator.
+TOKEN = re.compile(r"[^\s;]+|;")
+NUMBER = re.compile(r"(0X[0-9A-F]+|0B[01]+|[0-9]+|\".\")$")
+
+
+class Assembly(NamedTuple):
+    rom: list[int]
+    # ROM offset -> (line, column) of the token that produced that byte, both 1-based.
+    source_map: dict[int, tuple[int, int]]
+    labels: dict[str, int]
+
+
+class _Token(NamedTuple):
+    text: str
+    line: int
+    column: int
+
+
+def _statements(s: str):
+    """Split source into statements (lists of tokens), one pass over each line."""
+    for line_number, line in enumerate(s.splitlines(), start = 1):
+        # Comments run to the end of the line.
+        line = line.split("#", 1)[0]
+        statement: list[_Token] = []
+        for m in TOKEN.finditer(line):
+            text = m.group().upper()
+            if text == ";":
+                if statement:
+                    yield statement
+                statement = []
                 continue
-            # Register aliases
-            case x if x in [m.name for m in Registers]:
-                instructions[n] = Registers[x]
+            # ... is a macro for NOP
+            if text == "...":
+                text = "NOP"
+            statement.append(_Token(text, line_number, m.start() + 1))
+        if statement:
+            yield statement
+
+
+def assemble_program(s: str, opcodes: list[Opcode]) -> Assembly:
+    """Assemble source into ROM, with a source map and the label table.
+
+    Labels that are used before they're defined are backpatched once the whole source has been read."""
+    mnemonics = {o.assembly: o for o in opcodes}
+    imm = mnemonics.get("IMM")
+
+    rom: list[int] = []
+    source_map: dict[int, tuple[int, int]] = {}
+    labels: dict[str, int] = {}
+    constants: dict[str, list[_Token]] = {}
+    # (ROM offset, name, token, address modifier)
+    backpatches: list[list] = []
+
+    def emit(value: int, token: _Token):
+        source_map[len(rom)] = (token.line, token.column)
+        rom.append(value)
+
+    for statement in _statements(s):
+        head = statement[0].text
+
+        if head == "LABEL":
+            if len(statement) < 2:
+                raise InvalidAssemblyError(f"Label with no name on line {statement[0].line}!")
+            labels[statement[1].text.rstrip(":")] = len(rom)
+            continue
+
+        # Constants aren't really opcodes, so they're not coded like them.
+        if head == "CONST":
+            if len(statement) < 3:
+                raise InvalidAssemblyError(f"Constant with no value on line {statement[0].line}!")
+            constants[statement[1].text] = statement[2:]
+            continue
+
+        start = len(rom)
+        tokens = list(statement)
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            text = token.text
+            i += 1
+
+            if text in constants:
+                tokens[i:i] = constants[text]
                 continue
-            # Otherwise, is this a label?
-            case x:
-                if x in labels:
-                    instructions[n] = make_int(labels[x])
-                    continue
 
-        # Otherwise it's just a number I guess.
-        instructions[n] = make_int(i)
+            # Address modifiers, e.g. `JMP LOOP +2`.
+            if text[0] in "+-" and len(text) > 1:
+                if len(rom) == start:
+                    raise InvalidAssemblyError(f"Dangling address modifier \"{text}\" on line {token.line}!")
+                modifier = make_int(text[1:]) * (-1 if text[0] == "-" else 1)
+                if backpatches and backpatches[-1][0] == len(rom) - 1:
+                    backpatches[-1][3] += modifier
+                else:
+                    rom[-1] += modifier
+                continue
 
-    # If we didn't turn something into a number, something messed up.
-    for i in instructions:
-        if not isinstance(i, int):
-            raise UnknownInstructionError(i)
+            if text in mnemonics:
+                emit(mnemonics[text].value, token)
+            elif text in REGISTER_ALIASES:
+                emit(REGISTER_ALIASES[text], token)
+            elif text in labels:
+                emit(labels[text], token)
+            elif NUMBER.match(text):
+                emit(make_int(text), token)
+            else:
+                # Probably a label we haven't seen yet.
+                backpatches.append([len(rom), text, token, 0])
+                emit(0, token)
+
+        # Fix legacy IMM, which only took a value.
+        if imm is not None and len(rom) - start == 2 and rom[start] == imm.value:
+            emit(0, statement[-1])
+
+    for offset, name, token, modifier in backpatches:
+        if name in labels:
+            rom[offset] = labels[name] + modifier
+        elif name in constants and len(constants[name]) == 1:
+            value = constants[name][0].text
+            if value in REGISTER_ALIASES:
+                rom[offset] = REGISTER_ALIASES[value] + modifier
+            elif NUMBER.match(value):
+                rom[offset] = make_int(value) + modifier
+            else:
+                raise UnknownInstructionError(value, token.line)
+        else:
+            raise UnknownInstructionError(name, token.line)
+
+    if len(rom) > ROM_SIZE:
+        raise ROMTooLargeError(len(rom))
 
-    instructions = cast(list[int], instructions)
+    return Assembly(rom, source_map, labels)
 
-    if len(instructions) > ROM_SIZE:
-        ROMTooLargeError(len(instructions))
 
-    return instructions
+def assemble(s: str, opcodes: list[Opcode]) -> list[int]:
+    return assemble_program(s, opcodes).rom
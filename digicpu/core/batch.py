@@ -0,0 +1,372 @@
+"""Many CPUs running the same ROM in lockstep, as NumPy arrays.
+
+Requires NumPy (`pip install digicpu[batch]`).
+"""
+
+from functools import cache
+
+import numpy as np
+
+from digicpu.core.cpu import CPU
+from digicpu.core.opcode import OPCODES, Operand
+from digicpu.lib.types import (MAX_INSTRUCTION_WIDTH, MAX_INT, MAX_REG,
+                               RAM_SIZE, ROM_SIZE, Registers)
+
+NEGATIVE = 0
+ZERO = 1
+OVERFLOW = 2
+
+DIGITS = 8
+
+FLAG_JUMPS = {"JNF": (NEGATIVE, True), "JNN": (NEGATIVE, False),
+              "JZF": (ZERO, True), "JNZ": (ZERO, False),
+              "JOF": (OVERFLOW, True), "JNO": (OVERFLOW, False)}
+CONDITIONALS = {"EQ": np.equal, "NEQ": np.not_equal, "LT": np.less,
+                "LTE": np.less_equal, "GT": np.greater, "GTE": np.greater_equal}
+
+
+@cache
+def _sevenseg_table() -> np.ndarray:
+    """What SEG stores for every input value, or -1 where it leaves the register alone."""
+    cpu = CPU()
+    table = np.full(MAX_INT, -1, dtype = np.int64)
+    for value in range(MAX_INT):
+        results = []
+        for initial in (0, 1):
+            cpu.registers[0] = value
+            cpu.registers[1] = initial
+            cpu.int_to_sevenseg(0, 1)
+            results.append(cpu.registers[1])
+        if results[0] == results[1]:
+            table[value] = results[0]
+    return table
+
+
+class BatchCPU:
+    """`n` machines running one ROM in lockstep.
+
+    Each step, lanes are grouped by the instruction they're on and every group is executed as
+    one masked, vectorized operation, with the same semantics (flag quirks included) as `CPU.step`.
+    A lane that would raise in `CPU` instead stops *before* the offending instruction and gets
+    its `faulted` flag set.
+    """
+    def __init__(self, n: int):
+        self.n = n
+        self.program_counter = np.zeros(n, dtype = np.int64)
+        # Column-major, so one register (or flag, or RAM byte) across every lane is contiguous.
+        self.registers = np.zeros((n, MAX_REG + 1), dtype = np.uint8, order = "F")
+        self.ram = np.zeros((n, RAM_SIZE), dtype = np.uint8, order = "F")
+        self.flags = np.zeros((n, 3), dtype = bool, order = "F")
+        self.halted = np.zeros(n, dtype = bool)
+        self.faulted = np.zeros(n, dtype = bool)
+        self.cycles = np.zeros(n, dtype = np.int64)
+        self.display = np.zeros((n, DIGITS), dtype = np.uint8, order = "F")
+        self.display_address = np.zeros(n, dtype = np.uint8)
+        self.display_data = np.zeros(n, dtype = np.uint8)
+
+        # Index of every lane, for when a whole-batch slice won't do.
+        self._all = np.arange(n)
+
+        # Padded so operands past the end of ROM read as 0, like they do in `CPU`.
+        self.rom = np.zeros(ROM_SIZE + MAX_INSTRUCTION_WIDTH, dtype = np.int64)
+
+        self._handlers = {}
+        for o in OPCODES:
+            handler = getattr(self, f"_op_{o.assembly.lower()}", None)
+            if handler is None:
+                # The rest are handled by shape.
+                if o.operands == (Operand.JUMP,) and o.reads:
+                    handler = self._op_flag_jump
+                elif o.operands == (Operand.REGISTER, Operand.REGISTER, Operand.JUMP):
+                    handler = self._op_conditional
+                elif not o.operands and o.writes:
+                    handler = self._op_clear_flags
+                elif o.operands == (Operand.REGISTER, Operand.REGISTER, Operand.DESTINATION):
+                    handler = self._op_three_operand
+                else:
+                    raise NotImplementedError(f"No batch handler for {o.assembly}!")
+            self._handlers[o.value] = (handler, o.assembly, o.width)
+
+    @property
+    def negative_flag(self) -> np.ndarray:
+        return self.flags[:, NEGATIVE]
+
+    @property
+    def zero_flag(self) -> np.ndarray:
+        return self.flags[:, ZERO]
+
+    @property
+    def overflow_flag(self) -> np.ndarray:
+        return self.flags[:, OVERFLOW]
+
+    @property
+    def running(self) -> np.ndarray:
+        """Which lanes will do something on the next step."""
+        return ~(self.halted | self.faulted) & (self.program_counter < ROM_SIZE)
+
+    def load(self, rom: list[int] | bytes):
+        """Load a program into every lane."""
+        self.rom[:] = 0
+        self.rom[:len(rom)] = np.asarray(rom, dtype = np.int64)
+
+    def load_string(self, s: str):
+        """Load an assembly program from string into every lane."""
+        cpu = CPU()
+        cpu.load_string(s)
+        self.load(cpu.rom)
+
+    def input(self, values: int | np.ndarray):
+        """Set the input register of every lane (or one value per lane)."""
+        self.registers[:, Registers.INPT] = np.asarray(values) % MAX_INT
+
+    def reset(self, hard: bool = False):
+        """Clear the registers and start every lane at the beginning of the program."""
+        self.program_counter[:] = 0
+        self.registers[:] = 0
+        self.flags[:] = False
+        self.halted[:] = False
+        self.faulted[:] = False
+        self.cycles[:] = 0
+        self.display[:] = 0
+        self.display_address[:] = 0
+        self.display_data[:] = 0
+        if hard:
+            self.ram[:] = 0
+
+    def step(self):
+        """Run one clock cycle on every running lane."""
+        running = self.running
+        lanes: np.ndarray | slice
+        if running.all():
+            # Indexing with a slice is much cheaper than with an index array.
+            lanes, pcs = slice(None), self.program_counter.copy()
+        else:
+            lanes = np.flatnonzero(running)
+            if not lanes.size:
+                return
+            pcs = self.program_counter[lanes]
+        self.cycles[lanes] += 1
+        # Lanes on the same instruction share an opcode *and* operands, so grouping by
+        # program counter lets every group work with scalar operands.
+        if pcs.min() == pcs.max():
+            occupied = pcs[:1]
+        else:
+            occupied = np.flatnonzero(np.bincount(pcs, minlength = ROM_SIZE))
+        if len(occupied) > 1:
+            lanes = self._rows(lanes)
+        for pc in occupied.tolist():
+            group = lanes if len(occupied) == 1 else lanes[pcs == pc]  # type: ignore[index]
+            entry = self._handlers.get(int(self.rom[pc]))
+            if entry is None:
+                self._fault(group)
+                continue
+            handler, mnemonic, width = entry
+            operands = self.rom[pc + 1:pc + width].tolist()
+            handler(mnemonic, width, group, pc, *operands)
+
+    def run(self, max_cycles: int) -> int:
+        """Step until every lane has stopped, or `max_cycles` steps. Returns the number of steps run."""
+        for cycle in range(max_cycles):
+            if not self.running.any():
+                return cycle
+            self.step()
+        return max_cycles
+
+    # Helpers
+
+    def _fault(self, lanes: np.ndarray | slice):
+        self.faulted[lanes] = True
+        self.cycles[lanes] -= 1
+
+    def _rows(self, lanes: np.ndarray | slice) -> np.ndarray:
+        """`lanes` as an index array."""
+        return self._all[lanes] if isinstance(lanes, slice) else lanes
+
+    def _reg(self, lanes: np.ndarray | slice, reg: int) -> np.ndarray:
+        return self.registers[lanes, reg].astype(np.int64)
+
+    def _commit(self, lanes, pc, width, dest, value, flags = None, overflow_register = None, negative = None):
+        """Write `value` to register `dest` (with memory-mapped side effects), set `flags` and advance.
+        `overflow_register` is stored in OVFL (ADO, MLO), and `negative` can only set the negative flag (SUB)."""
+        flags = flags or {}
+        ok = None
+        if dest == Registers.ADDR:
+            ok = value < DIGITS
+        elif dest == Registers.DATA:
+            ok = self.registers[lanes, Registers.ADDR] < DIGITS
+        if ok is not None and not ok.all():
+            lanes = self._rows(lanes)
+            self._fault(lanes[~ok])
+            lanes, value = lanes[ok], value[ok]
+            flags = {flag: v[ok] for flag, v in flags.items()}
+            if overflow_register is not None:
+                overflow_register = overflow_register[ok]
+            if negative is not None:
+                negative = negative[ok]
+
+        regs = self.registers
+        regs[lanes, dest] = value
+        if overflow_register is not None:
+            regs[lanes, Registers.OVFL] = overflow_register
+        if negative is not None:
+            self.flags[lanes, NEGATIVE] |= negative
+        for flag, v in flags.items():
+            self.flags[lanes, flag] = v
+
+        # Memory-mapped side effects.
+        if dest == Registers.RAMD:
+            # CPU.ram_data_register reads RAMA, so that's what gets saved.
+            address = regs[lanes, Registers.RAMA]
+            self.ram[self._rows(lanes), address] = address
+        elif dest == Registers.DATA:
+            address = regs[lanes, Registers.ADDR]
+            self.display_address[lanes] = address
+            self.display_data[lanes] = regs[lanes, Registers.DATA]
+            self.display[self._rows(lanes), address] = regs[lanes, Registers.DATA]
+        elif dest == Registers.ADDR:
+            regs[lanes, Registers.DATA] = self.display[self._rows(lanes), regs[lanes, Registers.ADDR]]
+        elif dest == Registers.RAMA:
+            regs[lanes, Registers.RAMD] = self.ram[self._rows(lanes), regs[lanes, Registers.RAMA]]
+        elif dest == Registers.STAK:
+            regs[lanes, Registers.RAMD] = self.ram[self._rows(lanes), regs[lanes, Registers.STAK]]
+
+        self.program_counter[lanes] = pc + width
+
+    def _jump(self, lanes, pc, width, taken, target):
+        """Jump the `taken` lanes to `target`; a taken jump outside of ROM faults."""
+        if target >= ROM_SIZE and taken.any():
+            lanes = self._rows(lanes)
+            self._fault(lanes[taken])
+            lanes, taken = lanes[~taken], taken[~taken]
+        self.program_counter[lanes] = np.where(taken, target, pc + width)
+
+    # Opcodes
+
+    def _op_nop(self, mnemonic, width, lanes, pc):
+        self.program_counter[lanes] = pc + width
+
+    def _op_hlt(self, mnemonic, width, lanes, pc):
+        self.halted[lanes] = True
+        self.program_counter[lanes] = pc + width
+
+    def _op_psh(self, mnemonic, width, lanes, pc, *operands):
+        # Not implemented in CPU either.
+        self._fault(lanes)
+
+    _op_pop = _op_psh
+
+    def _op_clear_flags(self, mnemonic, width, lanes, pc):
+        flags = {"CLF": [NEGATIVE, ZERO, OVERFLOW], "CNF": [NEGATIVE], "CZF": [ZERO], "COF": [OVERFLOW]}[mnemonic]
+        for flag in flags:
+            self.flags[lanes, flag] = False
+        self.program_counter[lanes] = pc + width
+
+    def _op_imm(self, mnemonic, width, lanes, pc, value, reg):
+        if value >= MAX_INT or reg > MAX_REG:
+            return self._fault(lanes)
+        self._commit(lanes, pc, width, reg, np.full(self.n if isinstance(lanes, slice) else len(lanes), value))
+
+    def _op_cpy(self, mnemonic, width, lanes, pc, reg_from, reg_to):
+        if reg_from > MAX_REG or reg_to > MAX_REG:
+            return self._fault(lanes)
+        self._commit(lanes, pc, width, reg_to, self._reg(lanes, reg_from))
+
+    def _op_not(self, mnemonic, width, lanes, pc, reg, reg_to):
+        if reg > MAX_REG or reg_to > MAX_REG:
+            return self._fault(lanes)
+        ans = ~self._reg(lanes, reg) & 0xFF
+        self._commit(lanes, pc, width, reg_to, ans, {ZERO: ans == 0})
+
+    def _op_seg(self, mnemonic, width, lanes, pc, reg_from, reg_to):
+        if reg_from > MAX_REG or reg_to > MAX_REG:
+            return self._fault(lanes)
+        segments = _sevenseg_table()[self._reg(lanes, reg_from)]
+        # Unknown characters leave the destination alone.
+        value = np.where(segments < 0, self._reg(lanes, reg_to), segments)
+        self._commit(lanes, pc, width, reg_to, value)
+
+    def _op_inc(self, mnemonic, width, lanes, pc, reg):
+        if reg > MAX_REG:
+            return self._fault(lanes)
+        ans = self._reg(lanes, reg) + 1
+        self._commit(lanes, pc, width, reg, ans % MAX_INT, {OVERFLOW: ans > MAX_INT, ZERO: ans == 0})
+
+    def _op_dec(self, mnemonic, width, lanes, pc, reg):
+        if reg > MAX_REG:
+            return self._fault(lanes)
+        ans = self._reg(lanes, reg) - 1
+        self._commit(lanes, pc, width, reg, ans % MAX_INT, {NEGATIVE: ans < 0, ZERO: ans == 0})
+
+    def _op_three_operand(self, mnemonic, width, lanes, pc, reg_1, reg_2, reg_to):
+        if reg_1 > MAX_REG or reg_2 > MAX_REG or reg_to > MAX_REG:
+            return self._fault(lanes)
+        a, b = self._reg(lanes, reg_1), self._reg(lanes, reg_2)
+        if mnemonic == "MOD":
+            ok = b != 0
+            if not ok.all():
+                lanes = self._rows(lanes)
+                self._fault(lanes[~ok])
+                lanes, a, b = lanes[ok], a[ok], b[ok]
+        match mnemonic:
+            case "ADD" | "ADO":
+                ans = a + b
+            case "SUB":
+                ans = a - b
+            case "MUL" | "MLO":
+                ans = a * b
+            case "MOD":
+                ans = a % b
+            case "SHL":
+                ans = np.where(b < 8, (a << np.minimum(b, 8)) & 0xFF, 0)
+            case "SHR":
+                ans = np.where(b < 8, a >> np.minimum(b, 8), 0)
+            case "MIN":
+                ans = np.minimum(a, b)
+            case "MAX":
+                ans = np.maximum(a, b)
+            case "AND":
+                ans = a & b
+            case "OR":
+                ans = a | b
+            case "XOR":
+                ans = a ^ b
+            case "NND":
+                ans = ~(a & b) & 0xFF
+            case "NOR":
+                ans = ~(a | b) & 0xFF
+            case _:
+                raise AssertionError(f"Unhandled opcode {mnemonic}")
+
+        flags = {ZERO: ans == 0}
+        if mnemonic in ("ADD", "MUL"):
+            flags[OVERFLOW] = ans > MAX_INT
+        if mnemonic in ("ADO", "MLO"):
+            flags[OVERFLOW] = ans > MAX_INT * MAX_INT
+            self._commit(lanes, pc, width, reg_to, ans % MAX_INT, flags, overflow_register = ans // MAX_INT)
+        elif mnemonic == "SUB":
+            self._commit(lanes, pc, width, reg_to, ans % MAX_INT, flags, negative = b > a)
+        else:
+            self._commit(lanes, pc, width, reg_to, ans, flags)
+
+    def _op_jmp(self, mnemonic, width, lanes, pc, position):
+        if position >= ROM_SIZE:
+            return self._fault(lanes)
+        self.program_counter[lanes] = position
+
+    def _op_jmr(self, mnemonic, width, lanes, pc, reg):
+        if reg >= MAX_REG:
+            return self._fault(lanes)
+        self.program_counter[lanes] = self._reg(lanes, reg) % ROM_SIZE
+
+    def _op_flag_jump(self, mnemonic, width, lanes, pc, jump):
+        if jump > RAM_SIZE:
+            return self._fault(lanes)
+        flag, when = FLAG_JUMPS[mnemonic]
+        taken = self.flags[lanes, flag] == when
+        self._jump(lanes, pc, width, taken, jump)
+
+    def _op_conditional(self, mnemonic, width, lanes, pc, reg_1, reg_2, jump):
+        if reg_1 > MAX_REG or reg_2 > MAX_REG or jump > ROM_SIZE:
+            return self._fault(lanes)
+        taken = CONDITIONALS[mnemonic](self.registers[lanes, reg_1], self.registers[lanes, reg_2])
+        self._jump(lanes, pc, width, taken, jump)
@@ -0,0 +1,74 @@
+"""The I/O bus: what else happens when a program writes to a register.
+
+Some registers are ports. Writing to one runs the handler of the device that owns it, which can
+store the register somewhere (the RAM on `RAMD`, a digit on `DATA`) or load something into
+another register (`RAMA` loads `RAMD`). The bus keeps a table with one slot per register, so
+finding the handler is a single index whether there are two devices or twenty.
+
+A device says which ports it wants with `ports()`. A `lazy` device keeps its port handlers down
+to storing a byte and marking itself dirty, and only builds what a front end draws (in
+`sample()`) when a frame is actually taken, so a program writing to it on every instruction
+doesn't pay for that on every instruction too.
+"""
+
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from digicpu.lib.errors import PortInUseError
+from digicpu.lib.types import MAX_INT
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+Port = Callable[["CPU"], None]
+
+
+class Device:
+    """Something on the bus."""
+    __slots__ = ()
+    lazy = False
+
+    def ports(self) -> dict[int, Port]:
+        """Register -> what to do after it's written."""
+        return {}
+
+    def reset(self, hard: bool = False):
+        pass
+
+    def sample(self) -> object:
+        """An immutable copy of what a front end would draw, for lazy devices."""
+        return None
+
+
+class Bus:
+    __slots__ = ("ports", "owners", "devices")
+
+    def __init__(self):
+        self.ports: list[Port | None] = [None] * MAX_INT
+        self.owners: list[Device | None] = [None] * MAX_INT
+        self.devices: list[Device] = []
+
+    def connect(self, device: Device):
+        ports = device.ports()
+        for register in ports:
+            if self.owners[register] is not None:
+                raise PortInUseError(register)
+        for register, port in ports.items():
+            self.ports[register] = port
+            self.owners[register] = device
+        self.devices.append(device)
+
+    def disconnect(self, device: Device):
+        self.devices.remove(device)
+        for register, owner in enumerate(self.owners):
+            if owner is device:
+                self.ports[register] = None
+                self.owners[register] = None
+
+    def reset(self, hard: bool = False):
+        for device in self.devices:
+            device.reset(hard)
+
+    def sample(self) -> tuple:
+        """A sample of every lazy device, in the order they were connected."""
+        return tuple(device.sample() for device in self.devices if device.lazy)
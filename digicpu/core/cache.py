@@ -0,0 +1,163 @@
+"""An on-disk cache of assembled programs, keyed by a hash of the source, the opcode table and the
+assembler itself.
+
+Set `DIGICPU_CACHE_DIR` to move the cache (default `~/.cache/digicpu/assembly`), or to an empty
+string to turn it off. Least recently used entries are evicted once the cache grows past
+`DIGICPU_CACHE_SIZE` bytes (default 16 MiB).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from digicpu.core import assembler
+from digicpu.core.assembler import Assembly, assemble_program
+from digicpu.core.opcode import Opcode
+
+# Bump when the cache's format changes, so old entries stop matching. (Changes to the assembler
+# are caught by `ASSEMBLER_HASH`.)
+CACHE_VERSION = 3
+DEFAULT_CACHE_DIR = Path("~/.cache/digicpu/assembly").expanduser()
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+# Directory -> roughly how many bytes are in it, so the directory is only scanned when it might be
+# over the limit rather than after every write. Entries written by other processes aren't counted
+# until the next scan.
+_sizes: dict[Path, int] = {}
+_sizes_lock = threading.Lock()
+
+
+def _assembler_hash() -> str:
+    try:
+        return hashlib.blake2b(Path(assembler.__file__).read_bytes(), digest_size = 20).hexdigest()
+    except OSError:
+        # No source to read (a frozen build, say), so fall back to the package version.
+        try:
+            return version("digicpu")
+        except PackageNotFoundError:
+            return ""
+
+
+# Hashed into every key, so that entries from an older assembler stop matching.
+ASSEMBLER_HASH = _assembler_hash()
+
+
+def cache_dir() -> Path | None:
+    """Where the cache lives, or None if it's turned off."""
+    d = os.environ.get("DIGICPU_CACHE_DIR")
+    if d is None:
+        return DEFAULT_CACHE_DIR
+    return Path(d).expanduser() if d else None
+
+
+def max_size() -> int:
+    return int(os.environ.get("DIGICPU_CACHE_SIZE", DEFAULT_MAX_SIZE))
+
+
+def key(s: str, opcodes: list[Opcode]) -> str:
+    h = hashlib.blake2b(digest_size = 20)
+    h.update(f"{CACHE_VERSION}\0{ASSEMBLER_HASH}\0".encode())
+    for o in opcodes:
+        h.update(f"{o.value}:{o.assembly}\0".encode())
+    h.update(s.encode())
+    return h.hexdigest()
+
+
+def _encode(assembly: Assembly) -> bytes:
+    return json.dumps({
+        "rom": bytes(assembly.rom).hex(),
+        "source_map": [[offset, line, column] for offset, (line, column) in assembly.source_map.items()],
+        "labels": assembly.labels
+    }, separators = (",", ":")).encode()
+
+
+def _decode(data: bytes) -> Assembly:
+    d = json.loads(data)
+    return Assembly(list(bytes.fromhex(d["rom"])),
+                    {offset: (line, column) for offset, line, column in d["source_map"]},
+                    d["labels"])
+
+
+def _size(directory: Path) -> int:
+    total = 0
+    for p in directory.glob("*.json"):
+        try:
+            total += p.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+def evict(directory: Path, limit: int) -> int:
+    """Delete the least recently used entries until the cache is no bigger than `limit` bytes.
+    Returns how big it is afterwards."""
+    entries = []
+    for p in directory.glob("*.json"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            p.unlink()
+        except OSError:
+            continue
+        total -= size
+    return total
+
+
+def _added(directory: Path, size: int, limit: int):
+    """Count `size` more bytes in `directory`, and evict if that takes it over `limit`."""
+    with _sizes_lock:
+        if directory not in _sizes:
+            _sizes[directory] = _size(directory)
+        else:
+            _sizes[directory] += size
+        if _sizes[directory] > limit:
+            _sizes[directory] = evict(directory, limit)
+
+
+def assemble_cached(s: str, opcodes: list[Opcode], directory: Path | None = None) -> Assembly:
+    """Like `assemble_program`, but reuse the result from disk if this source was assembled before.
+
+    The cache is best-effort: if it can't be read or written, this just assembles."""
+    directory = directory or cache_dir()
+    if directory is None:
+        return assemble_program(s, opcodes)
+
+    path = directory / f"{key(s, opcodes)}.json"
+    try:
+        assembly = _decode(path.read_bytes())
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    else:
+        # Hits count as uses for eviction.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return assembly
+
+    assembly = assemble_program(s, opcodes)
+    try:
+        # A ROM with bytes out of range can't be encoded; leave it uncached, and `CPU.load` will say what's wrong.
+        data = _encode(assembly)
+    except ValueError:
+        return assembly
+    try:
+        directory.mkdir(parents = True, exist_ok = True)
+        # Write then rename, so a concurrent reader never sees half an entry.
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        _added(directory, len(data), max_size())
+    except OSError:
+        pass
+    return assembly
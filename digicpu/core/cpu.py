@@ -1,17 +1,29 @@
+import logging
+import mmap
+import os
 from functools import wraps
-from typing import Callable
-
-from digicpu.core.assembler import assemble
+from pathlib import Path
+from operator import itemgetter
+from typing import Callable, Iterable
+
+from digicpu.core import snapshot
+from digicpu.core.assembler import Assembly, assemble_program
+from digicpu.core.bus import Bus, Device
+from digicpu.core.cache import assemble_cached
 from digicpu.core.display import SevenSegmentDisplay
-from digicpu.core.opcode import Opcode
+from digicpu.core.journal import CHECKPOINT_INTERVAL, DEFAULT_DEPTH, Journal
+from digicpu.core.opcode import OPCODES, Opcode
+from digicpu.core.profiler import Profiler
 from digicpu.core.ram import RAM
+from digicpu.core.trace import DEFAULT_CAPACITY, TraceRecorder
 from digicpu.lib.checks import check_arithmetic, check_logic
 from digicpu.lib.errors import (IntegerOverflowError, RegisterOverflowError,
-                                ROMOutOfBoundsError, UnknownOpcodeError)
+                                ROMOutOfBoundsError, ROMTooLargeError,
+                                UnknownOpcodeError)
 from digicpu.lib.log import logger
 from digicpu.lib.types import (MAX_INSTRUCTION_WIDTH, MAX_INT, MAX_REG,
                                RAM_SIZE, ROM_SIZE, STACK_SIZE, Register,
-                               Registers)
+                               Registers, RunResult, StopReason)
 
 
 # This is a decorator and shouldn't be invoked.
@@ -23,60 +35,47 @@ def heavy(f: Callable) -> Callable:
         self.busy_flag = False
     return wrapper
 
+def traced(assembly: str, f: Callable) -> Callable:
+    """Wrap an instruction handler so it logs every call at DEBUG. Nothing is formatted unless DEBUG is on."""
+    @wraps(f)
+    def wrapper(*args):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s" + " %s" * len(args), assembly, *args)
+        return f(*args)
+    return wrapper
+
 class CPU:
-    """A high-level implemenation of a CPU's functionality."""
-    def __init__(self):
+    """A high-level implemenation of a CPU's functionality.
+
+    Instructions are only logged if `trace` is set, in which case every handler is swapped for
+    one that logs before running. Otherwise there's no logging on the instruction path at all."""
+    __slots__ = ("program_counter", "registers", "rom", "ram", "display", "opcodes", "trace",
+                 "_just_jumped", "_last_instruction_size", "_register_changed", "_ram_byte_changed",
+                 "_halt_flag", "busy_flag", "negative_flag", "zero_flag", "overflow_flag",
+                 "_current_instruction", "_dispatch", "bus", "_decoded", "assembly", "_instruments", "profiler",
+                 "recorder", "journal")
+
+    def __init__(self, trace: bool = False):
         self.program_counter: int = 0
-        self.registers: list[int] = [0] * (MAX_REG + 1)
-        self.rom: list[int] = [0] * ROM_SIZE
+        self.registers = bytearray(MAX_REG + 1)
+        self.rom = bytearray(ROM_SIZE)
         self.ram: RAM = RAM(RAM_SIZE)
         self.display = SevenSegmentDisplay()
-
-        self.opcodes = [
-            Opcode(0x00, "NOP"),
-            Opcode(0x81, "IMM", self.immediate),
-            Opcode(0x07, "HLT", self.halt),
-            Opcode(0x91, "CPY", self.copy),
-            Opcode(0x08, "CLF", self.clear_flags),
-            Opcode(0x09, "CNF", self.clear_negative_flag),
-            Opcode(0x0A, "CZF", self.clear_zero_flag),
-            Opcode(0x0B, "COF", self.clear_overflow_flag),
-            Opcode(0x49, "JNF", self.jump_if_negative_flag),
-            Opcode(0x4D, "JNN", self.jump_if_not_negative_flag),
-            Opcode(0x4A, "JZF", self.jump_if_zero_flag),
-            Opcode(0x4E, "JNZ", self.jump_if_not_zero_flag),
-            Opcode(0x4B, "JOF", self.jump_if_overflow_flag),
-            Opcode(0x4F, "JNO", self.jump_if_not_overflow_flag),
-            Opcode(0xF1, "EQ",  self.conditional_eq),
-            Opcode(0xF2, "LT",  self.conditional_lt),
-            Opcode(0xF3, "LTE", self.conditional_lte),
-            Opcode(0xF5, "NEQ", self.conditional_neq),
-            Opcode(0xF6, "GTE", self.conditional_gte),
-            Opcode(0xF7, "GT",  self.conditional_gt),
-            Opcode(0xE0, "NND", self.logical_nand),
-            Opcode(0xE1, "OR",  self.logical_or),
-            Opcode(0xE2, "AND", self.logical_and),
-            Opcode(0xE3, "NOR", self.logical_nor),
-            Opcode(0xA4, "NOT", self.logical_not),
-            Opcode(0xE5, "XOR", self.logical_xor),
-            Opcode(0x71, "JMP", self.jump),
-            Opcode(0x75, "JMR", self.jump_register),
-            Opcode(0x68, "INC", self.increment),
-            Opcode(0x69, "DEC", self.decrement),
-            Opcode(0xE8, "ADD", self.add),
-            Opcode(0xE9, "SUB", self.sub),
-            Opcode(0xEA, "MUL", self.multiply),
-            Opcode(0xEB, "MOD", self.modulo),
-            Opcode(0xEC, "SHL", self.shift_left),
-            Opcode(0xED, "SHR", self.shift_right),
-            Opcode(0xEE, "MIN", self.minimum),
-            Opcode(0xEF, "MAX", self.maximum),
-            Opcode(0x5C, "PSH", self.push),
-            Opcode(0x5D, "POP", self.pop),
-            Opcode(0xBF, "SEG", self.int_to_sevenseg),
-            Opcode(0xF8, "ADO", self.add_with_overflow),
-            Opcode(0xFA, "MLO", self.multiply_with_overflow),
-        ]
+        # Registers with side effects when they're written (see `connect`).
+        self.bus = Bus()
+        self.bus.connect(self.ram)
+        self.bus.connect(self.display)
+        # Source map and labels of the program, if it was loaded from assembly.
+        self.assembly: Assembly | None = None
+
+        # Our own copies, bound to this CPU, so they can be wrapped (see `trace`) without touching anyone else's.
+        self.opcodes = [o.with_function(getattr(self, o.handler) if o.handler else None) for o in OPCODES]
+
+        self.trace = trace
+        if trace:
+            for o in self.opcodes:
+                if o.function:
+                    o.function = traced(o.assembly, o.function)
 
         self._just_jumped = False
         self._last_instruction_size = 0
@@ -90,8 +89,31 @@ class CPU:
         self.zero_flag = False
         self.overflow_flag = False
 
-        self._current_instruction = []
-        self._current_instruction_string = ""
+        self._current_instruction: tuple[int, ...] = ()
+
+        # Opcode byte -> Opcode, so decoding is a lookup instead of a scan.
+        self._dispatch: list[Opcode | None] = [None] * MAX_INT
+        for o in self.opcodes:
+            self._dispatch[o.value] = o
+
+        # Things that wrap each decoded instruction (profilers, tracers...). See `attach`.
+        self._instruments: list = []
+        self.profiler: Profiler | None = None
+        self.recorder: TraceRecorder | None = None
+        self.journal: Journal | None = None
+
+        # ROM address -> (opcode, operands), rebuilt whenever the ROM is loaded.
+        self._decoded: list[tuple[Opcode, tuple[int, ...]] | None] = []
+        self._decode()
+
+    @property
+    def _current_instruction_string(self) -> str:
+        if not self._current_instruction:
+            return ""
+        value, *operands = self._current_instruction
+        opcode = self._dispatch[value]
+        assert opcode is not None
+        return f"{opcode.assembly} {' '.join(f'{o:02X}' for o in operands)}"
 
     @property
     def valid_opcodes(self) -> list[str]:
@@ -103,7 +125,7 @@ class CPU:
 
     @input_register.setter
     def input_register(self, v):
-        self.registers[Registers.INPT] = v
+        self.registers[Registers.INPT] = v % MAX_INT
 
     @property
     def address_register(self) -> int:
@@ -111,7 +133,7 @@ class CPU:
 
     @address_register.setter
     def address_register(self, v):
-        self.registers[Registers.ADDR] = v
+        self.registers[Registers.ADDR] = v % MAX_INT
 
     @property
     def data_register(self) -> int:
@@ -119,7 +141,7 @@ class CPU:
 
     @data_register.setter
     def data_register(self, v):
-        self.registers[Registers.DATA] = v
+        self.registers[Registers.DATA] = v % MAX_INT
 
     @property
     def stack_register(self) -> int:
@@ -127,7 +149,7 @@ class CPU:
 
     @stack_register.setter
     def stack_register(self, v):
-        self.registers[Registers.STAK] = v
+        self.registers[Registers.STAK] = v % MAX_INT
 
     @property
     def overflow_register(self) -> int:
@@ -135,7 +157,7 @@ class CPU:
 
     @overflow_register.setter
     def overflow_register(self, v):
-        self.registers[Registers.OVFL] = v
+        self.registers[Registers.OVFL] = v % MAX_INT
 
     @property
     def ram_address_register(self) -> int:
@@ -143,7 +165,7 @@ class CPU:
 
     @ram_address_register.setter
     def ram_address_register(self, v):
-        self.registers[Registers.RAMA] = v
+        self.registers[Registers.RAMA] = v % MAX_INT
 
     @property
     def ram_data_register(self) -> int:
@@ -151,7 +173,7 @@ class CPU:
 
     @ram_data_register.setter
     def ram_data_register(self, v):
-        self.registers[Registers.RAMD] = v
+        self.registers[Registers.RAMD] = v % MAX_INT
 
     # Stubbed to get get the opcodes to work
     def push(self, *args):
@@ -163,7 +185,6 @@ class CPU:
     def copy(self, reg_from: Register, reg_to: Register):
         """CPY <from> <to>
         Copy the value from register `from` to register `to`."""
-        logger.debug(f"CPY {reg_from} {reg_to}")
         if reg_from > MAX_REG:
             raise RegisterOverflowError(reg_from)
         if reg_to > MAX_REG:
@@ -173,25 +194,21 @@ class CPU:
     def clear_negative_flag(self):
         """CNF
         Clear the negative flag"""
-        logger.debug("CNF")
         self.negative_flag = False
 
     def clear_zero_flag(self):
         """CZF
         Clear the zero flag"""
-        logger.debug("CZF")
         self.zero_flag = False
 
     def clear_overflow_flag(self):
         """COF
         Clear the overflow flag"""
-        logger.debug("COF")
         self.overflow_flag = False
 
     def clear_flags(self):
         """CLF
         Clear all flags"""
-        logger.debug("CLF")
         self.negative_flag = False
         self.zero_flag = False
         self.overflow_flag = False
@@ -199,7 +216,6 @@ class CPU:
     def jump_if_negative_flag(self, jump):
         """JNF <jump>
         If the negative flag is set, jump to position `jump`."""
-        logger.debug(f"JNF {jump}")
         if jump > RAM_SIZE:
             raise ROMOutOfBoundsError(jump)
         if self.negative_flag:
@@ -208,7 +224,6 @@ class CPU:
     def jump_if_not_negative_flag(self, jump):
         """JNN <jump>
         If the negative flag is set, jump to position `jump`."""
-        logger.debug(f"JNN {jump}")
         if jump > RAM_SIZE:
             raise ROMOutOfBoundsError(jump)
         if not self.negative_flag:
@@ -217,7 +232,6 @@ class CPU:
     def jump_if_zero_flag(self, jump):
         """JZF <jump>
         If the zero flag is set, jump to position `jump`."""
-        logger.debug(f"JZF {jump}")
         if jump > RAM_SIZE:
             raise ROMOutOfBoundsError(jump)
         if self.zero_flag:
@@ -226,7 +240,6 @@ class CPU:
     def jump_if_not_zero_flag(self, jump):
         """JNZ <jump>
         If the zero flag is set, jump to position `jump`."""
-        logger.debug(f"JNZ {jump}")
         if jump > RAM_SIZE:
             raise ROMOutOfBoundsError(jump)
         if not self.zero_flag:
@@ -235,7 +248,6 @@ class CPU:
     def jump_if_overflow_flag(self, jump):
         """JOF <jump>
         If the overflow flag is set, jump to position `jump`."""
-        logger.debug(f"JOF {jump}")
         if jump > RAM_SIZE:
             raise ROMOutOfBoundsError(jump)
         if self.overflow_flag:
@@ -244,7 +256,6 @@ class CPU:
     def jump_if_not_overflow_flag(self, jump):
         """JNO <jump>
         If the overflow flag is set, jump to position `jump`."""
-        logger.debug(f"JNO {jump}")
         if jump > RAM_SIZE:
             raise ROMOutOfBoundsError(jump)
         if not self.overflow_flag:
@@ -254,7 +265,6 @@ class CPU:
         """IMM <value> <reg>
         Uses `value` like it's just a normal number.
         Can also be in the form of 0xVAL, 0bVAL, or a single character \"V\""""
-        logger.debug(f"IMM {value}")
         if value >= MAX_INT:
             raise IntegerOverflowError(value)
         if reg > MAX_REG:
@@ -264,7 +274,6 @@ class CPU:
     def jump(self, position: int):
         """JMP <position>
         Jump to position `position` in ROM."""
-        logger.debug(f"JMP {position}")
         if position >= ROM_SIZE:
             raise ROMOutOfBoundsError(position)
         self.program_counter = position % ROM_SIZE
@@ -273,7 +282,6 @@ class CPU:
     def jump_register(self, reg: int):
         """JMR <reg>
         Jump to position stored in `<reg>` in ROM."""
-        logger.debug(f"JMR {reg}")
         if reg >= MAX_REG:
             raise RegisterOverflowError(reg)
         self.program_counter = self.registers[reg] % ROM_SIZE
@@ -284,7 +292,6 @@ class CPU:
         Add one to the value in `reg`.
         Sets the overflow flag and zero flag.
         """
-        logger.debug(f"INC {reg}")
         if reg > MAX_REG:
             raise RegisterOverflowError(reg)
         ans = (self.registers[reg] + 1)
@@ -297,7 +304,6 @@ class CPU:
         Subtract one from the value in `reg`.
         Sets the negative flag and zero flag.
         """
-        logger.debug(f"DEC {reg}")
         if reg > MAX_REG:
             raise RegisterOverflowError(reg)
         ans = (self.registers[reg] - 1)
@@ -310,7 +316,6 @@ class CPU:
         Add the values from registers A and B and copy it to register `to`.
         Sets the overflow flag or zero flag.
         """
-        logger.debug(f"ADD {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] + self.registers[reg_2])
         self.registers[reg_to] = ans % MAX_INT
@@ -323,7 +328,6 @@ class CPU:
         Sets the value in the OF register to the 0 if the result is less than 256, and 1 otherwise.
         Sets the overflow flag and zero flag.
         """
-        logger.debug(f"ADO {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] + self.registers[reg_2])
         self.registers[reg_to] = ans % MAX_INT
@@ -336,7 +340,6 @@ class CPU:
         Subtract the values from registers A and B and copy it to register `to`.
         Sets the negative flag and zero flag.
         """
-        logger.debug(f"SUB {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         if self.registers[reg_2] > self.registers[reg_1]:
             self.negative_flag = True
@@ -349,7 +352,6 @@ class CPU:
         Mulitply the values from registers A and B and copy it to register `to`.
         Sets the overflow flag and zero flag.
         """
-        logger.debug(f"MUL {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] * self.registers[reg_2])
         self.registers[reg_to] = ans % MAX_INT
@@ -362,7 +364,6 @@ class CPU:
         Sets the value in the OF register to the 0 if the result is less than 256, and (result // 256) otherwise.
         Sets the overflow flag and zero flag.
         """
-        logger.debug(f"MLO {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] * self.registers[reg_2])
         self.registers[reg_to] = ans % MAX_INT
@@ -375,7 +376,6 @@ class CPU:
         Modulo the values from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"MOD {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] % self.registers[reg_2])
         self.registers[reg_to] = ans
@@ -386,7 +386,6 @@ class CPU:
         Shift the value in register A B amount and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"SHL {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] << self.registers[reg_2]) % MAX_INT
         self.registers[reg_to] = ans
@@ -397,7 +396,6 @@ class CPU:
         Shift the value in register A B amount and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"SHR {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] >> self.registers[reg_2]) % MAX_INT
         self.registers[reg_to] = ans
@@ -408,7 +406,6 @@ class CPU:
         Choose the minimum value from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"MIN {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = min(self.registers[reg_1], self.registers[reg_2])
         self.registers[reg_to] = ans
@@ -419,7 +416,6 @@ class CPU:
         Choose the minimum value from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"MAX {reg_1} {reg_2} {reg_to}")
         check_arithmetic(reg_1, reg_2, reg_to)
         ans = max(self.registers[reg_1], self.registers[reg_2])
         self.registers[reg_to] = ans
@@ -430,7 +426,6 @@ class CPU:
         Logical AND the values from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"AND {reg_1} {reg_2} {reg_to}")
         check_logic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] & self.registers[reg_2]) % MAX_INT
         self.registers[reg_to] = ans
@@ -441,7 +436,6 @@ class CPU:
         Logical OR the values from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"OR {reg_1} {reg_2} {reg_to}")
         check_logic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] | self.registers[reg_2]) % MAX_INT
         self.registers[reg_to] = ans
@@ -452,7 +446,6 @@ class CPU:
         Logical NAND the values from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"NND {reg_1} {reg_2} {reg_to}")
         check_logic(reg_1, reg_2, reg_to)
         ans = ~(self.registers[reg_1] & self.registers[reg_2]) % MAX_INT
         self.registers[reg_to] = ans
@@ -463,7 +456,6 @@ class CPU:
         Logical NOR the values from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"NOR {reg_1} {reg_2} {reg_to}")
         check_logic(reg_1, reg_2, reg_to)
         ans = ~(self.registers[reg_1] | self.registers[reg_2]) % MAX_INT
         self.registers[reg_to] = ans
@@ -474,7 +466,6 @@ class CPU:
         Logical XOR the values from registers A and B and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"XOR {reg_1} {reg_2} {reg_to}")
         check_logic(reg_1, reg_2, reg_to)
         ans = (self.registers[reg_1] ^ self.registers[reg_2]) % MAX_INT
         self.registers[reg_to] = ans
@@ -485,7 +476,6 @@ class CPU:
         Logical NOT the value from register A and copy it to register `to`.
         Sets the zero flag.
         """
-        logger.debug(f"NOT {reg} {reg_to}")
         check_logic(reg, 0, reg_to)  # HACK: don't want to make a seperate checking function, only 1-operand math func.
         ans = (~self.registers[reg]) % MAX_INT
         self.registers[reg_to] = ans
@@ -494,7 +484,6 @@ class CPU:
     def conditional_eq(self, reg_1, reg_2, jump):
         """EQ <A> <B> <jump>
         If the value in register A equals the value in register B, jump to position `jump`."""
-        logger.debug(f"EQ {reg_1} {reg_2} {jump}")
         check_logic(reg_1, reg_2, jump)
         if self.registers[reg_1] == self.registers[reg_2]:
             self.jump(jump)
@@ -502,7 +491,6 @@ class CPU:
     def conditional_neq(self, reg_1, reg_2, jump):
         """NEQ <A> <B> <jump>
         If the value in register A doesn't equal the value in register B, jump to position `jump`."""
-        logger.debug(f"NEQ {reg_1} {reg_2} {jump}")
         check_logic(reg_1, reg_2, jump)
         if self.registers[reg_1] != self.registers[reg_2]:
             self.jump(jump)
@@ -510,7 +498,6 @@ class CPU:
     def conditional_gt(self, reg_1, reg_2, jump):
         """GT <A> <B> <jump>
         If the value in register A is greater than the value in register B, jump to position `jump`."""
-        logger.debug(f"GT {reg_1} {reg_2} {jump}")
         check_logic(reg_1, reg_2, jump)
         if self.registers[reg_1] > self.registers[reg_2]:
             self.jump(jump)
@@ -518,7 +505,6 @@ class CPU:
     def conditional_gte(self, reg_1, reg_2, jump):
         """GTE <A> <B> <jump>
         If the value in register A is greater than or equal to the value in register B, jump to position `jump`."""
-        logger.debug(f"GTE {reg_1} {reg_2} {jump}")
         check_logic(reg_1, reg_2, jump)
         if self.registers[reg_1] >= self.registers[reg_2]:
             self.jump(jump)
@@ -526,7 +512,6 @@ class CPU:
     def conditional_lt(self, reg_1, reg_2, jump):
         """LT <A> <B> <jump>
         If the value in register A is less than the value in register B, jump to position `jump`."""
-        logger.debug(f"LT {reg_1} {reg_2} {jump}")
         check_logic(reg_1, reg_2, jump)
         if self.registers[reg_1] < self.registers[reg_2]:
             self.jump(jump)
@@ -534,7 +519,6 @@ class CPU:
     def conditional_lte(self, reg_1, reg_2, jump):
         """LTE <A> <B> <jump>
         If the value in register A is less than or equal to the value in register B, jump to position `jump`."""
-        logger.debug(f"LTE {reg_1} {reg_2} {jump}")
         check_logic(reg_1, reg_2, jump)
         if self.registers[reg_1] <= self.registers[reg_2]:
             self.jump(jump)
@@ -544,7 +528,6 @@ class CPU:
         """SEG <from> <to>
         Convert the value in register `from` to its seven segment representation and place it in register `to`.
         Send an 'X' to clear the screen."""
-        logger.debug(f"SEG {reg_from} {reg_to}")
         check_arithmetic(reg_from, 0, reg_to)
         char = self.registers[reg_from]
         match char:
@@ -590,41 +573,17 @@ class CPU:
     def halt(self):
         self._halt_flag = True
 
-    def _handle(self, opcode: Opcode, operands: list[int]):
-        opcode.run(operands)
-
-        operands = operands[:opcode.width]
-
-        three_operands = ["AND", "OR", "NND", "NOR", "XOR", "ADD", "SUB", "MUL", "MOD", "SHL", "SHR", "MIN", "MAX", "ADO", "MLO"]
-        two_operands = ["NOT", "SEG", "IMM", "CPY"]
-        one_operand = ["INC", "DEC"]
-
-        register = None
-
-        if opcode.value in [o.value for o in self.opcodes if o.assembly in three_operands]:
-            register = operands[2]
-        elif opcode.value in [o.value for o in self.opcodes if o.assembly in two_operands]:
-            register = operands[1]
-        elif opcode.value in [o.value for o in self.opcodes if o.assembly in one_operand]:
-            register = operands[0]
-
-        if register is not None:
-            # SAVE
-            if register == Registers.RAMD:
-                self.ram.save(self.ram_address_register, self.ram_data_register)
-                self._ram_byte_changed = self.ram_address_register
-            elif register == Registers.DATA:
-                self.display.address = self.address_register
-                self.display.data = self.data_register
-                self.display.update()
-            # LOAD
-            elif register == Registers.ADDR:
-                self.data_register = self.display.digits[self.address_register]
-            elif register == Registers.RAMA:
-                self.ram_data_register = self.ram.load(self.ram_address_register)
-            elif register == Registers.STAK:
-                self.ram_data_register = self.ram.load(self.stack_register)
+    def _handle(self, opcode: Opcode, operands: tuple[int, ...]):
+        if opcode.function:
+            opcode.function(*operands)
 
+        if opcode.destination is None:
+            self._register_changed = None
+            return
+        register = operands[opcode.destination]
+        port = self.bus.ports[register]
+        if port is not None:
+            port(self)
         self._register_changed = register
 
     def step(self):
@@ -633,57 +592,261 @@ class CPU:
         if self._halt_flag:
             return
 
-        # Get the current instruction and process it.
-        current_ins = self.rom[self.program_counter]
-        # This is needed because we're genericizing here and we need to not get IndexErrors.
-        extended_rom = self.rom + [0] * MAX_INSTRUCTION_WIDTH
-        # Get the next few values in case they're operands.
-        operands = extended_rom[self.program_counter + 1:self.program_counter + 1 + MAX_INSTRUCTION_WIDTH]
-        found = False
-        for o in self.opcodes:
-            if o.value != current_ins:
-                continue
-            found = True
+        # Get the current instruction (already decoded at load time) and process it.
+        decoded = self._decoded[self.program_counter]
+        if decoded is None:
+            raise UnknownOpcodeError(self.rom[self.program_counter], self.program_counter)
+        opcode, operands = decoded
 
-            self._handle(o, operands)
+        self._handle(opcode, operands)
 
-            self._last_instruction_size = o.width
-            self._current_instruction = [o.value, *operands]
-            self._current_instruction_string = f"{o.assembly} {' '.join(f"{o:02X}" for o in operands[:o.width -1])}"
-        if not found:
-            raise UnknownOpcodeError(current_ins, self.program_counter)
+        self._last_instruction_size = opcode.width
+        self._current_instruction = (opcode.value, *operands)
 
         # If we just jumped, we don't need to increment the program counter.
         if not self._just_jumped:
             self.program_counter += self._last_instruction_size
         self._just_jumped = False
 
-    def load(self, rom: list[int]):
+    def run(self, max_cycles: int, until_pc: int | None = None, breakpoints: Iterable[int] = (),
+            watch_registers: Iterable[int] = (), watch_ram: Iterable[int] = ()) -> RunResult:
+        """Run until the CPU halts, runs off the end of ROM, or has run `max_cycles` instructions, or:
+        - it gets to `until_pc`, or any address in `breakpoints`,
+        - an instruction changes the value of any register in `watch_registers`,
+        - an instruction changes the value of any RAM address in `watch_ram`.
+        Returns why it stopped and how many cycles it ran.
+
+        Addresses are only checked after an instruction, so running again from a breakpoint carries on past it."""
+        # One byte per ROM address, so checking for a breakpoint is a single index.
+        stops = bytearray(ROM_SIZE)
+        for address in breakpoints:
+            stops[address] = 1
+        if until_pc is not None:
+            stops[until_pc] = 2
+        registers, ram = self.registers, self.ram.state
+        watched_registers = sorted(set(watch_registers))
+        watched_ram = sorted(set(watch_ram))
+        # itemgetter returns a single value or a tuple, either of which compares fine.
+        get_registers = itemgetter(*watched_registers) if watched_registers else None
+        get_ram = itemgetter(*watched_ram) if watched_ram else None
+        watching = get_registers is not None or get_ram is not None
+
+        handle, decoded = self._handle, self._decoded
+        cycles = 0
+        while True:
+            pc = self.program_counter
+            if self._halt_flag:
+                return RunResult(StopReason.HALTED, cycles)
+            if pc >= ROM_SIZE:
+                return RunResult(StopReason.END_OF_ROM, cycles)
+            if cycles >= max_cycles:
+                return RunResult(StopReason.BUDGET, cycles)
+
+            if watching:
+                before_registers = get_registers(registers) if get_registers else None
+                before_ram = get_ram(ram) if get_ram else None
+
+            # The same as `step`, without the call.
+            instruction = decoded[pc]
+            if instruction is None:
+                raise UnknownOpcodeError(self.rom[pc], pc)
+            opcode, operands = instruction
+            handle(opcode, operands)
+            self._last_instruction_size = opcode.width
+            self._current_instruction = (opcode.value, *operands)
+            if self._just_jumped:
+                self._just_jumped = False
+            else:
+                self.program_counter += self._last_instruction_size
+            pc = self.program_counter
+            cycles += 1
+
+            if watching:
+                if get_registers and get_registers(registers) != before_registers:
+                    return RunResult(StopReason.WATCH_REGISTER, cycles)
+                if get_ram and get_ram(ram) != before_ram:
+                    return RunResult(StopReason.WATCH_RAM, cycles)
+            if pc < ROM_SIZE and stops[pc]:
+                return RunResult(StopReason.UNTIL_PC if stops[pc] == 2 else StopReason.BREAKPOINT, cycles)
+
+    def _decode(self):
+        """Pre-decode every ROM address into its opcode and operands."""
+        # This is needed because we're genericizing here and we need to not get IndexErrors.
+        extended_rom = bytes(self.rom) + bytes(MAX_INSTRUCTION_WIDTH)
+        decoded: list[tuple[Opcode, tuple[int, ...]] | None] = []
+        for pc, value in enumerate(self.rom):
+            opcode = self._dispatch[value]
+            if opcode is None:
+                decoded.append(None)
+            else:
+                for instrument in self._instruments:
+                    opcode = instrument.wrap(self, pc, opcode)
+                decoded.append((opcode, tuple(extended_rom[pc + 1:pc + opcode.width])))
+        self._decoded = decoded
+
+    def connect(self, device: Device):
+        """Put `device` on the bus, so writing to its ports runs it. Raises `PortInUseError` if another device has one of them.
+
+        Only the RAM and display are in snapshots and the journal, and translated code only runs
+        while they're the only devices connected."""
+        self.bus.connect(device)
+
+    def disconnect(self, device: Device):
+        self.bus.disconnect(device)
+
+    def attach(self, instrument):
+        """Wrap every decoded instruction with `instrument.wrap(cpu, pc, opcode) -> Opcode`.
+
+        Instruments are only ever in the decoded table, so once detached they cost nothing."""
+        self._instruments.append(instrument)
+        self._decode()
+
+    def detach(self, instrument):
+        self._instruments.remove(instrument)
+        self._decode()
+
+    def start_profiling(self, profiler: Profiler | None = None) -> Profiler:
+        """Start counting instructions (into `profiler`, if given). Returns the profiler."""
+        if self.profiler is not None:
+            self.detach(self.profiler)
+        self.profiler = profiler or Profiler()
+        self.attach(self.profiler)
+        return self.profiler
+
+    def stop_profiling(self) -> Profiler | None:
+        """Stop counting instructions. Returns the profiler, which keeps its counts."""
+        profiler = self.profiler
+        if profiler is not None:
+            self.detach(profiler)
+        self.profiler = None
+        return profiler
+
+    def start_tracing(self, capacity: int = DEFAULT_CAPACITY, path: str | Path | None = None) -> TraceRecorder:
+        """Start recording every instruction run: the last `capacity` in memory, and all of them to
+        `path`, if given. Returns the recorder."""
+        self.stop_tracing()
+        self.recorder = TraceRecorder(capacity, path)
+        self.attach(self.recorder)
+        return self.recorder
+
+    def stop_tracing(self) -> TraceRecorder | None:
+        """Stop recording, and finish writing the trace file. Returns the recorder, which keeps its ring buffer."""
+        recorder = self.recorder
+        if recorder is not None:
+            self.detach(recorder)
+            recorder.close(self)
+        self.recorder = None
+        return recorder
+
+    def start_journal(self, depth: int = DEFAULT_DEPTH, interval: int = CHECKPOINT_INTERVAL) -> Journal:
+        """Start keeping an undo history of the last `depth` instructions, so `step_back` works.
+        A full snapshot is kept every `interval` instructions. Returns the journal."""
+        self.stop_journal()
+        self.journal = Journal(depth, interval)
+        self.attach(self.journal)
+        return self.journal
+
+    def stop_journal(self) -> Journal | None:
+        """Stop keeping an undo history."""
+        journal = self.journal
+        if journal is not None:
+            self.detach(journal)
+        self.journal = None
+        return journal
+
+    def step_back(self, n: int = 1) -> int:
+        """Undo the last `n` instructions. Returns how many were undone, which is fewer if the history runs out."""
+        if self.journal is None:
+            return 0
+        n = min(n, self.journal.available)
+        if n > 0:
+            self.journal.rewind(self, self.journal.count - n)
+        return n
+
+    def run_back_to(self, pc: int) -> bool:
+        """Undo instructions until the last time the program counter was `pc`.
+        Returns False (and changes nothing) if that isn't in the history."""
+        if self.journal is None:
+            return False
+        target = self.journal.find(pc)
+        if target is None:
+            return False
+        self.journal.rewind(self, target)
+        return True
+
+    def load(self, rom: list[int] | bytes):
         """Load a program from a list of bytes."""
-        self.rom = [0] * ROM_SIZE
-        for n, i in enumerate(rom):
-            self.rom[n] = i
-
-    def load_string(self, s: str):
-        """Load an assembly program from string."""
-        instructions = assemble(s, self.opcodes)
-        self.load(instructions)
+        if len(rom) > ROM_SIZE:
+            raise ROMTooLargeError(len(rom))
+        self.rom[:] = bytes(ROM_SIZE)
+        try:
+            self.rom[:len(rom)] = rom
+        except ValueError:
+            raise IntegerOverflowError(next(b for b in rom if not 0 <= b < MAX_INT)) from None
+        self.assembly = None
+        if self.journal is not None:
+            self.journal.clear()
+        self._decode()
+
+    def load_string(self, s: str, cache: bool = True):
+        """Load an assembly program from string.
+
+        Unless `cache` is False, programs that have been assembled before are read back from the
+        on-disk assembly cache instead (see `digicpu.core.cache`)."""
+        assembly = assemble_cached(s, self.opcodes) if cache else assemble_program(s, self.opcodes)
+        self.load(assembly.rom)
+        self.assembly = assembly
+
+    def load_file(self, path: str | Path, cache: bool = True):
+        """Load a program from a file: a raw ROM image if it's a `.bin` (like the window's dump), otherwise assembly."""
+        path = Path(path)
+        if path.suffix.lower() != ".bin":
+            self.load_string(path.read_text(), cache)
+            return
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > ROM_SIZE:
+                raise ROMTooLargeError(size)
+            if size == 0:
+                # mmap can't map an empty file.
+                self.load(b"")
+                return
+            with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as image:
+                self.load(image[:])
 
     def reset(self, hard = False):
         """Clear the resgisters and start at the beginning of the program."""
         self.program_counter = 0
         self._halt_flag = False
-        for v in range(len(self.registers)):
-            self.registers[v] = 0
+        self.registers[:] = bytes(len(self.registers))
         self.busy_flag = False
         self.negative_flag = False
         self.overflow_flag = False
         self.zero_flag = False
-        self.display.reset()
+        self.bus.reset(hard)
+        if self.journal is not None:
+            self.journal.clear()
 
         if hard:
             self._ram_byte_changed = None
-            self.ram.write(0, [0] * RAM_SIZE)
+
+    def snapshot(self) -> bytes:
+        """Save the whole machine state (everything but the ROM itself) as a compact blob."""
+        return snapshot.pack(self)
+
+    def restore(self, blob: bytes, check_rom: bool = True):
+        """Restore a state saved with `snapshot()`. The same ROM needs to be loaded, unless `check_rom` is False."""
+        snapshot.unpack_into(self, blob, check_rom)
+        if self.journal is not None:
+            self.journal.clear()
+
+    def save_snapshot(self, path: str | Path):
+        """Save a snapshot to a file."""
+        snapshot.write(path, self.snapshot())
+
+    def load_snapshot(self, path: str | Path, check_rom: bool = True):
+        """Restore a snapshot from a file."""
+        self.restore(snapshot.read(path), check_rom)
 
     def input(self, value: int):
         """Set the input register to `value.`"""
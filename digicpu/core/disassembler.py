@@ -0,0 +1,150 @@
+"""Turns ROM back into assembly.
+
+There are two ways to tell code from data:
+- `linear_sweep` decodes every instruction from the start of ROM to the end, one after another.
+  Bytes that aren't an opcode (or an instruction cut off by the end of ROM) are data.
+- `recursive_descent` starts at the entry point and only follows where execution can go:
+  falling through to the next instruction, and the target of every jump. Anything it never
+  reaches is data. `JMR` jumps to an address in a register, which it can't follow.
+
+Either way, every jump target that starts an instruction gets a label, and `listing` writes it
+all out as source that assembles back to the same ROM.
+"""
+
+from collections.abc import Mapping
+from typing import NamedTuple
+
+from digicpu.core.opcode import BY_VALUE, Opcode, Operand
+
+# Execution never falls through these to the next instruction.
+ENDS = {"JMP", "JMR", "HLT"}
+# Data bytes per line of a listing.
+DATA_WIDTH = 8
+
+
+class Line(NamedTuple):
+    address: int
+    # None for data, in which case `operands` is the bytes.
+    opcode: Opcode | None
+    operands: tuple[int, ...]
+
+    @property
+    def size(self) -> int:
+        return len(self.operands) + (self.opcode is not None)
+
+    @property
+    def targets(self) -> tuple[int, ...]:
+        """Where this instruction can jump to."""
+        if self.opcode is None:
+            return ()
+        return tuple(value for kind, value in zip(self.opcode.operands, self.operands) if kind is Operand.JUMP)
+
+    @property
+    def falls_through(self) -> bool:
+        return self.opcode is not None and self.opcode.assembly not in ENDS
+
+
+def decode(rom: bytes, address: int, opcodes: Mapping[int, Opcode]) -> Line | None:
+    """The instruction at `address`, or None if there isn't a whole one there."""
+    opcode = opcodes.get(rom[address])
+    if opcode is None or address + opcode.width > len(rom):
+        return None
+    return Line(address, opcode, tuple(rom[address + 1:address + opcode.width]))
+
+
+def _data(rom: bytes, start: int, end: int) -> list[Line]:
+    return [Line(a, None, tuple(rom[a:min(a + DATA_WIDTH, end)])) for a in range(start, end, DATA_WIDTH)]
+
+
+def _fill(rom: bytes, lines: list[Line]) -> list[Line]:
+    """`lines` in address order, with the gaps between them filled in as data."""
+    filled: list[Line] = []
+    address = 0
+    for line in sorted(lines):
+        filled += _data(rom, address, line.address)
+        filled.append(line)
+        address = line.address + line.size
+    filled += _data(rom, address, len(rom))
+    return filled
+
+
+def linear_sweep(rom: bytes | bytearray | list[int], opcodes: Mapping[int, Opcode] = BY_VALUE) -> list[Line]:
+    """Decode `rom` from start to finish."""
+    rom = bytes(rom)
+    lines: list[Line] = []
+    address = 0
+    while address < len(rom):
+        line = decode(rom, address, opcodes)
+        if line is None:
+            address += 1
+        else:
+            lines.append(line)
+            address += line.size
+    return _fill(rom, lines)
+
+
+def recursive_descent(rom: bytes | bytearray | list[int], opcodes: Mapping[int, Opcode] = BY_VALUE,
+                      entry_points: tuple[int, ...] = (0,)) -> list[Line]:
+    """Decode only what can run, starting from `entry_points`."""
+    rom = bytes(rom)
+    # Addresses already covered by an instruction, so code that jumps into the middle of another one isn't decoded twice.
+    covered = bytearray(len(rom))
+    lines: list[Line] = []
+    pending = [a for a in entry_points if a < len(rom)]
+    while pending:
+        address = pending.pop()
+        while address < len(rom) and not covered[address]:
+            line = decode(rom, address, opcodes)
+            if line is None or any(covered[address:address + line.size]):
+                break
+            covered[address:address + line.size] = b"\x01" * line.size
+            lines.append(line)
+            pending.extend(t for t in line.targets if t < len(rom))
+            if not line.falls_through:
+                break
+            address += line.size
+    return _fill(rom, lines)
+
+
+def labels(lines: list[Line]) -> dict[int, str]:
+    """A name for every jump target that starts an instruction."""
+    starts = {line.address for line in lines if line.opcode is not None}
+    targets = sorted({t for line in lines for t in line.targets} & starts)
+    return {address: f"L{address:02X}" for address in targets}
+
+
+def _trim(lines: list[Line]) -> list[Line]:
+    """Drop the NOPs and zeros at the end, since the rest of ROM is zeros anyway."""
+    targets = {t for line in lines for t in line.targets}
+    end = len(lines)
+    while end and not any(lines[end - 1].operands) and (lines[end - 1].opcode is None or lines[end - 1].opcode.value == 0):
+        if lines[end - 1].address in targets:
+            break
+        end -= 1
+    lines = lines[:end]
+    if lines and lines[-1].opcode is None:
+        last = lines[-1]
+        data = bytes(last.operands).rstrip(b"\x00")
+        lines[-1] = last._replace(operands = tuple(data))
+    return lines
+
+
+def listing(lines: list[Line], addresses: bool = True) -> str:
+    """`lines` as assembly source, with labels. Addresses are in comments, unless `addresses` is False."""
+    names = labels(lines)
+    out: list[str] = []
+    for line in _trim(lines):
+        if line.address in names:
+            out.append(f"LABEL {names[line.address]}")
+        if line.opcode is None:
+            text = " ".join(f"0x{b:02X}" for b in line.operands)
+        else:
+            text = line.opcode.format(line.operands, names)
+        out.append(f"    {text:<24} # {line.address:02X}" if addresses else f"    {text}")
+    return "\n".join(out)
+
+
+def disassemble(rom: bytes | bytearray | list[int], recursive: bool = True, opcodes: Mapping[int, Opcode] = BY_VALUE) -> str:
+    """`rom` as assembly source that assembles back to it."""
+    lines = recursive_descent(rom, opcodes) if recursive else linear_sweep(rom, opcodes)
+    return listing(lines)
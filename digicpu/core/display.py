@@ -1,12 +1,42 @@
-class SevenSegmentDisplay:
+from typing import TYPE_CHECKING
+
+from digicpu.core.bus import Device, Port
+from digicpu.lib.types import Registers
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+
+class SevenSegmentDisplay(Device):
+    __slots__ = ("address", "data", "digits")
+    # A write only latches the address and data and stores the digit; the copy a front end draws
+    # is made in `sample`.
+    lazy = True
+
     def __init__(self):
         self.address: int = 0
         self.data: int = 0
 
-        self.digits = [0] * 8
+        self.digits = bytearray(8)
+
+    def ports(self) -> dict[int, Port]:
+        return {Registers.DATA: self._store, Registers.ADDR: self._load}
+
+    # SAVE
+    def _store(self, cpu: "CPU"):
+        self.address = cpu.address_register
+        self.data = cpu.data_register
+        self.digits[self.address] = self.data
+
+    # LOAD
+    def _load(self, cpu: "CPU"):
+        cpu.data_register = self.digits[cpu.address_register]
 
     def update(self):
         self.digits[self.address] = self.data
 
-    def reset(self):
-        self.digits = [0] * 8
+    def reset(self, hard: bool = False):
+        self.digits[:] = bytes(len(self.digits))
+
+    def sample(self) -> bytes:
+        return bytes(self.digits)
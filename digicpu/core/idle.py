@@ -0,0 +1,87 @@
+"""Spotting a program that's stuck in a loop, so runners can skip ahead instead of running it.
+
+A CPU is deterministic: once its whole state (program counter, registers, flags, RAM and
+display) comes round to exactly what it was `period` cycles ago, it will keep going round that
+same loop until something outside changes it, which for a running program means the input
+register. A spin (`JMP LOOP`), a busy-wait on input, or a loop that keeps rewriting the same RAM
+all end up like this.
+
+`LoopDetector` finds them with Brent's cycle detection: it saves the state every so often (at
+doubling intervals, up to `max_period` cycles) and checks whether the CPU gets back to it. The
+cheap checks go first, so RAM is only compared once the program counter, registers and flags
+already match.
+"""
+
+from typing import TYPE_CHECKING
+
+from digicpu.lib.types import Registers
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+MAX_PERIOD = 1_024
+
+
+class LoopDetector:
+    def __init__(self, max_period: int = MAX_PERIOD):
+        self.max_period = max_period
+        self.reset()
+
+    def reset(self):
+        """Forget everything, for when the CPU's state was changed from outside."""
+        # Cycles observed so far, as counted by the runner.
+        self.cycles = 0
+        # The length of the loop, once one's been found, and the cycle it was found at.
+        self.period: int | None = None
+        self.found_at: int | None = None
+        self._input = 0
+        # The saved state, and the cycle count when the next one is due.
+        self.pc = -1
+        self.due = 1
+        self._power = 1
+        self._saved_at = 0
+        self._registers = b""
+        self._flags: tuple[bool, ...] = ()
+        self._ram = b""
+        self._display: tuple = ()
+
+    @property
+    def looping(self) -> bool:
+        """Whether the CPU is known to be stuck. Changing the input register frees it."""
+        return self.period is not None
+
+    def still_looping(self, cpu: "CPU") -> bool:
+        if self.period is not None and cpu.registers[Registers.INPT] != self._input:
+            self.reset()
+        return self.period is not None
+
+    def observe(self, cpu: "CPU", cycles: int) -> bool:
+        """Look at `cpu` after `cycles` cycles. Returns True if it's come back to a saved state."""
+        if cpu.program_counter == self.pc and self._same(cpu):
+            self.period = cycles - self._saved_at
+            self.found_at = cycles
+            self._input = cpu.registers[Registers.INPT]
+            return True
+        if cycles >= self.due:
+            self._save(cpu, cycles)
+        return False
+
+    def _flags_of(self, cpu: "CPU") -> tuple[bool, ...]:
+        return (cpu.negative_flag, cpu.zero_flag, cpu.overflow_flag, cpu.busy_flag, cpu._halt_flag)
+
+    def _display_of(self, cpu: "CPU") -> tuple:
+        return (bytes(cpu.display.digits), cpu.display.address, cpu.display.data)
+
+    def _same(self, cpu: "CPU") -> bool:
+        return (cpu.registers == self._registers and self._flags_of(cpu) == self._flags
+                and cpu.ram.state == self._ram and self._display_of(cpu) == self._display)
+
+    def _save(self, cpu: "CPU", cycles: int):
+        self.pc = cpu.program_counter
+        self._saved_at = cycles
+        self._registers = bytes(cpu.registers)
+        self._flags = self._flags_of(cpu)
+        self._ram = bytes(cpu.ram.state)
+        self._display = self._display_of(cpu)
+        self._power = min(self._power * 2, self.max_period)
+        self.due = cycles + self._power
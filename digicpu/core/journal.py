@@ -0,0 +1,175 @@
+"""An undo history, so a CPU can be stepped backwards.
+
+A `Journal` is attached with `CPU.start_journal()`. Before each instruction runs, it saves just
+the bytes that instruction is about to overwrite into a fixed-width entry in a ring buffer:
+
+    pc               B
+    flags            B   N/Z/O/halt (bit 0 upwards)
+    3 x register     BB  register number (0xFF if unused) and its old value
+    memory           BBB kind (none/RAM/display digit), address, old byte
+    display          BB  the display's old address and data latches
+    input            B   the input register, which can change between instructions
+
+Undoing an entry puts all of that back. Every `interval` instructions it also takes a full
+snapshot, so going back a long way restores the nearest snapshot after the target and only
+undoes the entries between the two, rather than every entry since.
+"""
+
+import struct
+from collections import deque
+from typing import TYPE_CHECKING
+
+from digicpu.core import snapshot
+from digicpu.core.opcode import Opcode
+from digicpu.lib.types import MAX_REG, Registers
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+ENTRY = struct.Struct("<14B")
+
+DEFAULT_DEPTH = 65_536
+CHECKPOINT_INTERVAL = 1_024
+
+NO_REGISTER = 0xFF
+NEGATIVE = 1 << 0
+ZERO = 1 << 1
+OVERFLOW = 1 << 2
+HALT = 1 << 3
+
+NO_MEMORY = 0
+RAM = 1
+DIGIT = 2
+
+# Registers that load something into another register when they're written.
+_LOADS = {Registers.RAMA: Registers.RAMD, Registers.STAK: Registers.RAMD, Registers.ADDR: Registers.DATA}
+
+
+class Journal:
+    # Skipping round an idle loop leaves the CPU exactly where it would have been, so every entry
+    # still undoes to a state the program really passed through (see `headless.run`).
+    allows_fast_forward = True
+
+    def __init__(self, depth: int = DEFAULT_DEPTH, interval: int = CHECKPOINT_INTERVAL):
+        self.depth = depth
+        self.interval = interval
+        self.buffer = bytearray(depth * ENTRY.size)
+        # Instructions run since the journal was cleared, and the oldest of those we can still go back to.
+        self.count = 0
+        self.start = 0
+        # (count, snapshot) pairs, oldest first.
+        self.checkpoints: deque[tuple[int, bytes]] = deque()
+
+    def clear(self):
+        self.count = 0
+        self.start = 0
+        self.checkpoints.clear()
+
+    @property
+    def available(self) -> int:
+        """How many instructions can be undone."""
+        return self.count - self.start
+
+    def wrap(self, cpu: "CPU", pc: int, opcode: Opcode) -> Opcode:
+        """An opcode that saves what it's about to overwrite, then runs `opcode`."""
+        f = opcode.function
+        destination = opcode.destination
+        overflows = Registers.OVFL in opcode.also_writes
+        registers, ram, display = cpu.registers, cpu.ram.state, cpu.display
+
+        def run(*args):
+            count = self.count
+            if count % self.interval == 0:
+                self._checkpoint(cpu)
+
+            flags = ((NEGATIVE if cpu.negative_flag else 0) | (ZERO if cpu.zero_flag else 0)
+                     | (OVERFLOW if cpu.overflow_flag else 0) | (HALT if cpu._halt_flag else 0))
+            r1 = r2 = r3 = NO_REGISTER
+            old1 = old2 = old3 = 0
+            memory = address = old = 0
+            if destination is not None and args[destination] <= MAX_REG:
+                r1 = args[destination]
+                old1 = registers[r1]
+                if r1 in _LOADS:
+                    r2 = _LOADS[r1]
+                    old2 = registers[r2]
+                elif r1 == Registers.RAMD:
+                    memory, address = RAM, registers[Registers.RAMA]
+                    old = ram[address]
+                elif r1 == Registers.DATA and (address := registers[Registers.ADDR]) < len(display.digits):
+                    memory = DIGIT
+                    old = display.digits[address]
+                if overflows:
+                    r3 = Registers.OVFL
+                    old3 = registers[r3]
+
+            ENTRY.pack_into(self.buffer, (count % self.depth) * ENTRY.size, pc, flags, r1, old1, r2, old2, r3, old3,
+                            memory, address, old, display.address, display.data, registers[Registers.INPT])
+            self.count = count = count + 1
+            if count - self.start > self.depth:
+                self.start = count - self.depth
+                while self.checkpoints and self.checkpoints[0][0] < self.start:
+                    self.checkpoints.popleft()
+            if f:
+                try:
+                    f(*args)
+                except Exception:
+                    # It faulted without running, so there's nothing for this entry to undo.
+                    self.count -= 1
+                    raise
+        return opcode.with_function(run)
+
+    def _checkpoint(self, cpu: "CPU"):
+        if self.checkpoints and self.checkpoints[-1][0] == self.count:
+            self.checkpoints.pop()
+        self.checkpoints.append((self.count, snapshot.pack(cpu)))
+
+    def _undo(self, cpu: "CPU"):
+        self.count -= 1
+        (pc, flags, r1, old1, r2, old2, r3, old3, memory, address, old,
+         display_address, display_data, input_value) = ENTRY.unpack_from(self.buffer, (self.count % self.depth) * ENTRY.size)
+        registers = cpu.registers
+        if memory == RAM:
+            cpu.ram.save(address, old)
+        elif memory == DIGIT:
+            cpu.display.digits[address] = old
+        for register, value in ((r3, old3), (r2, old2), (r1, old1)):
+            if register != NO_REGISTER:
+                registers[register] = value
+        registers[Registers.INPT] = input_value
+        cpu.display.address = display_address
+        cpu.display.data = display_data
+        cpu.program_counter = pc
+        cpu.negative_flag = bool(flags & NEGATIVE)
+        cpu.zero_flag = bool(flags & ZERO)
+        cpu.overflow_flag = bool(flags & OVERFLOW)
+        cpu._halt_flag = bool(flags & HALT)
+
+    def rewind(self, cpu: "CPU", target: int):
+        """Put `cpu` back how it was before instruction number `target` ran."""
+        if not self.start <= target <= self.count:
+            raise ValueError(f"Can't rewind to instruction {target} (history covers {self.start} to {self.count})!")
+
+        # Start from the nearest checkpoint after the target, if that's any closer than where we are.
+        for count, blob in self.checkpoints:
+            if target <= count < self.count:
+                snapshot.unpack_into(cpu, blob, check_rom = False)
+                self.count = count
+                break
+        while self.count > target:
+            self._undo(cpu)
+        while self.checkpoints and self.checkpoints[-1][0] > target:
+            self.checkpoints.pop()
+
+        cpu._just_jumped = False
+        cpu._register_changed = None
+        cpu._ram_byte_changed = None
+        cpu._last_instruction_size = 0
+        cpu._current_instruction = ()
+
+    def find(self, pc: int) -> int | None:
+        """The most recent instruction number that ran at `pc`, if it's still in the history."""
+        for count in range(self.count - 1, self.start - 1, -1):
+            if self.buffer[(count % self.depth) * ENTRY.size] == pc:
+                return count
+        return None
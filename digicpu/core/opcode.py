@@ -1,20 +1,121 @@
-from collections.abc import Callable
+from collections.abc import Callable, Mapping, Sequence
+from enum import Enum
 from typing import Optional
 
+from digicpu.lib.types import MAX_REG, Registers
+
+
+class Operand(Enum):
+    # A register that's read.
+    REGISTER = "register"
+    # A register that's written; writing some registers has memory-mapped side effects (see `CPU._handle`).
+    DESTINATION = "destination"
+    IMMEDIATE = "immediate"
+    # A ROM address to jump to.
+    JUMP = "jump"
+
 
 class Opcode:
-    def __init__(self, value: int, assembly: str, func: Optional[Callable] = None):
+    __slots__ = ("value", "assembly", "function", "handler", "operands", "reads", "writes", "also_writes", "destination")
+
+    def __init__(self, value: int, assembly: str, func: Optional[Callable] = None, *, handler: str | None = None,
+                 operands: tuple[Operand, ...] = (), reads: str = "", writes: str = "", also_writes: tuple[int, ...] = ()):
         self.value = value
         self.assembly = assembly
         self.function = func
+        # The name of the `CPU` method that runs this opcode.
+        self.handler = handler
+        self.operands = operands
+        # Flags read and written, as letters: N(egative), Z(ero), O(verflow).
+        self.reads = reads
+        self.writes = writes
+        # Registers written that aren't operands.
+        self.also_writes = also_writes
+        # Which operand is the destination register, if any.
+        self.destination = operands.index(Operand.DESTINATION) if Operand.DESTINATION in operands else None
 
     @property
     def width(self) -> int:
         # Instruction size is encoded with the first 2 bits of the opcode.
         return ((self.value & 0b11000000) >> 6) + 1
 
+    def with_function(self, func: Optional[Callable]) -> "Opcode":
+        """The same opcode, run by `func` instead."""
+        return Opcode(self.value, self.assembly, func, handler = self.handler, operands = self.operands,
+                      reads = self.reads, writes = self.writes, also_writes = self.also_writes)
+
+    def format(self, operands: Sequence[int], labels: Mapping[int, str] | None = None) -> str:
+        """This instruction as assembly, e.g. `IMM 5 GP0` or `JMP 0x1A`, which assembles back to the same bytes.
+        Jumps to an address in `labels` use the label's name instead."""
+        parts = [self.assembly]
+        for kind, value in zip(self.operands, operands):
+            if kind in (Operand.REGISTER, Operand.DESTINATION) and value <= MAX_REG:
+                parts.append(Registers(value).name)
+            elif kind is Operand.JUMP:
+                parts.append(labels[value] if labels and value in labels else f"0x{value:02X}")
+            else:
+                parts.append(str(value))
+        return " ".join(parts)
+
     def run(self, args: list[int]) -> None:
         if not self.function:
             return
         args = args[:self.width - 1]
         self.function(*args)
+
+
+R = Operand.REGISTER
+D = Operand.DESTINATION
+I = Operand.IMMEDIATE  # noqa: E741
+J = Operand.JUMP
+
+# Every opcode the CPU knows, and what it does. `CPU` binds each to its `handler` method.
+OPCODES = [
+    Opcode(0x00, "NOP"),
+    Opcode(0x81, "IMM", handler = "immediate", operands = (I, D)),
+    Opcode(0x07, "HLT", handler = "halt"),
+    Opcode(0x91, "CPY", handler = "copy", operands = (R, D)),
+    Opcode(0x08, "CLF", handler = "clear_flags", writes = "NZO"),
+    Opcode(0x09, "CNF", handler = "clear_negative_flag", writes = "N"),
+    Opcode(0x0A, "CZF", handler = "clear_zero_flag", writes = "Z"),
+    Opcode(0x0B, "COF", handler = "clear_overflow_flag", writes = "O"),
+    Opcode(0x49, "JNF", handler = "jump_if_negative_flag", operands = (J,), reads = "N"),
+    Opcode(0x4D, "JNN", handler = "jump_if_not_negative_flag", operands = (J,), reads = "N"),
+    Opcode(0x4A, "JZF", handler = "jump_if_zero_flag", operands = (J,), reads = "Z"),
+    Opcode(0x4E, "JNZ", handler = "jump_if_not_zero_flag", operands = (J,), reads = "Z"),
+    Opcode(0x4B, "JOF", handler = "jump_if_overflow_flag", operands = (J,), reads = "O"),
+    Opcode(0x4F, "JNO", handler = "jump_if_not_overflow_flag", operands = (J,), reads = "O"),
+    Opcode(0xF1, "EQ",  handler = "conditional_eq", operands = (R, R, J)),
+    Opcode(0xF2, "LT",  handler = "conditional_lt", operands = (R, R, J)),
+    Opcode(0xF3, "LTE", handler = "conditional_lte", operands = (R, R, J)),
+    Opcode(0xF5, "NEQ", handler = "conditional_neq", operands = (R, R, J)),
+    Opcode(0xF6, "GTE", handler = "conditional_gte", operands = (R, R, J)),
+    Opcode(0xF7, "GT",  handler = "conditional_gt", operands = (R, R, J)),
+    Opcode(0xE0, "NND", handler = "logical_nand", operands = (R, R, D), writes = "Z"),
+    Opcode(0xE1, "OR",  handler = "logical_or", operands = (R, R, D), writes = "Z"),
+    Opcode(0xE2, "AND", handler = "logical_and", operands = (R, R, D), writes = "Z"),
+    Opcode(0xE3, "NOR", handler = "logical_nor", operands = (R, R, D), writes = "Z"),
+    Opcode(0xA4, "NOT", handler = "logical_not", operands = (R, D), writes = "Z"),
+    Opcode(0xE5, "XOR", handler = "logical_xor", operands = (R, R, D), writes = "Z"),
+    Opcode(0x71, "JMP", handler = "jump", operands = (J,)),
+    # The register holds the address to jump to.
+    Opcode(0x75, "JMR", handler = "jump_register", operands = (R,)),
+    Opcode(0x68, "INC", handler = "increment", operands = (D,), writes = "ZO"),
+    Opcode(0x69, "DEC", handler = "decrement", operands = (D,), writes = "NZ"),
+    Opcode(0xE8, "ADD", handler = "add", operands = (R, R, D), writes = "ZO"),
+    Opcode(0xE9, "SUB", handler = "sub", operands = (R, R, D), writes = "NZ"),
+    Opcode(0xEA, "MUL", handler = "multiply", operands = (R, R, D), writes = "ZO"),
+    Opcode(0xEB, "MOD", handler = "modulo", operands = (R, R, D), writes = "Z"),
+    Opcode(0xEC, "SHL", handler = "shift_left", operands = (R, R, D), writes = "Z"),
+    Opcode(0xED, "SHR", handler = "shift_right", operands = (R, R, D), writes = "Z"),
+    Opcode(0xEE, "MIN", handler = "minimum", operands = (R, R, D), writes = "Z"),
+    Opcode(0xEF, "MAX", handler = "maximum", operands = (R, R, D), writes = "Z"),
+    Opcode(0x5C, "PSH", handler = "push", operands = (R,)),
+    Opcode(0x5D, "POP", handler = "pop", operands = (R,)),
+    Opcode(0xBF, "SEG", handler = "int_to_sevenseg", operands = (R, D)),
+    Opcode(0xF8, "ADO", handler = "add_with_overflow", operands = (R, R, D), writes = "ZO", also_writes = (Registers.OVFL,)),
+    Opcode(0xFA, "MLO", handler = "multiply_with_overflow", operands = (R, R, D), writes = "ZO", also_writes = (Registers.OVFL,)),
+]
+
+BY_MNEMONIC = {o.assembly: o for o in OPCODES}
+BY_VALUE = {o.value: o for o in OPCODES}
@@ -0,0 +1,128 @@
+"""Count where a program spends its cycles.
+
+A `Profiler` is attached to a CPU with `CPU.start_profiling()`, which wraps the decoded
+instruction at every ROM address with a counter. Nothing is wrapped while it's detached, so a
+CPU that isn't being profiled runs exactly the same code as one that never was.
+"""
+
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from digicpu.core.assembler import Assembly
+from digicpu.core.opcode import Opcode
+from digicpu.lib.types import ROM_SIZE
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+# Instructions that might or might not jump.
+CONDITIONALS = {"EQ", "NEQ", "LT", "LTE", "GT", "GTE", "JNF", "JNN", "JZF", "JNZ", "JOF", "JNO"}
+BRANCHES = CONDITIONALS | {"JMP", "JMR"}
+
+
+class Profiler:
+    def __init__(self):
+        # Per ROM address.
+        self.counts = [0] * ROM_SIZE
+        self.taken = [0] * ROM_SIZE
+        self.mnemonics: list[str | None] = [None] * ROM_SIZE
+
+    def reset(self):
+        self.counts[:] = [0] * ROM_SIZE
+        self.taken[:] = [0] * ROM_SIZE
+
+    def wrap(self, cpu: "CPU", pc: int, opcode: Opcode) -> Opcode:
+        """An opcode that counts itself at `pc`, then runs `opcode`."""
+        self.mnemonics[pc] = opcode.assembly
+        counts, taken, f = self.counts, self.taken, opcode.function
+
+        if opcode.assembly in BRANCHES:
+            def run(*args):
+                counts[pc] += 1
+                f(*args)
+                if cpu._just_jumped:
+                    taken[pc] += 1
+        elif f is None:
+            def run(*args):
+                counts[pc] += 1
+        else:
+            def run(*args):
+                counts[pc] += 1
+                f(*args)
+        return opcode.with_function(run)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def by_opcode(self) -> Counter[str]:
+        """Executions per mnemonic."""
+        c: Counter[str] = Counter()
+        for pc, n in enumerate(self.counts):
+            if n:
+                c[self.mnemonics[pc]] += n
+        return c
+
+    def branches(self) -> dict[int, tuple[int, int]]:
+        """ROM address -> (taken, not taken), for every conditional that ran."""
+        return {pc: (self.taken[pc], n - self.taken[pc]) for pc, n in enumerate(self.counts)
+                if n and self.mnemonics[pc] in CONDITIONALS}
+
+    def report(self, assembly: Assembly | None = None, source: str | None = None, top: int | None = None) -> str:
+        """A table of the hottest addresses, labelled with where they came from in the source if
+        `assembly` (and for the source text, `source`) is given."""
+        total = self.total or 1
+        lines = source.splitlines() if source is not None else []
+        branches = self.branches()
+
+        out = [f"{self.total} instructions", "",
+               f"{'ADDR':<4}  {'COUNT':>8}  {'%':>7}  {'INSTRUCTION':<11}  {'BRANCH':<16}  WHERE"]
+        hot = sorted((pc for pc, n in enumerate(self.counts) if n), key = lambda pc: -self.counts[pc])
+        for pc in hot[:top]:
+            n = self.counts[pc]
+            branch = f"{branches[pc][0]} taken/{branches[pc][1]} not" if pc in branches else ""
+            where = ""
+            if assembly is not None:
+                where = _label_for(assembly, pc)
+                if pc in assembly.source_map:
+                    line, _ = assembly.source_map[pc]
+                    where += f" line {line}"
+                    if 0 < line <= len(lines):
+                        where += f": {lines[line - 1].strip()}"
+            out.append(f"{pc:02X}    {n:>8}  {n / total:>7.2%}  {self.mnemonics[pc]:<11}  {branch:<16}  {where}".rstrip())
+
+        out += ["", f"{'OPCODE':<6}  {'COUNT':>8}  {'%':>7}"]
+        for mnemonic, n in self.by_opcode().most_common():
+            out.append(f"{mnemonic:<6}  {n:>8}  {n / total:>7.2%}")
+        return "\n".join(out)
+
+    def collapsed(self, assembly: Assembly | None = None, root: str = "program") -> str:
+        """Counts in collapsed-stack format (`frame;frame count` per line), for flamegraph tools.
+
+        Frames are the program, the label an address falls under, and the instruction."""
+        out = []
+        for pc, n in enumerate(self.counts):
+            if not n:
+                continue
+            frames = [root]
+            if assembly is not None:
+                label = _nearest_label(assembly, pc)
+                frames.append(label[0] if label else "<start>")
+            frames.append(f"{pc:02X} {self.mnemonics[pc]}")
+            out.append(f"{';'.join(frames)} {n}")
+        return "\n".join(out)
+
+
+def _nearest_label(assembly: Assembly, pc: int) -> tuple[str, int] | None:
+    """The closest label at or before `pc`, and its address."""
+    best = None
+    for name, address in assembly.labels.items():
+        if address <= pc and (best is None or address > best[1]):
+            best = (name, address)
+    return best
+
+
+def _label_for(assembly: Assembly, pc: int) -> str:
+    """Where `pc` is relative to the closest label before it, like `LOOP+3`."""
+    name, address = _nearest_label(assembly, pc) or ("<start>", 0)
+    return f"{name}+{pc - address}" if pc != address else name
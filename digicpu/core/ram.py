@@ -1,21 +1,60 @@
-from typing import Sequence
+from typing import TYPE_CHECKING, Sequence
 
+from digicpu.core.bus import Device, Port
+from digicpu.lib.errors import RAMOutOfBoundsError
+from digicpu.lib.types import MAX_INT, Registers
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+
+class RAM(Device):
+    __slots__ = ("size", "state", "dirty")
 
-class RAM:
     def __init__(self, size: int = 256):
         self.size = size
-        self.state = [0] * size
+        self.state = bytearray(size)
+        # Addresses written since the last `take_dirty`, so views can redraw just those bytes.
+        self.dirty: set[int] = set()
+
+    def ports(self) -> dict[int, Port]:
+        return {Registers.RAMD: self._store, Registers.RAMA: self._load, Registers.STAK: self._load_stack}
+
+    def reset(self, hard: bool = False):
+        if hard:
+            self.write(0, bytes(self.size))
+
+    # SAVE
+    def _store(self, cpu: "CPU"):
+        self.save(cpu.ram_address_register, cpu.ram_data_register)
+        cpu._ram_byte_changed = cpu.ram_address_register
+
+    # LOAD
+    def _load(self, cpu: "CPU"):
+        cpu.ram_data_register = self.load(cpu.ram_address_register)
+
+    def _load_stack(self, cpu: "CPU"):
+        cpu.ram_data_register = self.load(cpu.stack_register)
 
     def load(self, pos: int) -> int:
         return self.state[pos % self.size]
 
     def save(self, pos: int, data: int):
-        self.state[pos % self.size] = data
+        pos %= self.size
+        self.state[pos] = data % MAX_INT
+        self.dirty.add(pos)
+
+    def write(self, starting_byte: int, data: Sequence[int] | bytes):
+        end = starting_byte + len(data)
+        if end > self.size:
+            raise RAMOutOfBoundsError(end)
+        self.state[starting_byte:end] = data
+        self.dirty.update(range(starting_byte, end))
 
-    def write(self, starting_byte: int, data: Sequence[int]):
-        for n, px in enumerate(data):
-            i = starting_byte + n
-            self.state[i] = px
+    def read(self, starting_byte: int, width: int) -> bytes:
+        return bytes(self.state[starting_byte:starting_byte + width])
 
-    def read(self, starting_byte: int, width: int) -> Sequence[int]:
-        return self.state[starting_byte:starting_byte + width]
+    def take_dirty(self) -> set[int]:
+        """The addresses written since the last call, clearing them."""
+        dirty, self.dirty = self.dirty, set()
+        return dirty
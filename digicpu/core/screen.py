@@ -0,0 +1,60 @@
+"""A bitmap display device, with its pixels in a NumPy array.
+
+Requires NumPy (`pip install digicpu[screen]`).
+"""
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from digicpu.core.bus import Device, Port
+from digicpu.lib.types import MAX_INT, Register, Registers
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+
+class Screen(Device):
+    """A bitmap display, for `CPU.connect`. Writing to the `color` register plots a pixel at (`x`, `y`).
+
+    Pixel format is XXRRGGBB, where the highest two bits are reserved and unused. Pixels off the
+    edge of the screen are ignored."""
+    __slots__ = ("width", "height", "x", "y", "color", "pixels", "dirty", "_sample")
+    # Plotting only stores the byte; the copy a front end draws is made in `sample`.
+    lazy = True
+
+    def __init__(self, width: int = 16, height: int = 16,
+                 x: Register = Registers.GP5, y: Register = Registers.GP6, color: Register = Registers.GP7):
+        if not (0 < width <= MAX_INT and 0 < height <= MAX_INT):
+            raise ValueError(f"A screen can be at most {MAX_INT}x{MAX_INT}!")
+        self.width = width
+        self.height = height
+        self.x = x
+        self.y = y
+        self.color = color
+        # One XXRRGGBB byte per pixel, by row from the top.
+        self.pixels = np.zeros((height, width), dtype = np.uint8)
+        self.dirty = True
+        self._sample = self.pixels.copy()
+
+    def ports(self) -> dict[int, Port]:
+        return {self.color: self._plot}
+
+    def _plot(self, cpu: "CPU"):
+        registers = cpu.registers
+        x, y = registers[self.x], registers[self.y]
+        if x < self.width and y < self.height:
+            self.pixels[y, x] = registers[self.color]
+            self.dirty = True
+
+    def reset(self, hard: bool = False):
+        self.pixels[:] = 0
+        self.dirty = True
+
+    def sample(self) -> np.ndarray:
+        """A read-only copy of the pixels. It's the same array until the screen changes, so front ends can tell by identity."""
+        if self.dirty:
+            self._sample = self.pixels.copy()
+            self._sample.flags.writeable = False
+            self.dirty = False
+        return self._sample
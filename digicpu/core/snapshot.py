@@ -0,0 +1,90 @@
+"""Packing a CPU's whole machine state into a compact binary blob, and back.
+
+Layout (little-endian):
+    magic        4s  b"DCPU"
+    version      B
+    pc           H
+    flags        B   negative, zero, overflow, halt, busy (bit 0 upwards)
+    registers    15s
+    ram          256s
+    digits       8s
+    display      BB  address, data
+    rom hash     16s blake2b of the ROM the snapshot was taken with
+"""
+
+import hashlib
+import struct
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from digicpu.lib.errors import InvalidSnapshotError
+from digicpu.lib.types import MAX_REG, RAM_SIZE
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+MAGIC = b"DCPU"
+VERSION = 1
+DIGITS = 8
+HASH_SIZE = 16
+
+SNAPSHOT = struct.Struct(f"<4sBHB{MAX_REG + 1}s{RAM_SIZE}s{DIGITS}sBB{HASH_SIZE}s")
+
+NEGATIVE = 1 << 0
+ZERO = 1 << 1
+OVERFLOW = 1 << 2
+HALT = 1 << 3
+BUSY = 1 << 4
+
+
+def rom_hash(rom: bytes | bytearray) -> bytes:
+    return hashlib.blake2b(rom, digest_size = HASH_SIZE).digest()
+
+
+def pack(cpu: "CPU") -> bytes:
+    """Snapshot `cpu`."""
+    flags = ((NEGATIVE if cpu.negative_flag else 0) | (ZERO if cpu.zero_flag else 0)
+             | (OVERFLOW if cpu.overflow_flag else 0) | (HALT if cpu._halt_flag else 0)
+             | (BUSY if cpu.busy_flag else 0))
+    return SNAPSHOT.pack(MAGIC, VERSION, cpu.program_counter, flags, cpu.registers, cpu.ram.state,
+                         cpu.display.digits, cpu.display.address, cpu.display.data, rom_hash(cpu.rom))
+
+
+def unpack_into(cpu: "CPU", blob: bytes, check_rom: bool = True):
+    """Restore `cpu` to the state in `blob`.
+    Unless `check_rom` is False, the snapshot must have been taken with the ROM `cpu` has loaded."""
+    if len(blob) != SNAPSHOT.size:
+        raise InvalidSnapshotError(f"Snapshot is {len(blob)} bytes, expected {SNAPSHOT.size}!")
+    magic, version, pc, flags, registers, ram, digits, address, data, hash_ = SNAPSHOT.unpack(blob)
+    if magic != MAGIC:
+        raise InvalidSnapshotError("Not a DigiCPU snapshot!")
+    if version != VERSION:
+        raise InvalidSnapshotError(f"Unsupported snapshot version {version}!")
+    if check_rom and hash_ != rom_hash(cpu.rom):
+        raise InvalidSnapshotError("Snapshot was taken with a different ROM!")
+
+    cpu.program_counter = pc
+    cpu.negative_flag = bool(flags & NEGATIVE)
+    cpu.zero_flag = bool(flags & ZERO)
+    cpu.overflow_flag = bool(flags & OVERFLOW)
+    cpu._halt_flag = bool(flags & HALT)
+    cpu.busy_flag = bool(flags & BUSY)
+    cpu.registers[:] = registers
+    cpu.ram.write(0, ram)
+    cpu.display.digits[:] = digits
+    cpu.display.address = address
+    cpu.display.data = data
+
+    cpu._just_jumped = False
+    cpu._register_changed = None
+    cpu._ram_byte_changed = None
+    cpu._last_instruction_size = 0
+    cpu._current_instruction = ()
+
+
+def write(path: str | Path, blob: bytes):
+    Path(path).write_bytes(blob)
+
+
+def read(path: str | Path) -> bytes:
+    return Path(path).read_bytes()
@@ -0,0 +1,188 @@
+"""Record every instruction a CPU runs, as fixed-width binary records.
+
+A `TraceRecorder` is attached with `CPU.start_tracing()`. It keeps the last `capacity`
+instructions in a ring buffer, and can also stream every record to a file for runs far too long
+to keep in memory. Each record is 8 bytes:
+
+    pc           B   where the instruction was
+    opcode       B
+    operands     3s  zero-padded
+    register     B   the register the instruction wrote, or 0xFF
+    ram_address  B   the RAM byte it read or wrote, if the RAM_READ/RAM_WRITE bit is set
+    flags        B   N/Z/O before (bits 0-2), after (bits 3-5), RAM_READ (6), RAM_WRITE (7)
+
+A trace file is a short header followed by records; `read` streams them back, and
+`format_record` turns one into a line of disassembly.
+"""
+
+import struct
+from collections.abc import Iterable, Iterator, Mapping
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, NamedTuple
+
+from digicpu.core.opcode import Opcode
+from digicpu.lib.errors import InvalidTraceError
+from digicpu.lib.types import ROM_SIZE, Registers
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+
+RECORD = struct.Struct("<BB3sBBB")
+HEADER = struct.Struct("<4sBB")
+MAGIC = b"DCTR"
+VERSION = 1
+
+DEFAULT_CAPACITY = 65_536
+# How many bytes of records to collect before writing them to the trace file.
+CHUNK_SIZE = 64 * 1024
+
+NO_REGISTER = 0xFF
+NEGATIVE = 1 << 0
+ZERO = 1 << 1
+OVERFLOW = 1 << 2
+FLAGS_AFTER_SHIFT = 3
+RAM_READ = 1 << 6
+RAM_WRITE = 1 << 7
+
+
+class TraceRecord(NamedTuple):
+    pc: int
+    opcode: int
+    operands: bytes
+    register: int | None
+    ram_address: int | None
+    ram_write: bool
+    flags_before: int
+    flags_after: int
+
+    @classmethod
+    def unpack(cls, data: bytes | memoryview, offset: int = 0) -> "TraceRecord":
+        pc, opcode, operands, register, ram_address, flags = RECORD.unpack_from(data, offset)
+        touched = flags & (RAM_READ | RAM_WRITE)
+        return cls(pc, opcode, operands, None if register == NO_REGISTER else register,
+                   ram_address if touched else None, bool(flags & RAM_WRITE),
+                   flags & 0b111, (flags >> FLAGS_AFTER_SHIFT) & 0b111)
+
+
+def _flags(cpu: "CPU") -> int:
+    return (NEGATIVE if cpu.negative_flag else 0) | (ZERO if cpu.zero_flag else 0) | (OVERFLOW if cpu.overflow_flag else 0)
+
+
+class TraceRecorder:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, path: str | Path | None = None):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        # Records written in total, including any that have since fallen out of the ring.
+        self.count = 0
+        # An instruction that has started but whose writeback hasn't happened yet.
+        self._pending: tuple[int, int, bytes, int] | None = None
+        self._file: BinaryIO | None = None
+        self._chunk = bytearray()
+        if path is not None:
+            self._file = open(path, "wb")
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+    def wrap(self, cpu: "CPU", pc: int, opcode: Opcode) -> Opcode:
+        """An opcode that records itself at `pc`, then runs `opcode`."""
+        value, f = opcode.value, opcode.function
+
+        # `CPU._handle` writes back (and touches RAM) after the handler returns, so each record is
+        # finished off when the next instruction starts, or by `flush`.
+        def run(*args):
+            if self._pending is not None:
+                self._complete(cpu)
+            self._pending = (pc, value, bytes(args), _flags(cpu))
+            if f:
+                f(*args)
+        return opcode.with_function(run)
+
+    def _complete(self, cpu: "CPU"):
+        pc, value, operands, flags = self._pending
+        self._pending = None
+        register = cpu._register_changed
+        ram_address = 0
+        if register == Registers.RAMD:
+            ram_address, flags = cpu.registers[Registers.RAMA], flags | RAM_WRITE
+        elif register == Registers.RAMA:
+            ram_address, flags = cpu.registers[Registers.RAMA], flags | RAM_READ
+        elif register == Registers.STAK:
+            ram_address, flags = cpu.registers[Registers.STAK], flags | RAM_READ
+        flags |= _flags(cpu) << FLAGS_AFTER_SHIFT
+
+        offset = (self.count % self.capacity) * RECORD.size
+        RECORD.pack_into(self.buffer, offset, pc, value, operands, NO_REGISTER if register is None else register, ram_address, flags)
+        self.count += 1
+        if self._file is not None:
+            self._chunk += self.buffer[offset:offset + RECORD.size]
+            if len(self._chunk) >= CHUNK_SIZE:
+                self._file.write(self._chunk)
+                self._chunk.clear()
+
+    def flush(self, cpu: "CPU"):
+        """Finish the last instruction's record and write out anything buffered for the file."""
+        if self._pending is not None:
+            self._complete(cpu)
+        if self._file is not None:
+            self._file.write(self._chunk)
+            self._chunk.clear()
+            self._file.flush()
+
+    def close(self, cpu: "CPU"):
+        self.flush(cpu)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def records(self) -> list[TraceRecord]:
+        """What's in the ring buffer, oldest first."""
+        n = min(self.count, self.capacity)
+        start = self.count - n
+        return [TraceRecord.unpack(self.buffer, (i % self.capacity) * RECORD.size) for i in range(start, self.count)]
+
+
+def decode(data: bytes) -> Iterator[TraceRecord]:
+    view = memoryview(data)
+    for offset in range(0, len(data) - len(data) % RECORD.size, RECORD.size):
+        yield TraceRecord.unpack(view, offset)
+
+
+def read(path: str | Path) -> Iterator[TraceRecord]:
+    """Stream the records back out of a trace file."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise InvalidTraceError("Trace file is too short!")
+        magic, version, size = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise InvalidTraceError("Not a DigiCPU trace!")
+        if version != VERSION or size != RECORD.size:
+            raise InvalidTraceError(f"Unsupported trace version {version}!")
+        while chunk := f.read(CHUNK_SIZE - CHUNK_SIZE % RECORD.size):
+            yield from decode(chunk)
+
+
+def between(records: Iterable[TraceRecord], start: int = 0, end: int = ROM_SIZE) -> Iterator[TraceRecord]:
+    """Just the records for instructions at addresses `start` <= pc < `end`."""
+    return (r for r in records if start <= r.pc < end)
+
+
+def _flag_names(flags: int) -> str:
+    return "".join(name if flags & bit else "-" for name, bit in (("N", NEGATIVE), ("Z", ZERO), ("O", OVERFLOW)))
+
+
+def format_record(record: TraceRecord, opcodes: Mapping[int, Opcode]) -> str:
+    """One line of disassembly, with what the instruction did. `opcodes` maps values to opcodes."""
+    opcode = opcodes.get(record.opcode)
+    if opcode is None:
+        text = f"??? {record.opcode:02X}"
+    else:
+        text = opcode.format(record.operands)
+    effects = []
+    if record.register is not None:
+        effects.append(f"-> {Registers(record.register).name}")
+    if record.ram_address is not None:
+        effects.append(f"{'wrote' if record.ram_write else 'read'} RAM[{record.ram_address:02X}]")
+    if record.flags_before != record.flags_after:
+        effects.append(f"flags {_flag_names(record.flags_before)} -> {_flag_names(record.flags_after)}")
+    line = f"{record.pc:02X}: {text:<16}"
+    return (line + "  ; " + ", ".join(effects) if effects else line).rstrip()
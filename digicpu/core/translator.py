@@ -0,0 +1,385 @@
+"""Translates ROM into basic blocks of specialized Python.
+
+Each block is straight-line code with the registers and flags it touches held in locals,
+compiled once and cached by ROM contents (for the last `MAX_CACHED_PROGRAMS` ROMs). Anything
+the translator doesn't understand (or anything that would raise) is left to `CPU.step`, so
+running translated code leaves the CPU in exactly the state the interpreter would have.
+"""
+
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from digicpu.core.opcode import BY_MNEMONIC, OPCODES
+from digicpu.lib.types import MAX_INT, MAX_REG, ROM_SIZE, Registers
+
+if TYPE_CHECKING:
+    from digicpu.core.cpu import CPU
+    from digicpu.core.idle import LoopDetector
+
+# The longest run of instructions compiled into a single block.
+MAX_BLOCK_LENGTH = 64
+
+# Which operand (if any) is the register `CPU._handle` treats as written.
+DESTINATION_OPERAND = {o.assembly: o.destination for o in OPCODES if o.destination is not None}
+
+FLAG_JUMPS = {
+    "JNF": "nf", "JNN": "not nf",
+    "JZF": "zf", "JNZ": "not zf",
+    "JOF": "of", "JNO": "not of",
+}
+CONDITIONALS = {"EQ": "==", "NEQ": "!=", "LT": "<", "LTE": "<=", "GT": ">", "GTE": ">="}
+# (expression for `ans`, whether the result is reduced mod MAX_INT before storing)
+THREE_OPERAND = {
+    "ADD": ("{a} + {b}", True),
+    "SUB": ("{a} - {b}", True),
+    "MUL": ("{a} * {b}", True),
+    "ADO": ("{a} + {b}", True),
+    "MLO": ("{a} * {b}", True),
+    "MOD": ("{a} % {b}", False),
+    "SHL": (f"({{a}} << {{b}}) % {MAX_INT}", False),
+    "SHR": (f"({{a}} >> {{b}}) % {MAX_INT}", False),
+    "MIN": ("min({a}, {b})", False),
+    "MAX": ("max({a}, {b})", False),
+    "AND": (f"({{a}} & {{b}}) % {MAX_INT}", False),
+    "OR":  (f"({{a}} | {{b}}) % {MAX_INT}", False),
+    "NND": (f"~({{a}} & {{b}}) % {MAX_INT}", False),
+    "NOR": (f"~({{a}} | {{b}}) % {MAX_INT}", False),
+    "XOR": (f"({{a}} ^ {{b}}) % {MAX_INT}", False),
+}
+TERMINATORS = {"JMP", "JMR", "HLT", *FLAG_JUMPS, *CONDITIONALS}
+
+Instruction = tuple[int, str, tuple[int, ...], int]  # pc, mnemonic, operands, opcode value
+
+
+def _supported(mnemonic: str, operands: tuple[int, ...]) -> bool:
+    """Can this instruction be translated? Anything that would raise is left to the interpreter."""
+    if mnemonic in ("NOP", "HLT", "CLF", "CNF", "CZF", "COF"):
+        return True
+    if mnemonic == "IMM":
+        value, reg = operands
+        return value < MAX_INT and reg <= MAX_REG
+    if mnemonic == "CPY" or mnemonic == "NOT":
+        return all(r <= MAX_REG for r in operands)
+    if mnemonic in ("INC", "DEC"):
+        return operands[0] <= MAX_REG
+    if mnemonic in THREE_OPERAND:
+        return all(r <= MAX_REG for r in operands)
+    if mnemonic == "JMP" or mnemonic in FLAG_JUMPS:
+        return operands[0] < ROM_SIZE
+    if mnemonic == "JMR":
+        return operands[0] < MAX_REG
+    if mnemonic in CONDITIONALS:
+        return operands[0] <= MAX_REG and operands[1] <= MAX_REG and operands[2] < ROM_SIZE
+    # SEG, PSH, POP, and anything new.
+    return False
+
+
+class _BlockWriter:
+    """Generates the source for one block."""
+    def __init__(self, entry: int):
+        self.entry = entry
+        self.body: list[str] = []
+        self.read: set[int] = set()
+        self.written: set[int] = set()
+        self.flags_written: set[str] = set()
+        self.flags_read: set[str] = set()
+        self.ram_written = False
+        self.uses_display = False
+
+    def reg(self, r: int) -> str:
+        self.read.add(r)
+        return f"r{r}"
+
+    def emit(self, line: str, indent: int = 1):
+        self.body.append("    " * indent + line)
+
+    def exit_code(self, pc: str, last: Instruction | None, executed: int, indent: int) -> list[str]:
+        """Write everything back to the CPU and return how many instructions ran."""
+        pad = "    " * indent
+        lines = [f"{pad}regs[{r}] = r{r}" for r in sorted(self.written)]
+        lines += [f"{pad}cpu.{name} = {flag}" for flag, name in
+                  (("nf", "negative_flag"), ("zf", "zero_flag"), ("of", "overflow_flag")) if flag in self.flags_written]
+        if self.ram_written:
+            lines.append(f"{pad}cpu._ram_byte_changed = ram_byte_changed")
+        lines.append(f"{pad}cpu.program_counter = {pc}")
+        if last is not None:
+            last_pc, mnemonic, operands, value = last
+            dest = DESTINATION_OPERAND.get(mnemonic)
+            lines.append(f"{pad}cpu._register_changed = {None if dest is None else operands[dest]}")
+            lines.append(f"{pad}cpu._last_instruction_size = {len(operands) + 1}")
+            lines.append(f"{pad}cpu._current_instruction = {(value, *operands)!r}")
+        lines.append(f"{pad}return {executed}")
+        return lines
+
+    def side_exit(self, condition: str, ins: Instruction, last: Instruction | None, executed: int):
+        """Bail out to the interpreter before `ins` if `condition` doesn't hold."""
+        self.emit(f"if not ({condition}):")
+        self.body.extend(self.exit_code(str(ins[0]), last, executed, 2))
+
+    def write(self, ins: Instruction, last: Instruction | None, executed: int, value: str, reg: int):
+        """Store `value` into `reg`, with the memory-mapped side effects `CPU._handle` would do."""
+        # Guard against anything that would raise in the interpreter, before touching any state.
+        if reg in (Registers.ADDR, Registers.DATA):
+            self.uses_display = True
+            self.emit(f"v = {value}")
+            address = "v" if reg == Registers.ADDR else self.reg(Registers.ADDR)
+            self.side_exit(f"0 <= {address} < len(digits)", ins, last, executed)
+            value = "v"
+        self.emit(f"r{reg} = {value}")
+        self.written.add(reg)
+        self.read.add(reg)
+
+    def io(self, reg: int):
+        if reg == Registers.RAMD:
+            # CPU.ram_data_register reads RAMA, so that's what gets saved.
+            rama = self.reg(Registers.RAMA)
+            self.emit(f"ram.save({rama}, {rama})")
+            self.emit(f"ram_byte_changed = {rama}")
+            self.ram_written = True
+        elif reg == Registers.DATA:
+            self.emit(f"display.address = {self.reg(Registers.ADDR)}")
+            self.emit(f"display.data = {self.reg(Registers.DATA)}")
+            self.emit(f"digits[{self.reg(Registers.ADDR)}] = {self.reg(Registers.DATA)}")
+        elif reg == Registers.ADDR:
+            self.emit(f"r{Registers.DATA} = digits[{self.reg(Registers.ADDR)}]")
+            self.written.add(Registers.DATA)
+        elif reg == Registers.RAMA:
+            self.emit(f"r{Registers.RAMD} = ram.load({self.reg(Registers.RAMA)})")
+            self.written.add(Registers.RAMD)
+        elif reg == Registers.STAK:
+            self.emit(f"r{Registers.RAMD} = ram.load({self.reg(Registers.STAK)})")
+            self.written.add(Registers.RAMD)
+
+    def flag(self, flag: str, value: str):
+        self.emit(f"{flag} = {value}")
+        self.flags_written.add(flag)
+        self.flags_read.add(flag)
+
+    def instruction(self, ins: Instruction, last: Instruction | None, executed: int):
+        pc, mnemonic, operands, _ = ins
+        self.emit(f"# {pc:02X}: {mnemonic} {' '.join(str(o) for o in operands)}".rstrip())
+        if mnemonic == "NOP":
+            pass
+        elif mnemonic == "CLF":
+            for f in ("nf", "zf", "of"):
+                self.flag(f, "False")
+        elif mnemonic in ("CNF", "CZF", "COF"):
+            self.flag({"CNF": "nf", "CZF": "zf", "COF": "of"}[mnemonic], "False")
+        elif mnemonic == "IMM":
+            self.write(ins, last, executed, str(operands[0]), operands[1])
+        elif mnemonic == "CPY":
+            self.write(ins, last, executed, self.reg(operands[0]), operands[1])
+        elif mnemonic == "NOT":
+            self.write(ins, last, executed, f"(~{self.reg(operands[0])}) % {MAX_INT}", operands[1])
+            self.flag("zf", f"r{operands[1]} == 0")
+        elif mnemonic in ("INC", "DEC"):
+            r = operands[0]
+            self.emit(f"ans = {self.reg(r)} {'+' if mnemonic == 'INC' else '-'} 1")
+            self.write(ins, last, executed, f"ans % {MAX_INT}", r)
+            if mnemonic == "INC":
+                self.flag("of", f"ans > {MAX_INT}")
+            else:
+                self.flag("nf", "ans < 0")
+            self.flag("zf", "ans == 0")
+        elif mnemonic in THREE_OPERAND:
+            a, b, to = operands
+            expression, wraps = THREE_OPERAND[mnemonic]
+            if mnemonic == "MOD":
+                self.side_exit(f"{self.reg(b)} != 0", ins, last, executed)
+            self.emit(f"ans = {expression.format(a = self.reg(a), b = self.reg(b))}")
+            self.write(ins, last, executed, f"ans % {MAX_INT}" if wraps else "ans", to)
+            if mnemonic == "SUB":
+                # SUB only ever sets the negative flag, it never clears it.
+                self.emit("if ans < 0:")
+                self.emit("nf = True", 2)
+                self.flags_written.add("nf")
+                self.flags_read.add("nf")
+            if Registers.OVFL in BY_MNEMONIC[mnemonic].also_writes:
+                self.emit(f"r{Registers.OVFL} = ans // {MAX_INT}")
+                self.written.add(Registers.OVFL)
+                self.read.add(Registers.OVFL)
+                self.flag("of", f"ans > {MAX_INT * MAX_INT}")
+            elif mnemonic in ("ADD", "MUL"):
+                self.flag("of", f"ans > {MAX_INT}")
+            self.flag("zf", "ans == 0")
+        else:
+            raise AssertionError(f"Can't translate {mnemonic} inline.")
+
+        dest = DESTINATION_OPERAND.get(mnemonic)
+        if dest is not None:
+            self.io(operands[dest])
+
+    def terminator(self, ins: Instruction, executed: int):
+        pc, mnemonic, operands, _ = ins
+        self.emit(f"# {pc:02X}: {mnemonic} {' '.join(str(o) for o in operands)}".rstrip())
+        fallthrough = str(pc + len(operands) + 1)
+        if mnemonic == "HLT":
+            self.emit("cpu._halt_flag = True")
+            self.body.extend(self.exit_code(fallthrough, ins, executed, 1))
+        elif mnemonic == "JMP":
+            self.body.extend(self.exit_code(str(operands[0]), ins, executed, 1))
+        elif mnemonic == "JMR":
+            self.body.extend(self.exit_code(f"{self.reg(operands[0])} % {ROM_SIZE}", ins, executed, 1))
+        else:
+            if mnemonic in FLAG_JUMPS:
+                condition = FLAG_JUMPS[mnemonic]
+                self.flags_read.add(condition.removeprefix("not "))
+            else:
+                a, b, _ = operands
+                condition = f"{self.reg(a)} {CONDITIONALS[mnemonic]} {self.reg(b)}"
+            self.emit(f"if {condition}:")
+            self.body.extend(self.exit_code(str(operands[-1]), ins, executed, 2))
+            self.body.extend(self.exit_code(fallthrough, ins, executed, 1))
+
+    def source(self) -> str:
+        head = ["    regs = cpu.registers"]
+        head += [f"    r{r} = regs[{r}]" for r in sorted(self.read)]
+        head += [f"    {flag} = cpu.{name}" for flag, name in
+                 (("nf", "negative_flag"), ("zf", "zero_flag"), ("of", "overflow_flag")) if flag in self.flags_read]
+        head.append("    ram = cpu.ram")
+        if self.uses_display:
+            head.append("    display = cpu.display")
+            head.append("    digits = display.digits")
+        return "\n".join([f"def block_{self.entry:02X}(cpu):", *head, *self.body])
+
+
+class Block:
+    def __init__(self, entry: int, length: int, function: Callable[["CPU"], int], source: str):
+        self.entry = entry
+        self.length = length
+        self.function = function
+        self.source = source
+
+
+class TranslatedProgram:
+    """A ROM split into basic blocks, each compiled on first use."""
+    def __init__(self, rom: bytes, instructions: list[Instruction | None]):
+        self.rom = rom
+        self.instructions = instructions
+        self.leaders = self._find_leaders()
+        self._blocks: list[Block | None | bool] = [False] * ROM_SIZE  # False means "not compiled yet"
+
+    def _find_leaders(self) -> set[int]:
+        """Jump targets, and the instruction after every jump, from a linear sweep."""
+        leaders = {0}
+        pc = 0
+        while pc < ROM_SIZE:
+            ins = self.instructions[pc]
+            if ins is None:
+                pc += 1
+                continue
+            _, mnemonic, operands, _ = ins
+            if mnemonic == "JMP" or mnemonic in FLAG_JUMPS or mnemonic in CONDITIONALS:
+                leaders.add(operands[-1])
+            if mnemonic in TERMINATORS:
+                leaders.add(pc + len(operands) + 1)
+            pc += len(operands) + 1
+        return leaders
+
+    def block(self, entry: int) -> Block | None:
+        block = self._blocks[entry]
+        if block is False:
+            block = self._blocks[entry] = self._compile(entry)
+        return block  # type: ignore[return-value]
+
+    def _compile(self, entry: int) -> Block | None:
+        writer = _BlockWriter(entry)
+        pc = entry
+        last: Instruction | None = None
+        executed = 0
+        while pc < ROM_SIZE and executed < MAX_BLOCK_LENGTH:
+            if pc != entry and pc in self.leaders:
+                break
+            ins = self.instructions[pc]
+            if ins is None or not _supported(ins[1], ins[2]):
+                break
+            if ins[1] in TERMINATORS:
+                writer.terminator(ins, executed + 1)
+                executed += 1
+                last = None
+                break
+            writer.instruction(ins, last, executed)
+            last = ins
+            executed += 1
+            pc += len(ins[2]) + 1
+        if executed == 0:
+            return None
+        if last is not None:
+            # Fell off the end of the block without a jump.
+            writer.body.extend(writer.exit_code(str(pc), last, executed, 1))
+        source = writer.source()
+        namespace: dict = {}
+        exec(compile(source, f"<digicpu block {entry:02X}>", "exec"), namespace)
+        return Block(entry, executed, namespace[f"block_{entry:02X}"], source)
+
+    def run(self, cpu: "CPU", max_cycles: int, detector: "LoopDetector | None" = None) -> int:
+        """Run `cpu` for up to `max_cycles` cycles (or until it halts or leaves ROM).
+        Returns the number of cycles run.
+
+        If `detector` is given, it looks at the CPU between blocks, and the run stops early if it spots a loop."""
+        step = cpu.step
+        blocks = self._blocks
+        cycles = 0
+        start = detector.cycles if detector is not None else 0
+        while cycles < max_cycles and not cpu._halt_flag and cpu.program_counter < ROM_SIZE:
+            block = blocks[cpu.program_counter]
+            if block is False:
+                block = self.block(cpu.program_counter)
+            if block is None or block.length > max_cycles - cycles:  # type: ignore[union-attr]
+                step()
+                cycles += 1
+            else:
+                ran = block.function(cpu)  # type: ignore[union-attr]
+                if ran == 0:
+                    # Side exit before the first instruction; let the interpreter deal with it.
+                    step()
+                    ran = 1
+                cycles += ran
+            if detector is not None and detector.observe(cpu, start + cycles):
+                break
+        return cycles
+
+
+# The most recently used translations, by ROM contents. Oldest first, so the first is evicted.
+MAX_CACHED_PROGRAMS = 64
+_cache: OrderedDict[bytes, TranslatedProgram] = OrderedDict()
+
+# The ports blocks inline the RAM and display at. See `CPU._handle` and `digicpu.core.bus`.
+RAM_PORTS = (Registers.RAMA, Registers.RAMD, Registers.STAK)
+DISPLAY_PORTS = (Registers.ADDR, Registers.DATA)
+
+
+def inlines(cpu: "CPU") -> bool:
+    """Whether translated blocks do the same I/O as `cpu` would: only while its bus has just the RAM and display on it."""
+    owners = cpu.bus.owners
+    return (len(cpu.bus.devices) == 2 and all(owners[r] is cpu.ram for r in RAM_PORTS)
+            and all(owners[r] is cpu.display for r in DISPLAY_PORTS))
+
+
+def translate(cpu: "CPU") -> TranslatedProgram:
+    """Get the translation of the ROM currently loaded into `cpu`."""
+    key = bytes(cpu.rom)
+    program = _cache.get(key)
+    if program is not None:
+        _cache.move_to_end(key)
+    else:
+        instructions: list[Instruction | None] = []
+        for pc, decoded in enumerate(cpu._decoded):
+            if decoded is None:
+                instructions.append(None)
+            else:
+                opcode, operands = decoded
+                instructions.append((pc, opcode.assembly, tuple(int(o) for o in operands), opcode.value))
+        program = _cache[key] = TranslatedProgram(key, instructions)
+        if len(_cache) > MAX_CACHED_PROGRAMS:
+            _cache.popitem(last = False)
+    return program
+
+
+def run(cpu: "CPU", max_cycles: int, detector: "LoopDetector | None" = None) -> int:
+    """Run `cpu` with translated code for up to `max_cycles` cycles. Returns the number of cycles run.
+
+    The translation is looked up by the ROM's contents every call, so changing the ROM
+    between calls is always safe. The CPU's bus needs to be one the blocks can inline (see `inlines`)."""
+    return translate(cpu).run(cpu, max_cycles, detector)
@@ -0,0 +1,201 @@
+"""Drive a CPU for a front end, either on the caller's thread or on a worker thread of its own.
+
+Either way the front end sends commands (input, rate, pause, reset, step, step back) and gets back immutable
+`Frame`s of the machine state to draw, so it never has to touch the CPU itself."""
+
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+from digicpu.clock import DEFAULT_RATE, MAX_RATE, MIN_RATE, Clock
+from digicpu.core.cpu import CPU
+
+# How long the worker runs the CPU for between looking at its command queue.
+SLICE = 0.002
+# How long the worker waits for a command when there's nothing to run.
+IDLE_WAIT = 0.01
+
+
+class Frame(NamedTuple):
+    serial: int
+    cycles: int
+    program_counter: int
+    registers: bytes
+    busy_flag: bool
+    negative_flag: bool
+    zero_flag: bool
+    overflow_flag: bool
+    halted: bool
+    display: bytes
+    ram: bytes
+    # RAM addresses written since the previous frame.
+    dirty: frozenset[int]
+    # Whether RAM was cleared by a hard reset since the previous frame.
+    ram_cleared: bool
+    instruction: str
+    last_instruction_size: int
+    register_changed: int | None
+    ram_byte_changed: int | None
+    # `Device.sample()` of each lazy device on the CPU's bus.
+    devices: tuple
+
+
+def capture(cpu: CPU, serial: int, cycles: int, dirty: frozenset[int], ram_cleared: bool = False) -> Frame:
+    return Frame(serial, cycles, cpu.program_counter, bytes(cpu.registers), cpu.busy_flag,
+                 cpu.negative_flag, cpu.zero_flag, cpu.overflow_flag, cpu._halt_flag,
+                 cpu.display.sample(), bytes(cpu.ram.state), dirty, ram_cleared,
+                 cpu._current_instruction_string, cpu._last_instruction_size,
+                 cpu._register_changed, cpu._ram_byte_changed, cpu.bus.sample())
+
+
+class Emulator:
+    """Runs the CPU on the caller's thread: every `poll` runs the instructions owed and returns a `Frame`."""
+    def __init__(self, cpu: CPU, rate: float | None = DEFAULT_RATE):
+        self.cpu = cpu
+        self.clock = Clock(cpu, rate)
+        self.paused = True
+        self.input_value = 0
+        self._serial = 0
+        self._ram_cleared = False
+
+    def set_input(self, value: int):
+        self.input_value = value
+        self.cpu.input_register = value
+
+    def set_rate(self, rate: float | None):
+        self.clock.rate = rate
+
+    def set_paused(self, paused: bool):
+        self.paused = paused
+
+    def reset(self, hard: bool = False):
+        self.cpu.reset(hard)
+        self.clock.reset()
+        if hard:
+            self.cpu.ram.take_dirty()
+            self._ram_cleared = True
+
+    def step(self):
+        self.cpu.input_register = self.input_value
+        self.clock.step()
+
+    def step_back(self):
+        """Undo the last instruction, if the CPU is keeping a journal (see `CPU.start_journal`)."""
+        self.clock.cycles -= self.cpu.step_back()
+        self.clock.wake()
+
+    @property
+    def rate(self) -> float | None:
+        return self.clock.rate
+
+    def _run(self, dt: float, budget: float | None = None):
+        if not self.paused:
+            self.cpu.input_register = self.input_value
+            self.clock.advance(dt, budget)
+
+    def _capture(self, dirty: frozenset[int]) -> Frame:
+        self._serial += 1
+        frame = capture(self.cpu, self._serial, self.clock.cycles, dirty, self._ram_cleared)
+        self._ram_cleared = False
+        return frame
+
+    def poll(self, dt: float, budget: float | None = None) -> Frame:
+        """Run the CPU for `dt` seconds of emulated time (in at most `budget` seconds) and return its state."""
+        self._run(dt, budget)
+        return self._capture(frozenset(self.cpu.ram.take_dirty()))
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class ThreadedEmulator(Emulator):
+    """Runs the CPU on a worker thread, flat out unless it's given a `rate` (see `Clock`).
+
+    Commands are queued to the worker. State comes back through a double buffer: the worker builds
+    each frame privately and then swaps it in as the front frame with a single assignment, so the
+    front end never waits on a lock. The worker only publishes a new frame once the front end has
+    picked up the last one, and keeps collecting dirty RAM addresses until then, so none are missed.
+
+    On a build with the GIL, the worker still shares the interpreter with the window, but it gives
+    it up between slices so drawing is never stuck behind a long run."""
+    def __init__(self, cpu: CPU, rate: float | None = None):
+        super().__init__(cpu, rate)
+        self._commands: queue.SimpleQueue = queue.SimpleQueue()
+        self._stopping = False
+        self._thread = threading.Thread(target = self._work, name = "digicpu-emulator", daemon = True)
+        self._front = self._capture(frozenset())
+        self._acked = self._front.serial
+        self._rate = None if rate is None else float(rate)
+
+    # Every control is run by the worker, in order.
+    def set_input(self, value: int):
+        self._commands.put((Emulator.set_input, (value,)))
+
+    def set_rate(self, rate: float | None):
+        self._rate = None if rate is None else float(min(max(rate, MIN_RATE), MAX_RATE))
+        self._commands.put((Emulator.set_rate, (rate,)))
+
+    def set_paused(self, paused: bool):
+        self._commands.put((Emulator.set_paused, (paused,)))
+
+    def reset(self, hard: bool = False):
+        self._commands.put((Emulator.reset, (hard,)))
+
+    def step(self):
+        self._commands.put((Emulator.step, ()))
+
+    def step_back(self):
+        self._commands.put((Emulator.step_back, ()))
+
+    @property
+    def rate(self) -> float | None:
+        return self._rate
+
+    def poll(self, dt: float, budget: float | None = None) -> Frame:
+        """The latest frame the worker has published. `dt` and `budget` are ignored; the worker keeps its own time."""
+        frame = self._front
+        self._acked = frame.serial
+        return frame
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._commands.put((None, ()))
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _work(self):
+        dirty: set[int] = set()
+        last = time.perf_counter()
+        while not self._stopping:
+            # Sleep while there's nothing to do, including when the program's just waiting for
+            # input; a new input value comes in as a command, which wakes us straight up.
+            idle = self.paused or not self.clock.running or self.clock.idle.looping
+            try:
+                command, args = self._commands.get(timeout = IDLE_WAIT) if idle else self._commands.get_nowait()
+                while True:
+                    if command is not None:
+                        command(self, *args)
+                    command, args = self._commands.get_nowait()
+            except queue.Empty:
+                pass
+
+            now = time.perf_counter()
+            self._run(now - last, SLICE)
+            last = now
+            dirty |= self.cpu.ram.take_dirty()
+
+            # Back buffer -> front buffer, once the last front frame has been seen.
+            if self._acked == self._front.serial:
+                self._front = self._capture(frozenset(dirty))
+                dirty.clear()
+
+            # Let the window have the interpreter (even when unthrottled, this still yields), and
+            # don't spin if the clock is slow enough to leave time over.
+            time.sleep(max(SLICE - (time.perf_counter() - now), 0))
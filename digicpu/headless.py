@@ -0,0 +1,120 @@
+from pathlib import Path
+
+from digicpu.core import translator
+from digicpu.core.cpu import CPU
+from digicpu.core.idle import LoopDetector
+from digicpu.lib.types import ROM_SIZE
+
+DEFAULT_MAX_CYCLES = 1_000_000
+
+
+def run(cpu: CPU, max_cycles: int = DEFAULT_MAX_CYCLES, translate: bool = False, detector: LoopDetector | None = None,
+        fast_forward: bool = True) -> int:
+    """Step `cpu` until it halts, runs off the end of ROM, or `max_cycles` is used up.
+    Returns the number of cycles run.
+
+    If `translate` is set, hot code is run as translated Python blocks instead of one `step()` at a time.
+    (Not while anything is attached to the CPU, like a profiler, since blocks don't go through it,
+    nor while devices other than the RAM and display are connected.)
+
+    Unless `fast_forward` is False, a program that gets stuck going round the same loop (see
+    `digicpu.core.idle`) skips to the end of the budget, only running the few cycles that leave it
+    where it would have been anyway. Pass a `detector` to keep watching across calls."""
+    if not fast_forward or not all(getattr(i, "allows_fast_forward", False) for i in cpu._instruments):
+        detector = None
+    elif detector is None:
+        detector = LoopDetector()
+
+    if detector is not None and detector.still_looping(cpu):
+        return _skip(cpu, max_cycles, detector)
+    if translate and not cpu._instruments and translator.inlines(cpu):
+        cycles = translator.run(cpu, max_cycles, detector)
+    else:
+        cycles = _interpret(cpu, max_cycles, detector)
+    if detector is not None:
+        detector.cycles += cycles
+        if detector.looping:
+            cycles += _skip(cpu, max_cycles - cycles, detector)
+    return cycles
+
+
+def _interpret(cpu: CPU, max_cycles: int, detector: LoopDetector | None) -> int:
+    if detector is None:
+        return cpu.run(max_cycles).cycles
+
+    step = cpu.step
+    cycles = 0
+    start = detector.cycles
+    while cycles < max_cycles and not cpu._halt_flag and cpu.program_counter < ROM_SIZE:
+        step()
+        cycles += 1
+        if (cpu.program_counter == detector.pc or start + cycles >= detector.due) and detector.observe(cpu, start + cycles):
+            break
+    return cycles
+
+
+def _skip(cpu: CPU, cycles: int, detector: LoopDetector) -> int:
+    """Account for `cycles` more cycles of a loop, running only the remainder of a whole number of trips round it."""
+    assert detector.period is not None
+    _interpret(cpu, cycles % detector.period, None)
+    detector.cycles += cycles
+    return cycles
+
+
+def dump(cpu: CPU, ram: bool = True) -> str:
+    """A plain-text dump of the machine state."""
+    lines = [
+        f"PC {cpu.program_counter:02X}",
+        f"REGISTERS {' '.join(f'{r:02X}' for r in cpu.registers)}",
+        f"FLAGS N{cpu.negative_flag:d} Z{cpu.zero_flag:d} O{cpu.overflow_flag:d} H{cpu._halt_flag:d}",
+        f"DISPLAY {' '.join(f'{d:02X}' for d in cpu.display.digits)}",
+    ]
+    if ram:
+        lines.append("RAM")
+        state = cpu.ram.state
+        for row in range(0, len(state), 16):
+            lines.append(" ".join(f"{b:02X}" for b in state[row:row + 16]))
+    return "\n".join(lines)
+
+
+def run_file(path: str | Path, max_cycles: int = DEFAULT_MAX_CYCLES, input_value: int = 0, ram: bool = True, translate: bool = False, trace: bool = False,
+             profile: bool = False, collapsed: str | Path | None = None, record: str | Path | None = None) -> str:
+    """Run the program at `path` (assembly, or a `.bin` ROM image), and return a dump of the final state.
+
+    If `profile` is set, a hot-spot report is added to the dump; if `collapsed` is given, the
+    profile is also written there in collapsed-stack format. If `record` is given, every
+    instruction run is written there as a binary trace (see `digicpu.core.trace`)."""
+    cpu = CPU(trace)
+    # ROM images have no source to point the profile at.
+    source = None if Path(path).suffix.lower() == ".bin" else Path(path).read_text()
+    if source is None:
+        cpu.load_file(path)
+    else:
+        cpu.load_string(source)
+    cpu.input(input_value)
+    profiler = cpu.start_profiling() if profile or collapsed else None
+    if record:
+        cpu.start_tracing(path = record)
+    detector = LoopDetector()
+    try:
+        cycles = run(cpu, max_cycles, translate, detector)
+    finally:
+        cpu.stop_tracing()
+
+    if cpu._halt_flag:
+        status = f"Halted after {cycles} cycles."
+    elif cpu.program_counter >= ROM_SIZE:
+        status = f"Ran off the end of ROM after {cycles} cycles."
+    elif detector.looping:
+        status = (f"Stopped after {cycles} cycles (cycle budget exhausted; stuck in a {detector.period}-cycle loop "
+                  f"from cycle {detector.found_at}, so the rest was skipped).")
+    else:
+        status = f"Stopped after {cycles} cycles (cycle budget exhausted)."
+    out = status + "\n" + dump(cpu, ram)
+
+    if profiler is not None:
+        if collapsed:
+            Path(collapsed).write_text(profiler.collapsed(cpu.assembly, Path(path).stem) + "\n")
+        if profile:
+            out += "\n\n" + profiler.report(cpu.assembly, source)
+    return out
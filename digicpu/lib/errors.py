@@ -25,8 +25,11 @@ class UnknownOpcodeError(ValueError):
             super().__init__(f"Unknown opcode {opcode:02X}!")
 
 class UnknownInstructionError(ValueError):
-    def __init__(self, instruction: str) -> None:
-        super().__init__(f"Unknown instruction '{instruction}'!")
+    def __init__(self, instruction: str, line: int | None = None) -> None:
+        if line is not None:
+            super().__init__(f"Unknown instruction '{instruction}' on line {line}!")
+        else:
+            super().__init__(f"Unknown instruction '{instruction}'!")
 
 class InvalidAssemblyError(ValueError):
     def __init__(self, message: str) -> None:
@@ -35,3 +38,15 @@ class InvalidAssemblyError(ValueError):
 class ROMTooLargeError(ValueError):
     def __init__(self, size: int) -> None:
         super().__init__(f"Assembled ROM too large! ({size} > {ROM_SIZE})")
+
+class InvalidSnapshotError(ValueError):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+class InvalidTraceError(ValueError):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+class PortInUseError(ValueError):
+    def __init__(self, register: int) -> None:
+        super().__init__(f"Register {register} is already a port of another device!")
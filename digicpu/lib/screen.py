@@ -1,4 +1,5 @@
 import arcade
+import numpy as np
 from arcade.types import Color
 
 
@@ -10,9 +11,14 @@ def packed_color_to_color(packed: int) -> Color:
 
     return Color(r, g, b, 255)
 
+
+# XXRRGGBB (without the XX) -> RGBA, so a whole screen converts in one indexing operation.
+PALETTE = np.array([packed_color_to_color(packed) for packed in range(64)], dtype = np.uint8)
+
+
 class Screen(arcade.Sprite):
     """
-    A really basic screen.
+    A really basic screen, showing the pixels of a `digicpu.core.screen.Screen`.
 
     Pixel format is XXRRGGBB, where the highest two bits are reserved and unused.
     """
@@ -28,29 +34,19 @@ class Screen(arcade.Sprite):
         self._sprite_list = arcade.SpriteList()
         self._sprite_list.append(self)
 
-        self.byte_size: int = width * height
         self.w = width
         self.h = height
-        self.pixels = [0] * self.byte_size
-
-    @property
-    def current_state(self) -> tuple:
-        return tuple(self.pixels)
-
-    def clear(self):
-        self.pixels = [0] * self.byte_size
+        # The pixels last uploaded, to tell when there's anything new to upload.
+        self.pixels: np.ndarray | None = None
 
-    def update(self, *args, **kwargs):
-        if self.current_state == self.last_state:
+    def set_pixels(self, pixels: np.ndarray):
+        """Show `pixels`, an array of `h` rows of `w` XXRRGGBB bytes. Only uploads anything if they've changed."""
+        if pixels is self.pixels:
             return
-        with self._sprite_list.atlas.render_into(self._tex) as fbo:
-            fbo.clear()
-            for n, px in enumerate(self.pixels):
-                x = n % self.w
-                y = self.h - (n // self.w)
-                arcade.draw_point(x, y, packed_color_to_color(px))
-        self.last_state = self.current_state
-        super().update(*args, **kwargs)
+        self.pixels = pixels
+        rgba = PALETTE[pixels & 0b00111111]
+        self._tex.image.frombytes(rgba.tobytes())
+        self._sprite_list.atlas.update_texture_image(self._tex)
 
     def draw(self) -> None:
         self._sprite_list.draw(pixelated = True)
@@ -30,11 +30,14 @@ class SevenSeg(arcade.Sprite):
     #D# dot
     """
 
-    cid = 0
+    # Rendered glyphs, shared by every digit: (width, thinness, colors, bits) -> texture.
+    # There are only 256 bitmasks, so each one is drawn once and after that digits just swap textures.
+    _glyphs: dict[tuple, arcade.Texture] = {}
 
     def __init__(self, width: int, thinness: float = 6.5,
                  on_color: tuple[int, ...] = arcade.color.RED, off_color: tuple[int, ...] = (32, 32, 32), *args, **kwargs):
         self._w = width
+        self.thinness = thinness
         self.digit_width = int(self._w * (4 / 5))
         if thinness < 2.5:
             raise ValueError("Thinness must be 2.5 or more.")
@@ -43,117 +46,142 @@ class SevenSeg(arcade.Sprite):
         self.segment_length = self.digit_width - (self.segment_gap * 2) - self.segment_thickness
         self.circle_size = (self._w - self.digit_width) // 2 + self.segment_gap
         self._h = int((self.segment_length * 2) + (self.segment_gap * 4) + self.segment_thickness)
-        self._tex = arcade.Texture.create_empty(f"segment-{self.__class__.cid}", (self._w, self._h))
-        self.__class__.cid += 1
 
-        super().__init__(self._tex)
-
-        self.off_color = off_color
-        self.on_color = on_color
+        self.points_a = get_segment_point_list(False, self.segment_length, self.segment_thickness, self.segment_thickness // 2 + self.segment_gap, self._h - self.segment_thickness)
+        self.points_b = get_segment_point_list(True, self.segment_length, self.segment_thickness, self.digit_width - self.segment_thickness, self._h - self.segment_length - self.segment_gap - (self.segment_thickness // 2))
+        self.points_c = get_segment_point_list(True, self.segment_length, self.segment_thickness, self.digit_width - self.segment_thickness, self.segment_gap + (self.segment_thickness // 2))
+        self.points_d = get_segment_point_list(False, self.segment_length, self.segment_thickness, self.segment_thickness // 2 + self.segment_gap, 0)
+        self.points_e = get_segment_point_list(True, self.segment_length, self.segment_thickness, 0, self.segment_gap + (self.segment_thickness // 2))
+        self.points_f = get_segment_point_list(True, self.segment_length, self.segment_thickness, 0, self._h - self.segment_length - self.segment_gap - (self.segment_thickness // 2))
+        self.points_g = get_segment_point_list(False, self.segment_length, self.segment_thickness, self.segment_thickness // 2 + self.segment_gap, self.segment_length + (self.segment_gap * 2))
 
-        self.segments = [False] * 8
-        self.last_state = None
+        self._on_color = on_color
+        self._off_color = off_color
+        self.bits = 0
+        # The bits of the texture being shown, or None if it's out of date.
+        self._shown_bits: int | None = None
 
         self._sprite_list = arcade.SpriteList()
+        super().__init__(self._glyph())
         self._sprite_list.append(self)
 
-        self.points_a = get_segment_point_list(False, self.segment_length, self.segment_thickness, self.segment_thickness // 2 + self.segment_gap, self.height - self.segment_thickness)
-        self.points_b = get_segment_point_list(True, self.segment_length, self.segment_thickness, self.digit_width - self.segment_thickness, self.height - self.segment_length - self.segment_gap - (self.segment_thickness // 2))
-        self.points_c = get_segment_point_list(True, self.segment_length, self.segment_thickness, self.digit_width - self.segment_thickness, self.segment_gap + (self.segment_thickness // 2))
-        self.points_d = get_segment_point_list(False, self.segment_length, self.segment_thickness, self.segment_thickness // 2 + self.segment_gap, 0)
-        self.points_e = get_segment_point_list(True, self.segment_length, self.segment_thickness, 0, self.segment_gap + (self.segment_thickness // 2))
-        self.points_f = get_segment_point_list(True, self.segment_length, self.segment_thickness, 0, self.height - self.segment_length - self.segment_gap - (self.segment_thickness // 2))
-        self.points_g = get_segment_point_list(False, self.segment_length, self.segment_thickness, self.segment_thickness // 2 + self.segment_gap, self.segment_length + (self.segment_gap * 2))
+    @property
+    def on_color(self) -> tuple[int, ...]:
+        return self._on_color
+
+    @on_color.setter
+    def on_color(self, color: tuple[int, ...]):
+        self._on_color = color
+        self._shown_bits = None
+
+    @property
+    def off_color(self) -> tuple[int, ...]:
+        return self._off_color
+
+    @off_color.setter
+    def off_color(self, color: tuple[int, ...]):
+        self._off_color = color
+        self._shown_bits = None
+
+    @property
+    def segments(self) -> list[bool]:
+        return [bool(self.bits >> i & 1) for i in range(8)]
+
+    @segments.setter
+    def segments(self, segments: list[bool]):
+        self.bits = sum(1 << i for i, on in enumerate(segments) if on)
+
+    def _get_segment(self, segment: int) -> bool:
+        return bool(self.bits >> segment & 1)
+
+    def _set_segment(self, segment: int, on: bool):
+        if on:
+            self.bits |= 1 << segment
+        else:
+            self.bits &= ~(1 << segment)
 
     @property
     def current_state(self) -> tuple:
-        return tuple(self.segments) + (self.off_color, self.on_color)
+        return (self.bits, self.off_color, self.on_color)
 
     @property
     def a(self) -> bool:
-        return self.segments[0]
+        return self._get_segment(0)
 
     @a.setter
     def a(self, on: bool):
-        self.segments[0] = on
+        self._set_segment(0, on)
 
     @property
     def b(self) -> bool:
-        return self.segments[1]
+        return self._get_segment(1)
 
     @b.setter
     def b(self, on: bool):
-        self.segments[1] = on
+        self._set_segment(1, on)
 
     @property
     def c(self) -> bool:
-        return self.segments[2]
+        return self._get_segment(2)
 
     @c.setter
     def c(self, on: bool):
-        self.segments[2] = on
+        self._set_segment(2, on)
 
     @property
     def d(self) -> bool:
-        return self.segments[3]
+        return self._get_segment(3)
 
     @d.setter
     def d(self, on: bool):
-        self.segments[3] = on
+        self._set_segment(3, on)
 
     @property
     def e(self) -> bool:
-        return self.segments[4]
+        return self._get_segment(4)
 
     @e.setter
     def e(self, on: bool):
-        self.segments[4] = on
+        self._set_segment(4, on)
 
     @property
     def f(self) -> bool:
-        return self.segments[5]
+        return self._get_segment(5)
 
     @f.setter
     def f(self, on: bool):
-        self.segments[5] = on
+        self._set_segment(5, on)
 
     @property
     def g(self) -> bool:
-        return self.segments[6]
+        return self._get_segment(6)
 
     @g.setter
     def g(self, on: bool):
-        self.segments[6] = on
+        self._set_segment(6, on)
 
     @property
     def dot(self) -> bool:
-        return self.segments[7]
+        return self._get_segment(7)
 
     @dot.setter
     def dot(self, on: bool):
-        self.segments[7] = on
+        self._set_segment(7, on)
 
     def segment_color(self, segment: int):
         if segment > 7:
             raise ValueError("Segment must 0-7.")
-        return self.on_color if self.segments[segment] else self.off_color
+        return self.on_color if self._get_segment(segment) else self.off_color
 
     def set_bits(self, bits: int):
         """Set segment booleans in the pattern Dgfedcba."""
-        for i in range(8):
-            self.segments[i] = bool(bits & 0b1)
-            bits = bits >> 1
+        self.bits = bits & 0xFF
 
     def get_bits(self) -> int:
-        bits = 0
-        for segment in self.segments:
-            if segment:
-                bits += 1
-                bits = bits << 1
-        return bits
+        return self.bits
 
     def clear(self):
-        self.segments = [False] * 8
+        self.bits = 0
 
     def set_char(self, char: str | int):
         if isinstance(char, int):
@@ -213,10 +241,20 @@ class SevenSeg(arcade.Sprite):
         if set_dot:
             self.dot = True
 
-    def update(self, *args, **kwargs):
-        if self.current_state == self.last_state:
-            return
-        with self._sprite_list.atlas.render_into(self._tex) as fbo:
+    def _glyph(self) -> arcade.Texture:
+        """The texture for the current bits and colors, drawn the first time it's asked for."""
+        key = (self._w, self.thinness, tuple(self.on_color), tuple(self.off_color), self.bits)
+        tex = self._glyphs.get(key)
+        if tex is None:
+            tex = arcade.Texture.create_empty("segment-{}-{}-{}-{}-{}".format(*key), (self._w, self._h))
+            self._draw_glyph(tex)
+            self._glyphs[key] = tex
+        return tex
+
+    def _draw_glyph(self, tex: arcade.Texture):
+        atlas = self._sprite_list.atlas
+        atlas.add(tex)
+        with atlas.render_into(tex) as fbo:
             fbo.clear()
             arcade.draw_polygon_filled(self.points_a, self.segment_color(0))
             arcade.draw_polygon_filled(self.points_b, self.segment_color(1))
@@ -226,7 +264,12 @@ class SevenSeg(arcade.Sprite):
             arcade.draw_polygon_filled(self.points_f, self.segment_color(5))
             arcade.draw_polygon_filled(self.points_g, self.segment_color(6))
             arcade.draw_circle_filled(self._w - self.circle_size, self.circle_size // 2, self.circle_size // 2, self.segment_color(7), num_segments = 16)
-        self.last_state = self.current_state
+
+    def update(self, *args, **kwargs):
+        if self.bits == self._shown_bits:
+            return
+        self.texture = self._glyph()
+        self._shown_bits = self.bits
         super().update(*args, **kwargs)
 
     def draw(self) -> None:
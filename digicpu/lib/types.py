@@ -1,5 +1,5 @@
-from enum import IntEnum
-from typing import Literal
+from enum import Enum, IntEnum
+from typing import Literal, NamedTuple
 
 Register = Literal[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
 Position = int
@@ -26,3 +26,18 @@ class Registers(IntEnum):
     STAK = 12
     OVFL = 13
     INPT = 14
+
+
+class StopReason(Enum):
+    BUDGET = "budget"
+    HALTED = "halted"
+    END_OF_ROM = "end of ROM"
+    BREAKPOINT = "breakpoint"
+    UNTIL_PC = "until"
+    WATCH_REGISTER = "register watchpoint"
+    WATCH_RAM = "RAM watchpoint"
+
+
+class RunResult(NamedTuple):
+    reason: StopReason
+    cycles: int
@@ -0,0 +1,102 @@
+"""Run one ROM against a grid of initial conditions, fanned out over a process pool."""
+
+import itertools
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import NamedTuple
+
+from digicpu import headless
+from digicpu.core.cpu import CPU
+
+# Runs per task sent to a worker; big enough to amortize the IPC round trip.
+DEFAULT_CHUNK_SIZE = 64
+
+
+class SweepResult(NamedTuple):
+    index: int
+    input_value: int
+    ram_image: int
+    max_cycles: int
+    program_counter: int
+    registers: bytes
+    negative_flag: bool
+    zero_flag: bool
+    overflow_flag: bool
+    halted: bool
+    cycles: int
+    display: bytes
+    # The error the run stopped on, as "Type: message", or None if it didn't fault. A faulted run
+    # keeps the state it faulted in, and its `cycles` is -1, since the count is lost with the error.
+    fault: str | None = None
+
+
+# Per-worker state, set up once by `_init_worker` so the ROM isn't re-sent with every run.
+_cpu: CPU | None = None
+_ram_images: Sequence[bytes] = ()
+_translate = False
+
+
+def _init_worker(rom: bytes, ram_images: Sequence[bytes], translate: bool):
+    global _cpu, _ram_images, _translate
+    _cpu = CPU()
+    _cpu.load(list(rom))
+    _ram_images = ram_images
+    _translate = translate
+
+
+def _run_one(index: int, input_value: int, ram_image: int, max_cycles: int) -> SweepResult:
+    cpu = _cpu
+    assert cpu is not None
+    cpu.reset(hard = True)
+    image = _ram_images[ram_image]
+    if image:
+        cpu.ram.write(0, image)
+    cpu.input(input_value)
+    fault = None
+    try:
+        cycles = headless.run(cpu, max_cycles, _translate)
+    except Exception as e:
+        # One bad grid point shouldn't stop the sweep.
+        cycles = -1
+        fault = f"{type(e).__name__}: {e}"
+    return SweepResult(index, input_value, ram_image, max_cycles, cpu.program_counter, bytes(cpu.registers),
+                       cpu.negative_flag, cpu.zero_flag, cpu.overflow_flag, cpu._halt_flag, cycles,
+                       bytes(cpu.display.digits), fault)
+
+
+def _run_chunk(chunk: list[tuple[int, int, int, int]]) -> list[SweepResult]:
+    return [_run_one(*run) for run in chunk]
+
+
+def grid(inputs: Iterable[int] = (0,), ram_images: int = 1, budgets: Iterable[int] = (headless.DEFAULT_MAX_CYCLES,)) -> Iterator[tuple[int, int, int, int]]:
+    """Every combination of input value, RAM image index and cycle budget, numbered."""
+    for index, (input_value, image, budget) in enumerate(itertools.product(inputs, range(ram_images), budgets)):
+        yield index, input_value, image, budget
+
+
+def sweep(rom: Sequence[int], inputs: Iterable[int] = (0,), ram_images: Sequence[bytes] = (b"",),
+          budgets: Iterable[int] = (headless.DEFAULT_MAX_CYCLES,), max_workers: int | None = None,
+          chunk_size: int = DEFAULT_CHUNK_SIZE, translate: bool = False) -> Iterator[SweepResult]:
+    """Run `rom` once for every combination of `inputs`, `ram_images` (preloaded from address 0,
+    empty for none) and `budgets`, across a process pool.
+
+    Results are yielded in grid order as they come back. Only a few chunks per worker are in
+    flight at once, so grids far bigger than memory are fine. A run that raises is recorded in its
+    result's `fault`, and the sweep carries on.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    runs = grid(inputs, len(ram_images), budgets)
+    with ProcessPoolExecutor(max_workers, initializer = _init_worker,
+                             initargs = (bytes(rom), [bytes(i) for i in ram_images], translate)) as executor:
+        pending: deque[Future[list[SweepResult]]] = deque()
+        while True:
+            while len(pending) < max_workers * 4:
+                chunk = list(itertools.islice(runs, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(_run_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
@@ -9,20 +9,36 @@ from pyglet.graphics import Batch
 
 import digicpu.data.fonts
 import digicpu.data.programs
+from digicpu.clock import faster, slower
 from digicpu.constants import (ACCENT_DARK_COLOR, ACCENT_LIGHT_COLOR, BG_COLOR,
                                BG_DARK_COLOR, BOX_COLOR, SCREEN_HEIGHT,
                                SCREEN_TITLE, SCREEN_WIDTH, TEXT_COLOR,
                                TEXT_DIM_COLOR)
 from digicpu.core.cpu import CPU
+from digicpu.emulator import Emulator, Frame, ThreadedEmulator
 from digicpu.lib.log import logger
+from digicpu.lib.screen import Screen
 from digicpu.lib.sevenseg import SevenSeg
 
 PROGRAM = "ramdom.asm"
+# How much of each frame the CPU gets to run in; the rest is left for drawing.
+CLOCK_BUDGET = 0.5
+
+
+def format_rate(hz: float | None) -> str:
+    if hz is None:
+        return "unthrottled"
+    for unit, scale in (("MHz", 1_000_000), ("kHz", 1_000)):
+        if hz >= scale:
+            return f"{hz / scale:g} {unit}"
+    return f"{hz:g} Hz"
+
 
 class DigiCPUWindow(arcade.Window):
-    def __init__(self, width, height, title, fps: float = 600.0):
+    def __init__(self, width, height, title, fps: float = 600.0, threaded: bool = False, screen: tuple[int, int] | None = None):
         super().__init__(width, height, title, update_rate = 1 / fps, draw_rate = 1 / fps)
         self.fps: float = fps
+        self.frame_time: float = 1 / fps
 
         self.now = arrow.now()
         self.sprite_list = arcade.SpriteList()
@@ -38,20 +54,38 @@ class DigiCPUWindow(arcade.Window):
             d.center_y = self.height * 0.75
             d.left = ((d.width / 11) * (n + 1)) + (d.width * (n + 1))
 
+        # A bitmap screen, between the ROM and RAM views, if asked for. Its pixels are `Frame.devices[self.screen_sample]`.
+        self.pixel_screen: Screen | None = None
+        self.screen_sample = 0
+        if screen is not None:
+            # Imported here, since it needs NumPy.
+            from digicpu.core.screen import Screen as ScreenDevice
+            device = ScreenDevice(*screen)
+            self.cpu.connect(device)
+            self.screen_sample = [d for d in self.cpu.bus.devices if d.lazy].index(device)
+            self.pixel_screen = Screen(*screen)
+            self.pixel_screen.scale = SCREEN_HEIGHT * 0.3 / max(screen)
+            self.pixel_screen.center_x = self.width / 2
+            self.pixel_screen.bottom = 10
+
         t = pkg_resources.read_text(digicpu.data.programs, PROGRAM)
         self.cpu.load_string(t)
+        # Keep an undo history, so LEFT can step backwards while paused.
+        self.cpu.start_journal()
 
-        self.tick: int = 0
-        self.tick_multiplier: int = 1
+        # From here on the CPU belongs to the emulator; the window only draws the frames it hands back.
+        self.emulator = ThreadedEmulator(self.cpu) if threaded else Emulator(self.cpu)
+        self.frame: Frame = self.emulator.poll(0)
 
         self.input_value: int = 0
+        self.sent_input_value: int = 0
         self.paused: bool = True
 
         self.text_batch: Batch = Batch()
 
         self.fps_text = arcade.Text(f"{self.fps} FPS", 5, self.height - 5, anchor_y = "top", batch = self.text_batch, font_name = "Fira Code", font_size = 8)
-        self.tick_text = arcade.Text(f"Tick {self.tick} | PAUSED", 5, self.fps_text.bottom, anchor_y = "top", batch=self.text_batch, font_name = "Fira Code", font_size = 8)
-        self.rate_text = arcade.Text(f"Tick Rate 1:{self.tick_multiplier}", 5, self.tick_text.bottom, anchor_y = "top", batch=self.text_batch, font_name = "Fira Code", font_size = 8)
+        self.tick_text = arcade.Text(f"Cycle {self.frame.cycles} | PAUSED", 5, self.fps_text.bottom, anchor_y = "top", batch=self.text_batch, font_name = "Fira Code", font_size = 8)
+        self.rate_text = arcade.Text(f"Clock {format_rate(self.emulator.rate)}", 5, self.tick_text.bottom, anchor_y = "top", batch=self.text_batch, font_name = "Fira Code", font_size = 8)
 
         self.busy_flag_text = arcade.Text("B", self.digits[0].left, self.digits[0].bottom - 5, font_size = 22, anchor_y = "top", font_name = "Fira Code", batch=self.text_batch, color = arcade.color.GRAY)
         self.negative_flag_text = arcade.Text("N", self.busy_flag_text.right + 5, self.digits[0].bottom - 5, font_size = 22, anchor_y = "top", font_name = "Fira Code", batch=self.text_batch, color = arcade.color.GRAY)
@@ -76,14 +110,23 @@ class DigiCPUWindow(arcade.Window):
 
         self.ram_doc = pyglet.text.document.FormattedDocument(ram)
         self.ram_doc.set_style(0, len(self.ram_doc.text), {"font_name": "Super Mario Bros. NES", "font_size": 12, "color": BG_DARK_COLOR, "align": "right"})
-        self.ram_text = pyglet.text.DocumentLabel(self.ram_doc, x = self.width - 5, y = 5, batch = self.text_batch, multiline = True, width = self.width, anchor_y = "bottom", anchor_x = "right")
+        # An incremental layout, so rewriting a byte only relays out its own line.
+        self.ram_text = pyglet.text.layout.IncrementalTextLayout(self.ram_doc, x = self.width - 5, y = 5, width = self.width, height = self.height, batch = self.text_batch, multiline = True, anchor_y = "bottom", anchor_x = "right")
+        self.ram_text.height = self.ram_text.content_height
 
         self.ram_bytes_used = set()
+        # The RAM byte and ROM span that are highlighted right now, so they can be put back.
+        self.ram_highlight: int | None = None
+        self.rom_highlight: range = range(0)
 
         self.last_real_rom_byte = 0xFF
         non_ops = [b for b in self.cpu.rom if b != 0]
         self.last_real_rom_byte = len(self.cpu.rom) - self.cpu.rom[::-1].index(non_ops[-1]) - 1
 
+        # NOP
+        idx = self.text_index(self.last_real_rom_byte + 1)
+        self.rom_doc.set_style(idx, len(self.rom_doc.text), {"color": BG_DARK_COLOR})
+
         self.instruction_doc = pyglet.text.document.FormattedDocument("NOP")
         self.instruction_doc.set_style(0, len(self.instruction_doc.text), {"font_name": "Super Mario Bros. NES", "font_size": 24, "color": TEXT_COLOR})
         self.instruction_text = pyglet.text.DocumentLabel(self.instruction_doc, 5, self.rom_text.top + 5, batch = self.text_batch)
@@ -95,25 +138,30 @@ class DigiCPUWindow(arcade.Window):
         self.box_rect = LRBT(self.digits[0].left - 10, self.digits[-1].right + 10, self.program_text.bottom - 5, self.registers_text.top + 5)
 
     def setup(self):
-        ...
+        self.emulator.start()
 
     def on_show(self) -> None:
         self.paused = False
+        self.emulator.set_paused(False)
+
+    def on_close(self):
+        self.emulator.stop()
+        super().on_close()
 
     def on_key_press(self, symbol, modifiers):
         if symbol == arcade.key.R:
-            self.cpu.reset(bool(modifiers & arcade.key.MOD_SHIFT))
-            self.tick = 0
+            self.emulator.reset(bool(modifiers & arcade.key.MOD_SHIFT))
         elif symbol == arcade.key.NUM_ADD or symbol == arcade.key.EQUAL:
-            new = max(self.tick_multiplier + 1, 1)
-            self.tick_multiplier = new
+            self.emulator.set_rate(faster(self.emulator.rate))
         elif symbol == arcade.key.NUM_SUBTRACT or symbol == arcade.key.MINUS:
-            new = max(self.tick_multiplier - 1, 1)
-            self.tick_multiplier = new
+            self.emulator.set_rate(slower(self.emulator.rate))
         elif symbol == arcade.key.SPACE:
             self.paused = not self.paused
+            self.emulator.set_paused(self.paused)
         elif symbol == arcade.key.RIGHT and self.paused:
-            self.run_tick()
+            self.emulator.step()
+        elif symbol == arcade.key.LEFT and self.paused:
+            self.emulator.step_back()
         elif symbol == arcade.key.GRAVE:
             with open("./dump.bin", "wb") as f:
                 f.write(bytes(self.cpu.rom))
@@ -153,104 +201,125 @@ class DigiCPUWindow(arcade.Window):
         elif symbol == arcade.key.COMMA:
             self.input_value -= 1
 
+    def text_index(self, byte: int) -> int:
+        """Where a byte's two hex digits start in the ROM or RAM document."""
+        return byte * 2 + byte // self.rom_text_width
+
+    def rom_color(self, byte: int):
+        return BG_DARK_COLOR if byte > self.last_real_rom_byte else TEXT_DIM_COLOR
+
+    def ram_color(self, byte: int):
+        if byte not in self.ram_bytes_used:
+            return BG_DARK_COLOR
+        elif byte == self.frame.ram_byte_changed:
+            return TEXT_COLOR
+        return TEXT_DIM_COLOR
+
     def update_rom_text(self):
-        self.rom_doc.set_style(0, len(self.rom_doc.text), {"color": TEXT_DIM_COLOR})
+        """Restyle only the parts of the ROM and RAM views that changed since the last frame.
 
-        # ROM
-        byte = self.cpu.program_counter - self.cpu._last_instruction_size
-        line = byte // self.rom_text_width
-        col = byte % self.rom_text_width
-        idx = (self.rom_text_width * 2 * line) + (col * 2)
-        span_width = self.cpu._last_instruction_size * 2
-        if (col + span_width) > (self.rom_text_width * 2):
-            span_width += 1
-        self.rom_doc.set_style(idx, idx + span_width, {"color": TEXT_COLOR})
+        All of a frame's RAM edits are batched into one update of its layout."""
+        frame = self.frame
 
-        # NOP
-        line = (self.last_real_rom_byte + 1) // self.rom_text_width
-        col = (self.last_real_rom_byte + 1) % self.rom_text_width
-        idx = (self.rom_text_width * 2 * line) + (col * 2)
-        self.rom_doc.set_style(idx, len(self.rom_doc.text), {"color": BG_DARK_COLOR})
+        # ROM
+        start = frame.program_counter - frame.last_instruction_size
+        span = range(max(start, 0), start + frame.last_instruction_size)
+        if span != self.rom_highlight:
+            for b in self.rom_highlight:
+                idx = self.text_index(b)
+                self.rom_doc.set_style(idx, idx + 2, {"color": self.rom_color(b)})
+            for b in span:
+                if b > self.last_real_rom_byte:
+                    break
+                idx = self.text_index(b)
+                self.rom_doc.set_style(idx, idx + 2, {"color": TEXT_COLOR})
+            self.rom_highlight = span
 
         # INSTRUCTION
-        self.instruction_doc.text = self.cpu._current_instruction_string
+        self.instruction_doc.text = frame.instruction
         self.instruction_doc.set_style(0, len(self.instruction_doc.text), {"color": TEXT_DIM_COLOR})
-        idx = self.instruction_doc.text.index(" ")
+        # Just the mnemonic. (There's no instruction at all before the first step.)
+        idx = len(self.instruction_doc.text.partition(" ")[0])
         self.instruction_doc.set_style(0, idx, {"color": TEXT_COLOR})
 
         # REGISTERS
         self.registers_doc.set_style(0, idx, {"color": TEXT_DIM_COLOR})
-        if self.cpu._register_changed is not None:
-            idx = self.cpu._register_changed * 3
+        if frame.register_changed is not None:
+            idx = frame.register_changed * 3
             self.registers_doc.set_style(idx, idx + 2, {"color": TEXT_COLOR})
 
         # RAM
-        ram = ""
-        for i, b in enumerate(self.cpu.ram.state):
-            ram += f"{b:02X}"
-            if i % self.rom_text_width == self.rom_text_width - 1:
-                ram += "\n"
-        ram = ram.rstrip("\n")
-        self.ram_text.text = ram
-        for b in self.cpu.ram.state:
-            if b not in self.ram_bytes_used:
-                self.ram_doc.set_style(b*2, b*2+2, {"color": BG_DARK_COLOR})
-            elif b == self.cpu._ram_byte_changed:
-                self.ram_doc.set_style(b*2, b*2+2, {"color": TEXT_COLOR})
-            else:
-                self.ram_doc.set_style(b*2, b*2+2, {"color": TEXT_DIM_COLOR})
+        if frame.ram_cleared:
+            # Show the cleared RAM, but as untouched rather than as written.
+            self.ram_bytes_used.clear()
+            dirty = set(range(len(frame.ram)))
+        else:
+            dirty = set(frame.dirty)
+        self.ram_bytes_used |= frame.dirty
+        restyle = dirty | {self.ram_highlight, frame.ram_byte_changed}
+        restyle.discard(None)
+        if restyle:
+            self.ram_text.begin_update()
+            for b in dirty:
+                idx = self.text_index(b)
+                self.ram_doc.delete_text(idx, idx + 2)
+                self.ram_doc.insert_text(idx, f"{frame.ram[b]:02X}")
+            for b in restyle:
+                idx = self.text_index(b)
+                self.ram_doc.set_style(idx, idx + 2, {"color": self.ram_color(b)})
+            self.ram_text.end_update()
+        self.ram_highlight = frame.ram_byte_changed
 
     def on_update(self, delta_time):
         self.fps = round(1 / delta_time)
         self.now = arrow.now()
 
-        self.rate_text.value = f"Tick Rate: 1:{self.tick_multiplier}"
-        self.tick_text.value = f"Tick: {self.tick}"
-        self.fps_text.value = f"FPS {self.fps}"
-        self.program_text.value = f"PC {self.cpu.program_counter:02X}"
-        self.registers_text.text = " ".join([f"{r:02X}" for r in self.cpu.registers])
-
-        self.busy_flag_text.color = ACCENT_LIGHT_COLOR if self.cpu.busy_flag else ACCENT_DARK_COLOR
-        self.negative_flag_text.color = ACCENT_LIGHT_COLOR if self.cpu.negative_flag else ACCENT_DARK_COLOR
-        self.zero_flag_text.color = ACCENT_LIGHT_COLOR if self.cpu.zero_flag else ACCENT_DARK_COLOR
-        self.overflow_flag_text.color = ACCENT_LIGHT_COLOR if self.cpu.overflow_flag else ACCENT_DARK_COLOR
+        if self.input_value != self.sent_input_value:
+            self.emulator.set_input(self.input_value)
+            self.sent_input_value = self.input_value
 
-        if self.paused:
-            self.tick_text.value = f"Tick: {self.tick} | PAUSED"
-            self.update_rom_text()
-            return
+        # Catch up on the time that actually passed, but only spend part of a frame doing it.
+        # (A threaded emulator ignores this and just hands back its latest frame.)
+        frame = self.emulator.poll(delta_time, budget = max(delta_time, self.frame_time) * CLOCK_BUDGET)
+        if frame.serial != self.frame.serial:
+            self.frame = frame
+            self.update_cpu_views()
 
-        self.run_tick()
-
-    def run_tick(self):
-        if not self.cpu._halt_flag:
-            self.tick += 1
-        if self.tick % self.tick_multiplier == 0:
-            self.cpu.input_register = self.input_value
-            if self.cpu.program_counter <= 255:
-                self.cpu.step()
-
-            for n, digit in enumerate(self.digits):
-                digit.set_bits(self.cpu.display.digits[n])
-
-            self.sprite_list.update()
-
-        self.ram_bytes_used.add(self.cpu._ram_byte_changed)
+        self.rate_text.value = f"Clock {format_rate(self.emulator.rate)}"
+        self.tick_text.value = f"Cycle {frame.cycles}" + (" | PAUSED" if self.paused else "")
+        self.fps_text.value = f"FPS {self.fps}"
+        self.program_text.value = f"PC {frame.program_counter:02X}"
+        self.registers_text.text = " ".join([f"{r:02X}" for r in frame.registers])
+
+        self.busy_flag_text.color = ACCENT_LIGHT_COLOR if frame.busy_flag else ACCENT_DARK_COLOR
+        self.negative_flag_text.color = ACCENT_LIGHT_COLOR if frame.negative_flag else ACCENT_DARK_COLOR
+        self.zero_flag_text.color = ACCENT_LIGHT_COLOR if frame.zero_flag else ACCENT_DARK_COLOR
+        self.overflow_flag_text.color = ACCENT_LIGHT_COLOR if frame.overflow_flag else ACCENT_DARK_COLOR
+
+    def update_cpu_views(self):
+        """Draw the latest frame into the display and the ROM/RAM views."""
+        for n, digit in enumerate(self.digits):
+            digit.set_bits(self.frame.display[n])
+        if self.pixel_screen is not None:
+            self.pixel_screen.set_pixels(self.frame.devices[self.screen_sample])
+        self.sprite_list.update()
         self.update_rom_text()
 
     def on_draw(self):
         self.clear(BG_COLOR)
         arcade.draw_rect_filled(self.box_rect, BOX_COLOR)
         self.sprite_list.draw()
+        if self.pixel_screen is not None:
+            self.pixel_screen.draw()
         self.text_batch.draw()
 
-def main():
+def main(threaded: bool = False, screen: tuple[int, int] | None = None):
     with pkg_resources.path(digicpu.data.fonts, "NES.ttf") as p:
         arcade.load_font(p)
     with pkg_resources.path(digicpu.data.fonts, "FIRACODE.ttf") as p:
         arcade.load_font(p)
 
     logger.setLevel(logging.INFO)
-    window = DigiCPUWindow(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
+    window = DigiCPUWindow(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, threaded = threaded, screen = screen)
     window.setup()
     arcade.run()
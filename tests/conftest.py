@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse = True)
+def _assembly_cache(tmp_path, monkeypatch):
+    """Keep the assembly cache out of the user's home directory."""
+    monkeypatch.setenv("DIGICPU_CACHE_DIR", str(tmp_path / "assembly"))
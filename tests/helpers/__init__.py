@@ -0,0 +1,72 @@
+"""Random programs and machine state, for checking the fast paths against `CPU.step`."""
+
+import importlib.resources as pkg_resources
+import random
+
+import digicpu.data.programs
+from digicpu.core.cpu import CPU
+from digicpu.core.opcode import OPCODES, Opcode, Operand
+from digicpu.lib.types import ROM_SIZE
+
+# PSH and POP aren't implemented, so they'd only ever fault.
+FUZZ_OPCODES = [o for o in OPCODES if o.assembly not in ("PSH", "POP")]
+# Registers that exist, registers that don't, and the I/O ports, so every path gets hit.
+REGISTER_CHOICES = (*range(15), 8, 9, 10, 11, 12)
+
+
+def bundled_programs() -> dict[str, str]:
+    """Every program that ships with DigiCPU, by filename."""
+    files = pkg_resources.files(digicpu.data.programs)
+    return {f.name: f.read_text() for f in files.iterdir() if f.name.endswith(".asm")}
+
+
+def random_rom(rng: random.Random, size: int = 220) -> list[int]:
+    """A program of random instructions, one after another, whose jumps all land on one of them."""
+    instructions: list[tuple[Opcode, int]] = []
+    address = 0
+    while address < size:
+        opcode = rng.choice(FUZZ_OPCODES)
+        # Mostly leave MOD out, since MOD by zero ends so many runs early.
+        if opcode.assembly == "MOD" and rng.random() < 0.5:
+            continue
+        instructions.append((opcode, address))
+        address += opcode.width
+    starts = [a for _, a in instructions]
+
+    rom: list[int] = []
+    for opcode, _ in instructions:
+        rom.append(opcode.value)
+        for kind in opcode.operands:
+            if kind is Operand.JUMP:
+                rom.append(rng.choice(starts))
+            elif kind is Operand.IMMEDIATE:
+                rom.append(rng.randrange(256))
+            else:
+                rom.append(rng.choice(REGISTER_CHOICES))
+    return rom[:ROM_SIZE]
+
+
+def state(cpu: CPU) -> tuple:
+    """Everything a run can change, including what the window shows about the last instruction."""
+    return (cpu.snapshot(), cpu._register_changed, cpu._ram_byte_changed, cpu._last_instruction_size,
+            cpu._current_instruction_string)
+
+
+def step_run(cpu: CPU, max_cycles: int) -> tuple[int, str | None]:
+    """Run `cpu` one `step()` at a time, like `headless.run` without any of its shortcuts.
+    Returns the cycles run, and the name of the error it stopped on, if any."""
+    cycles = 0
+    while cycles < max_cycles and not cpu._halt_flag and cpu.program_counter < ROM_SIZE:
+        try:
+            cpu.step()
+        except Exception as e:
+            return cycles, type(e).__name__
+        cycles += 1
+    return cycles, None
+
+
+def machine(rom: list[int], input_value: int = 0) -> CPU:
+    cpu = CPU()
+    cpu.load(rom)
+    cpu.input(input_value)
+    return cpu
@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from digicpu.core.assembler import assemble, assemble_program
+from digicpu.core.disassembler import disassemble
+from digicpu.core.opcode import OPCODES
+from digicpu.lib.errors import UnknownInstructionError
+from digicpu.lib.types import ROM_SIZE
+from tests.helpers import bundled_programs, random_rom
+
+PROGRAM = """CONST FIVE 5
+IMM FIVE GP1 # five
+LABEL LOOP
+INC GP1; JMP END +1
+LABEL END
+HLT
+HLT"""
+
+
+def _padded(rom: list[int]) -> bytes:
+    return bytes(rom).ljust(ROM_SIZE, b"\x00")
+
+
+def _token_at(source: str, line: int, column: int) -> str:
+    return source.splitlines()[line - 1][column - 1:].split()[0].rstrip(";")
+
+
+@pytest.mark.parametrize("name", sorted(bundled_programs()))
+def test_bundled_programs_round_trip(name):
+    rom = assemble(bundled_programs()[name], OPCODES)
+    for recursive in (True, False):
+        assert _padded(assemble(disassemble(rom, recursive), OPCODES)) == _padded(rom)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_programs_round_trip(seed):
+    rng = random.Random(seed)
+    for _ in range(20):
+        rom = random_rom(rng)
+        for recursive in (True, False):
+            assert _padded(assemble(disassemble(rom, recursive), OPCODES)) == _padded(rom)
+
+
+def test_assemble_matches_assemble_program():
+    for source in (PROGRAM, *bundled_programs().values()):
+        assert assemble(source, OPCODES) == assemble_program(source, OPCODES).rom
+
+
+def test_labels_constants_and_modifiers():
+    assembly = assemble_program(PROGRAM, OPCODES)
+    assert assembly.rom == [0x81, 5, 1, 0x68, 1, 0x71, 8, 0x07, 0x07]
+    assert assembly.labels == {"LOOP": 3, "END": 7}
+
+
+def test_source_map_points_at_each_byte():
+    assembly = assemble_program(PROGRAM, OPCODES)
+    assert sorted(assembly.source_map) == list(range(len(assembly.rom)))
+    tokens = [_token_at(PROGRAM, *assembly.source_map[offset]) for offset in range(len(assembly.rom))]
+    # A constant maps to where it's defined, and a label to where it's used.
+    assert tokens == ["IMM", "5", "GP1", "INC", "GP1", "JMP", "END", "HLT", "HLT"]
+
+
+def test_legacy_imm_writes_gp0():
+    assert assemble("IMM 5", OPCODES) == assemble("IMM 5 GP0", OPCODES)
+
+
+@pytest.mark.parametrize("source", ["FOO", "JMP NOWHERE", "IMM 5 GP1 +"])
+def test_unknown_instructions(source):
+    with pytest.raises(UnknownInstructionError):
+        assemble(source, OPCODES)
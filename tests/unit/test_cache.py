@@ -0,0 +1,59 @@
+import pytest
+
+from digicpu.core import cache
+from digicpu.core.assembler import assemble_program
+from digicpu.core.cpu import CPU
+from digicpu.core.opcode import OPCODES
+from digicpu.lib.errors import IntegerOverflowError
+from tests.helpers import bundled_programs
+
+
+@pytest.mark.parametrize("name", sorted(bundled_programs()))
+def test_round_trip(name, tmp_path):
+    source = bundled_programs()[name]
+    assembled = cache.assemble_cached(source, OPCODES, tmp_path)
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    assert cache.assemble_cached(source, OPCODES, tmp_path) == assembled == assemble_program(source, OPCODES)
+
+
+def test_hits_come_from_disk(tmp_path, monkeypatch):
+    cache.assemble_cached("IMM 5 GP1\nHLT", OPCODES, tmp_path)
+
+    def fail(*args):
+        raise AssertionError("assembled again")
+    monkeypatch.setattr(cache, "assemble_program", fail)
+    assert cache.assemble_cached("IMM 5 GP1\nHLT", OPCODES, tmp_path).rom == [0x81, 5, 1, 0x07]
+
+
+def test_key_covers_source_opcodes_and_assembler():
+    key = cache.key("HLT", OPCODES)
+    assert cache.key("HLT ", OPCODES) != key
+    assert cache.key("HLT", OPCODES[:-1]) != key
+    assert cache.ASSEMBLER_HASH
+
+
+def test_corrupt_entries_are_reassembled(tmp_path):
+    cache.assemble_cached("HLT", OPCODES, tmp_path)
+    (entry,) = tmp_path.glob("*.json")
+    entry.write_bytes(b"{not json")
+    assert cache.assemble_cached("HLT", OPCODES, tmp_path).rom == [0x07]
+
+
+def test_unencodable_roms_are_not_cached(tmp_path):
+    assert cache.assemble_cached("IMM 300 GP1", OPCODES, tmp_path).rom == [0x81, 300, 1]
+    assert not list(tmp_path.glob("*.json"))
+    with pytest.raises(IntegerOverflowError):
+        CPU().load_string("IMM 300 GP1")
+
+
+def test_eviction_keeps_under_limit(tmp_path, monkeypatch):
+    monkeypatch.setenv("DIGICPU_CACHE_SIZE", "2000")
+    for n in range(100):
+        cache.assemble_cached(f"IMM {n} GP1\nHLT", OPCODES, tmp_path)
+    assert 0 < sum(p.stat().st_size for p in tmp_path.glob("*.json")) <= 2000
+
+
+def test_turned_off(tmp_path, monkeypatch):
+    monkeypatch.setenv("DIGICPU_CACHE_DIR", "")
+    assert cache.cache_dir() is None
+    assert cache.assemble_cached("HLT", OPCODES).rom == [0x07]
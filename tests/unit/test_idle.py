@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from digicpu import headless
+from digicpu.core.cpu import CPU
+from digicpu.core.idle import LoopDetector
+from tests.helpers import bundled_programs, machine, random_rom, state, step_run
+
+
+def _run(cpu: CPU, max_cycles: int, **kwargs) -> tuple[int | None, str | None]:
+    try:
+        return headless.run(cpu, max_cycles, **kwargs), None
+    except Exception as e:
+        return None, type(e).__name__
+
+
+@pytest.mark.parametrize("translate", [False, True])
+@pytest.mark.parametrize("seed", range(10))
+def test_fast_forward_matches_step(seed, translate):
+    rng = random.Random(seed)
+    for trial in range(40):
+        rom = random_rom(rng)
+        max_cycles = rng.choice([100, 3_000, 20_000])
+        reference, fast = machine(rom, trial), machine(rom, trial)
+        cycles, error = step_run(reference, max_cycles)
+        assert _run(fast, max_cycles, translate = translate) == (None if error else cycles, error)
+        assert fast.snapshot() == reference.snapshot()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_detector_kept_across_calls(seed):
+    rng = random.Random(seed)
+    for trial in range(40):
+        rom = random_rom(rng)
+        reference, fast = machine(rom, trial), machine(rom, trial)
+        cycles, error = step_run(reference, 5_000)
+        if error:
+            continue
+        detector = LoopDetector()
+        ran = 0
+        while ran < 5_000 and not fast._halt_flag and fast.program_counter < 256:
+            ran += headless.run(fast, min(64, 5_000 - ran), detector = detector)
+        assert ran == cycles
+        assert fast.snapshot() == reference.snapshot()
+
+
+def test_spin_is_skipped():
+    source = "IMM 3 GP1\nLABEL SPIN\nINC GP2\nJMP SPIN"
+    reference, fast = CPU(), CPU()
+    reference.load_string(source)
+    fast.load_string(source)
+    detector = LoopDetector()
+    assert headless.run(fast, 1_000_003, detector = detector) == step_run(reference, 1_000_003)[0]
+    assert detector.looping
+    assert state(fast) == state(reference)
+
+
+@pytest.mark.parametrize("name", sorted(bundled_programs()))
+def test_new_input_ends_the_skip(name):
+    source = bundled_programs()[name]
+    reference, fast = CPU(), CPU()
+    reference.load_string(source)
+    fast.load_string(source)
+    detector = LoopDetector()
+    for value in (0, 5, 5, 200):
+        reference.input(value)
+        fast.input(value)
+        assert headless.run(fast, 50_000, detector = detector) == step_run(reference, 50_000)[0]
+        assert fast.snapshot() == reference.snapshot()
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from digicpu.core.cpu import CPU
+from tests.helpers import bundled_programs, machine, random_rom, step_run
+
+# Small, so going back crosses a lot of checkpoints.
+INTERVAL = 16
+
+
+def _history(cpu: CPU, max_cycles: int) -> list[bytes]:
+    """Step `cpu`, returning its snapshot before each instruction and after the last one."""
+    history = [cpu.snapshot()]
+    for _ in range(max_cycles):
+        if step_run(cpu, 1) != (1, None):
+            break
+        history.append(cpu.snapshot())
+    return history
+
+
+def _clean_runs(seed: int, max_cycles: int):
+    """Random programs with the journal on, and their history, for runs that don't fault."""
+    rng = random.Random(seed)
+    for trial in range(30):
+        rom = random_rom(rng)
+        if step_run(machine(rom, trial), max_cycles)[1] is not None:
+            continue
+        cpu = machine(rom, trial)
+        cpu.start_journal(interval = INTERVAL)
+        yield rng, cpu, _history(cpu, max_cycles)
+
+
+def _circle(depth: int = 65_536) -> CPU:
+    cpu = CPU()
+    cpu.load_string(bundled_programs()["circle.asm"])
+    cpu.start_journal(depth, INTERVAL)
+    return cpu
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_step_back_one_at_a_time(seed):
+    for _, cpu, history in _clean_runs(seed, 300):
+        for expected in reversed(history[:-1]):
+            assert cpu.step_back() == 1
+            assert cpu.snapshot() == expected
+        assert cpu.step_back() == 0
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_step_back_in_jumps(seed):
+    for rng, cpu, history in _clean_runs(seed, 500):
+        position = len(history) - 1
+        while position:
+            n = rng.randint(1, 60)
+            assert cpu.step_back(n) == min(n, position)
+            position -= min(n, position)
+            assert cpu.snapshot() == history[position]
+
+
+def test_stepping_again_after_going_back():
+    cpu = _circle()
+    history = _history(cpu, 1000)
+    cpu.step_back(400)
+    assert _history(cpu, 400) == history[-401:]
+
+
+def test_depth_limits_history():
+    cpu = _circle(depth = 100)
+    history = _history(cpu, 1000)
+    assert cpu.step_back(1000) == 100
+    assert cpu.snapshot() == history[-101]
+
+
+def test_run_back_to():
+    cpu = _circle()
+    _history(cpu, 500)
+    cpu.step_back(30)
+    target = cpu.snapshot()
+    pc = cpu.program_counter
+    # Run forward again, the same way, and then go back to the last time the counter was there.
+    history = _history(cpu, 30)
+    assert cpu.run_back_to(pc)
+    assert cpu.program_counter == pc
+    assert cpu.snapshot() in [target, *history]
+    assert not cpu.run_back_to(0xFF)
+
+
+def test_faulted_instruction_leaves_nothing_to_undo():
+    cpu = CPU()
+    cpu.load_string("IMM 1 GP1\nMOD GP1 GP0 GP2")
+    cpu.start_journal()
+    before = cpu.snapshot()
+    cpu.step()
+    with pytest.raises(ZeroDivisionError):
+        cpu.step()
+    assert cpu.step_back(5) == 1
+    assert cpu.snapshot() == before
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from digicpu.core import snapshot
+from digicpu.core.cpu import CPU
+from digicpu.lib.errors import InvalidSnapshotError
+from tests.helpers import bundled_programs, machine, random_rom, step_run
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_restore_then_run_matches(seed):
+    rng = random.Random(seed)
+    for trial in range(20):
+        rom = random_rom(rng)
+        cpu = machine(rom, trial)
+        step_run(cpu, rng.randrange(200))
+        blob = cpu.snapshot()
+        after = step_run(cpu, 300), cpu.snapshot()
+
+        restored = machine(rom)
+        restored.restore(blob)
+        assert restored.snapshot() == blob
+        assert (step_run(restored, 300), restored.snapshot()) == after
+
+
+def test_file_round_trip(tmp_path):
+    cpu = CPU()
+    cpu.load_string(bundled_programs()["circle.asm"])
+    step_run(cpu, 777)
+    cpu.save_snapshot(tmp_path / "state.snap")
+
+    restored = CPU()
+    restored.load_string(bundled_programs()["circle.asm"])
+    restored.load_snapshot(tmp_path / "state.snap")
+    assert restored.snapshot() == cpu.snapshot()
+    assert (restored.program_counter, restored.registers, restored.ram.state, restored.display.digits) == \
+        (cpu.program_counter, cpu.registers, cpu.ram.state, cpu.display.digits)
+
+
+def test_other_rom_is_refused():
+    cpu = CPU()
+    cpu.load_string("HLT")
+    blob = cpu.snapshot()
+    other = CPU()
+    other.load_string("NOP\nHLT")
+    with pytest.raises(InvalidSnapshotError):
+        other.restore(blob)
+    other.restore(blob, check_rom = False)
+    assert other.snapshot()[:-snapshot.HASH_SIZE] == blob[:-snapshot.HASH_SIZE]
+
+
+@pytest.mark.parametrize("blob", [b"", b"DCPU", b"XXXX" + bytes(snapshot.SNAPSHOT.size - 4)])
+def test_bad_snapshots(blob):
+    with pytest.raises(InvalidSnapshotError):
+        CPU().restore(blob)
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from digicpu.core import translator
+from digicpu.core.cpu import CPU
+from tests.helpers import bundled_programs, machine, random_rom, state, step_run
+
+# Run in several chunks, so blocks get entered and left part way through a program.
+BUDGETS = (1, 7, 50, 142, 300, 2000)
+
+
+def _translated_run(cpu: CPU, max_cycles: int) -> tuple[int | None, str | None]:
+    try:
+        return translator.run(cpu, max_cycles), None
+    except Exception as e:
+        # Like `step_run`, the count is lost with the error.
+        return None, type(e).__name__
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_programs_match_step(seed):
+    rng = random.Random(seed)
+    for trial in range(50):
+        rom = random_rom(rng)
+        reference, translated = machine(rom, trial), machine(rom, trial)
+        for budget in BUDGETS:
+            cycles, error = step_run(reference, budget)
+            assert _translated_run(translated, budget) == (None if error else cycles, error)
+            assert state(translated) == state(reference)
+            if error:
+                break
+
+
+@pytest.mark.parametrize("name", sorted(bundled_programs()))
+def test_bundled_programs_match_step(name):
+    source = bundled_programs()[name]
+    reference, translated = CPU(), CPU()
+    reference.load_string(source)
+    translated.load_string(source)
+    assert translator.run(translated, 20_000) == step_run(reference, 20_000)[0]
+    assert state(translated) == state(reference)
+
+
+def test_translations_are_cached_by_rom():
+    rom = random_rom(random.Random(0))
+    assert translator.translate(machine(rom)) is translator.translate(machine(rom))
+
+
+def test_cache_keeps_only_recent_programs():
+    rng = random.Random(1)
+    first = machine(random_rom(rng))
+    program = translator.translate(first)
+    for _ in range(translator.MAX_CACHED_PROGRAMS):
+        translator.translate(machine(random_rom(rng)))
+    assert len(translator._cache) <= translator.MAX_CACHED_PROGRAMS
+    assert translator.translate(first) is not program